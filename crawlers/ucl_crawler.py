@@ -1,23 +1,23 @@
-import toml
-import requests
-import json
 import os
+import sys
 
-SEASON = 2024
-URL = f'https://api.football-data.org/v4/competitions/CL/teams?season={SEASON}'
-SECRET_FILE = '../.streamlit/secrets.toml'
-OUTPUT_FILE = f'../data/ucl_{SEASON}/teams-football-data.json'
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from sportdrawer.ingest import ingest, load_token
+
+# kept for running from this directory, same as `python -m sportdrawer ingest --season 2023`
+# only seasons whose format.json is managed by ingest, data/ucl_2024 is hand-curated
+SEASONS = [2023]
+SECRET_FILE = os.path.join(ROOT, '.streamlit', 'secrets.toml')
 
 def main():
-    config = toml.load(SECRET_FILE)
-    token = config['football_data_key']
-    headers = {'X-Auth-Token': token}
-    response = requests.get(URL, headers=headers)
-    data = response.json()
-    if not os.path.exists(os.path.dirname(OUTPUT_FILE)):
-        os.makedirs(os.path.dirname(OUTPUT_FILE))
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
-    
+    results = ingest([('CL', season) for season in SEASONS],
+                     data_dir=os.path.join(ROOT, 'data'),
+                     cache_dir=os.path.join(ROOT, '.http_cache'),
+                     token=load_token(SECRET_FILE))
+    for result in results:
+        print(f"{result['season']}: {result['status']} {result.get('error', '')}")
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
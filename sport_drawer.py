@@ -1,9 +1,14 @@
 import streamlit as st
 import json
-import pandas as pd
+import os
 import random
-import copy
-from collections import Counter
+from sportdrawer import DrawEngine, load_competition
+from sportdrawer.book import load_book, book_path
+from sportdrawer.trace import format_event
+from sportdrawer.worker import SelectionWorker, ProbabilityWorker
+from sportdrawer.snapshot import teams_digest, encode_snapshot, decode_snapshot
+from sportdrawer.profiling import Profiler, METRICS_LOG_ENV
+from sportdrawer.assets import load_manifest, get_flag_url, UNKNOWN_FLAG_URL
 
 st.set_page_config(
     page_title='Champions League Drawer', 
@@ -25,290 +30,160 @@ st.title('🌟 UCL 2024 League Stage Drawer')
 st.write('This is a simulator of the UEFA Champions League 2024 league stage draw.')
 st.write('The rules are described in the [Official UEFA Procedure PDF](https://editorial.uefa.com/resources/0290-1bb9a5f345c8-ac0c4b16a6b3-1000/202425_league_phase_draw_procedure.pdf).')
 
-# Load teams data
-with open('./data/ucl_2024/teams.json', 'r', encoding='utf-8') as f:
-    teams_data = json.load(f)
-for idx, team in enumerate(teams_data):
-    teams_data[idx]['id'] = idx
-# Convert JSON to DataFrame
-teams_df = pd.DataFrame(teams_data)
-# convert json to id map
-teams_id_map = {idx: team for idx, team in enumerate(teams_data)}
-# Generate a map of team id to the number of teams of the same country
-country_counts = Counter(team['country'] for team in teams_data)
-team_country_counts = {team['id']: country_counts[team['country']] for team in teams_data}
+COMPETITIONS = {
+    'UCL 2024/25': './data/ucl_2024/teams.json',
+    'UCL 2023/24 teams': './data/ucl_2023/teams.json',
+}
+
+@st.cache_resource
+def get_competition(teams_file):
+    # teams and their indexes are loaded once per server process and shared read-only by every session
+    return load_competition(teams_file)
+
+@st.cache_resource
+def get_book(teams_file):
+    # opening book written by `python -m sportdrawer build-book` next to the teams file, None without one
+    return load_book(book_path(teams_file))
+
+# a draw shared by url starts on the competition it was taken on, before the selectbox reads the session
+if 'engine' not in st.session_state and 'draw' in st.query_params:
+    try:
+        shared_snapshot = decode_snapshot(st.query_params['draw'])
+        for name, teams_file in COMPETITIONS.items():
+            if teams_digest(get_competition(teams_file).teams_data) == shared_snapshot.get('teams'):
+                st.session_state['competition_name'] = name
+        st.session_state['pending_snapshot'] = shared_snapshot
+    except ValueError as e:
+        st.error(f'The shared draw can not be restored: {e}')
+
+competition_name = st.sidebar.selectbox('Competition', list(COMPETITIONS), key='competition_name', on_change=lambda: init_session())
+competition = get_competition(COMPETITIONS[competition_name])
+teams_data = competition.teams_data
+teams_id_map = competition.teams_id_map
+
+@st.cache_resource
+def get_asset_manifest():
+    # local thumbnails built by `python -m sportdrawer build-assets`, None falls back to the remote urls
+    return load_manifest('static')
+
+asset_manifest = get_asset_manifest()
+
+def logo_src(logo_url, size):
+    return asset_manifest.logo_url(logo_url, size) if asset_manifest is not None else logo_url
+
+def flag_src(country, size):
+    return asset_manifest.flag_url(country, size) if asset_manifest is not None else get_flag_url(country)
+
+def image_src(image_name):
+    return asset_manifest.image_path('static', image_name) if asset_manifest is not None else f'static/{image_name}'
+
+def stop_selection():
+    # wait for the cancelled search to return, so it never resets the status of a draw restored or replayed meanwhile
+    if 'selection_worker' in st.session_state:
+        worker = st.session_state.pop('selection_worker')
+        worker.cancel()
+        worker.join()
 
 def init_session():
-    st.session_state['draw_round'] = 0
-    st.session_state['drawn_team_ids'] = []
-    # every team is represented by an ascii character 0 to 35
-    # match state is compressed by sorting and concatenating all opponent pairs
-    st.session_state['cur_state'] = ''
-    # full state is a 36*8 matrix
-    # each row is the opponent state of a team
-    # 8 slots for home vs pot 1, away vs pot 1, home vs pot 2, away vs pot 2, ...
-    st.session_state['cur_full_state'] = convert_full_state(st.session_state['cur_state'])
-    st.session_state['cur_team'] = None
-    # available draw status: waiting_draw, drawing, waiting_select, selecting, waiting_next_pot, waiting_done, done
-    st.session_state['draw_status'] = 'waiting_draw'
-    st.session_state['selecting_logs'] = []
-    # newly selected team ids, for highlight them in the UI
-    st.session_state['newly_sel_team_ids'] = []
-    # whether no need to select, for skipping the selection process
-    st.session_state['no_need_to_select'] = False
-    st.toast('Ready to draw!', icon='📢')
-
-# logic methods
+    stop_selection()
+    # the engine holds the whole draw state, the session only keeps a reference to it
+    teams_file = COMPETITIONS[st.session_state['competition_name']]
+    # selection metrics of the session, also appended to the log file named by the environment on a server
+    profiler = Profiler(log_file=os.environ.get(METRICS_LOG_ENV))
+    st.session_state['engine'] = DrawEngine(get_competition(teams_file), solver='mrv', trace_level='full', book=get_book(teams_file),
+                                            profiler=profiler)
+    if 'pending_snapshot' in st.session_state:
+        restore_snapshot(st.session_state.pop('pending_snapshot'))
+    else:
+        st.toast('Ready to draw!', icon='📢')
+
+# snapshot methods, a draw is saved to the url or a file and restored from either
+
+def restore_snapshot(snapshot):
+    stop_selection()
+    try:
+        st.session_state['engine'].restore(snapshot)
+        st.toast('Draw restored!', icon='💾')
+    except (ValueError, KeyError) as e:
+        st.error(f'The draw can not be restored: {e}')
+
+def save_to_url():
+    st.query_params['draw'] = encode_snapshot(st.session_state['engine'].snapshot())
+    st.toast('Link to this draw is in the address bar!', icon='🔗')
+
+def upload_snapshot():
+    snapshot_file = st.session_state.get('snapshot_file')
+    if snapshot_file is None:
+        return
+    try:
+        restore_snapshot(json.load(snapshot_file))
+    except ValueError as e:
+        st.error(f'Invalid snapshot file: {e}')
+
+def replay_draw():
+    # the recorded draw is replayed up to the chosen number of drawn teams, without searching
+    stop_selection()
+    engine = st.session_state['engine']
+    engine.replay(list(engine.drawn_team_ids), engine.cur_state, upto=st.session_state['replay_upto'])
+    st.query_params.pop('draw', None)
+
+# logic methods, thin wrappers over the engine adding UI feedback
 
 def draw_new_team():
-    if st.session_state['draw_status'] != 'waiting_draw':
+    engine = st.session_state['engine']
+    cur_team = engine.draw_team()
+    if cur_team is None:
         return
-    st.session_state['draw_status'] = 'drawing'
-    cur_pot = st.session_state['draw_round'] // 9 + 1
-    
-    available_team_ids = [idx for idx in range(len(teams_data)) if idx not in st.session_state['drawn_team_ids'] and teams_data[idx]['pot'] == cur_pot]
-    drawn_team_id = random.choice(available_team_ids)
-    
-    st.session_state['drawn_team_ids'].append(drawn_team_id)
-    st.session_state['cur_team'] = teams_id_map[drawn_team_id]
-    st.session_state['newly_sel_team_ids'] = []
-    st.session_state['selecting_logs'] = []
-    # if len(st.session_state['drawn_team_ids']) == len(teams_data):
-    #     st.session_state['draw_status'] = 'waiting_done'
-    # elif len(st.session_state['cur_state']) == 8*len(teams_data):
-    #     st.session_state['draw_status'] = 'autoselect'
-    # else:
-    if st.session_state['cur_full_state'][drawn_team_id].count(-1) == 0:
-        st.session_state['no_need_to_select'] = True
+    if engine.no_need_to_select:
         st.toast('No need to select opponents!', icon='🤐')
-        if len(st.session_state['drawn_team_ids']) % 9 == 0:
-            if len(st.session_state['drawn_team_ids']) == len(teams_data):
-                st.session_state['draw_status'] = 'waiting_done'
-            else:
-                st.session_state['draw_status'] = 'waiting_next_pot'
-        else:
-            st.session_state['draw_round'] += 1
-            st.session_state['draw_status'] = 'waiting_draw'
-    else:
-        st.session_state['no_need_to_select'] = False
-        st.session_state['draw_status'] = 'waiting_select'
-    # print(f"draw status: {st.session_state['draw_status']}")
-    # print(f'len drawn team ids: {len(st.session_state["drawn_team_ids"])}')
-    if st.session_state['cur_team']['name'] == 'FC Bayern München':
+    if cur_team['name'] == 'FC Bayern München':
         st.toast("Mia san mia!", icon='❤️')
     else:
-        st.toast(f"{st.session_state['cur_team']['name']}!", icon='🎉')
-    
-def convert_full_state(state):
-    full_state = [([-1] * 8) for _ in range(len(teams_data))] 
-    state_chunks = [state[i:i+2] for i in range(0, len(state), 2)]
-    for chunk in state_chunks:
-        team_id1, team_id2 = chunk
-        team_id1 = ord(team_id1)
-        team_id2 = ord(team_id2)
-        pot1 = team_id1 // 9
-        pot2 = team_id2 // 9
-        # print(f'get team {team_id1} vs team {team_id2}')
-        # print(f'pot1: {pot1}, pot2: {pot2}')
-        full_state[team_id1][pot2 * 2] = team_id2
-        full_state[team_id2][pot1 * 2 + 1] = team_id1
-        # print(f'change full state row {team_id1} col {pot2 * 2} to {team_id2}')
-        # print(f'change full state row {team_id2} col {pot1 * 2 + 1} to {team_id1}')
-    return full_state
-
-def convert_compressed_state(full_state):
-    state_chunks = []
-    for team_id1, row in enumerate(full_state):
-        for idx, team_id2 in enumerate(row):
-            if team_id2 != -1:
-                if idx % 2 == 0:
-                    state_chunks.append(chr(team_id1) + chr(team_id2))
-                # else:
-                #     state_chunks.append(chr(team_id2) + chr(team_id1))
-    state_chunks = sorted(state_chunks)
-    return ''.join(state_chunks)
-
-def print_compressed_state(state):
-    return '-'.join([str(ord(char)) for char in state])
-
-def autofill_state(state):
-    full_state = convert_full_state(state)
-    for team_id, row in enumerate(full_state):
-        team_pot = teams_id_map[team_id]['pot'] - 1
-        team_country = teams_id_map[team_id]['country']
-        country_count = get_country_count_by_opponents(row)
-        invalid_countries = [country for country, count in country_count.items() if count >= 2]
-        invalid_countries.append(team_country)
-        for match_idx, opponent_id in enumerate(row):
-            if opponent_id == -1:
-                opponent_pot = match_idx // 2
-                is_home = match_idx % 2 == 0
-                available_team_ids = [i for i in range(len(teams_data)) if i not in row and i != team_id and teams_id_map[i]['pot'] == opponent_pot + 1 and teams_id_map[i]['country'] not in invalid_countries]
-                available_team_ids = [i for i in available_team_ids if full_state[i][team_pot * 2 + (1 if is_home else 0)] == -1]
-                for opponent_id in available_team_ids.copy():
-                    opponent_country_count = get_country_count_by_opponents(full_state[opponent_id])
-                    if team_country in opponent_country_count and opponent_country_count[team_country] >= 2:
-                        available_team_ids.remove(opponent_id)
-                if len(available_team_ids) == 0:
-                    add_log(f"Autofill: no available team for team {teams_id_map[team_id]['name']} at match {match_idx + 1}, go back")
-                    return None
-                elif len(available_team_ids) == 1:
-                    opponent_id = available_team_ids[0]
-                    full_state[team_id][match_idx] = opponent_id
-                    full_state[opponent_id][team_pot * 2 + (1 if is_home else 0)] = team_id
-                    add_log(f"Autofill: {teams_id_map[team_id]['name']} vs {teams_id_map[opponent_id]['name']} at match {match_idx + 1}")
-    return convert_compressed_state(full_state)
-
-def get_country_count_by_opponents(opponent_ids):
-    country_count = {}
-    for opponent_id in opponent_ids:
-        if opponent_id != -1:
-            country = teams_id_map[opponent_id]['country']
-            if country not in country_count:
-                country_count[country] = 1
-            else:
-                country_count[country] += 1
-    return country_count
-
-def gen_possible_state(cur_team, cur_state, match_idx, drawn_team_ids, shuffle=True):
-    # generate one possible combinations of opponents by dfs
-    # first generate a possible solution match by match, then repeat the whole routine for each other team
-    # to check if the solution is valid, we can check if the state is valid after all teams are processed
-    # return current state if the solution is valid, otherwise return None
-    
-    cur_id = cur_team['id']
-    cur_country = cur_team['country']
-    cur_team_pot = cur_team['pot'] - 1 # 0-based
-    cur_team_name = cur_team['name']
-    cur_full_state = convert_full_state(cur_state)
-    cur_team_opponents = cur_full_state[cur_id]
-    
-    if match_idx == 8:
-        # reach the last match
-        add_log(f"For team {cur_team_name} found possible opponents: {[teams_id_map[opponent]['name'] for opponent in cur_team_opponents]}")
-        # check next team for validity
-        max_country_count = 0
-        next_team_id = -1        
-        for i in range(len(teams_data)):
-            if i not in drawn_team_ids:
-                if team_country_counts[i] > max_country_count:
-                    max_country_count = team_country_counts[i]
-                    next_team_id = i
-        if next_team_id == -1:
-            # all teams are processed, solution is valid
-            add_log(f"Found valid solution!")
-            return cur_state
-        # at this point, we don't need to shuffle the order of teams in order to make full use of state caches
-        return gen_possible_state(teams_id_map[next_team_id], cur_state, 0, drawn_team_ids + [next_team_id], shuffle=True)
-    
-    add_log(f"Generating possible states for team {cur_team['name']} at match {match_idx + 1}")
-    add_log(f"Current team opponents: {[teams_id_map[opponent]['name'] if opponent != -1 else 'TBD' for opponent in cur_team_opponents]}")
-    if cur_team_opponents[match_idx] != -1:
-        return gen_possible_state(cur_team, cur_state, match_idx + 1, drawn_team_ids, shuffle=shuffle)
-    
-    country_count = get_country_count_by_opponents(cur_team_opponents)
-    invalid_countries = [country for country, count in country_count.items() if count == 2]
-    invalid_countries.append(cur_country)
-    match_pot = match_idx // 2
-    match_is_home = match_idx % 2 == 0
-    available_team_ids = [i for i in range(len(teams_data)) if i not in cur_team_opponents and i != cur_id and teams_id_map[i]['pot'] == match_pot + 1 and teams_id_map[i]['country'] not in invalid_countries]
-    available_team_ids = [i for i in available_team_ids if cur_full_state[i][cur_team_pot * 2 + (1 if match_is_home else 0)] == -1]
-    for opponent_id in available_team_ids.copy():
-        opponent_country_count = get_country_count_by_opponents(cur_full_state[opponent_id])
-        if cur_country in opponent_country_count and opponent_country_count[cur_country] >= 2:
-            available_team_ids.remove(opponent_id)
-    if shuffle:
-        random.shuffle(available_team_ids)
-    add_log(f"Available team ids: {available_team_ids}")
-    if len(available_team_ids) == 0:
-        add_log(f"No available team for team {cur_team['name']} at match {match_idx + 1}, go back")
-        return None
-    for opponent_id in available_team_ids:
-        add_log(f"Trying team {teams_id_map[opponent_id]['name']} at match {match_idx + 1}")
-        add_log(f'Its current opponents: {[teams_id_map[opponent]["name"] if opponent != -1 else "TBD" for opponent in cur_full_state[opponent_id]]}')
-        # if cur_full_state[opponent_id][cur_team_pot * 2 + (1 if match_is_home else 0)] == -1:
-        new_full_state = copy.deepcopy(cur_full_state)
-        new_full_state[cur_id][match_idx] = opponent_id
-        new_full_state[opponent_id][cur_team_pot * 2 + (1 if match_is_home else 0)] = cur_id
-        new_state = convert_compressed_state(new_full_state)
-        autofill_fail_flag = False
-        while True:
-            autofilled_state = autofill_state(new_state)
-            if autofilled_state is None:
-                add_log(f"Autofill reached a deadend for team {cur_team['name']} at match {match_idx + 1}, go back")
-                autofill_fail_flag = True
-                break
-            if autofilled_state == new_state:
-                break
-            new_state = autofilled_state
-        if autofill_fail_flag:
-            continue
-        result = gen_possible_state(cur_team, new_state, match_idx + 1, drawn_team_ids, shuffle=shuffle)
-        if result is not None:
-            return result
-        else:
-            continue
-    add_log(f"No valid team found for team {cur_team['name']} at match {match_idx + 1}, go back")
-    return None
-   
+        st.toast(f"{cur_team['name']}!", icon='🎉')
+
 def select_opponents():
-    cur_team = st.session_state['cur_team']
-    st.session_state['draw_status'] = 'selecting'
-    original_sel_team_ids = [idx for idx in st.session_state['cur_full_state'][cur_team['id']] if idx != -1]
-    
-    possible_states = []
-    choice_state = gen_possible_state(cur_team, st.session_state['cur_state'], 0, st.session_state['drawn_team_ids'])
-    if choice_state is None:
-        raise Exception('No possible state found!')
-    add_log(f"Choose state: {print_compressed_state(choice_state)}")
-    choice_full_state = convert_full_state(choice_state)
-    # choose only matches that are related to the current team
-    opponent_ids = choice_full_state[cur_team['id']]
-    # update current state by opponent ids
-    cur_full_state = st.session_state['cur_full_state']
-    for match_idx, opponent_id in enumerate(opponent_ids):
-        add_log(f"Final result: vs {teams_id_map[opponent_id]['name']} at match {match_idx + 1}")
-        is_home = match_idx % 2 == 0
-        cur_full_state[cur_team['id']][match_idx] = opponent_id
-        cur_full_state[opponent_id][teams_id_map[cur_team['id']]['pot'] * 2 - 2 + (1 if is_home else 0)] = cur_team['id']
-    st.session_state['cur_state'] = convert_compressed_state(cur_full_state)
-    
-    st.session_state['newly_sel_team_ids'] = [idx for idx in opponent_ids if idx not in original_sel_team_ids]
-        
-    if len(st.session_state['drawn_team_ids']) % 9 == 0:
-        if len(st.session_state['drawn_team_ids']) == len(teams_data):
-            st.session_state['draw_status'] = 'waiting_done'
+    engine = st.session_state['engine']
+    if engine.draw_status != 'waiting_select' or 'selection_worker' in st.session_state:
+        return
+    # the search runs on a worker thread, the page polls its progress until it is done
+    st.session_state['selection_worker'] = SelectionWorker(engine).start()
+
+def collect_selection():
+    # report a finished selection once, on the first rerun after the worker is done
+    worker = st.session_state.get('selection_worker')
+    if worker is None or worker.running:
+        return
+    del st.session_state['selection_worker']
+    engine = st.session_state['engine']
+    if worker.status == 'done':
+        if engine.cur_team['name'] == 'FC Bayern München':
+            st.toast("#ESMUELLERT", icon='2️⃣')
         else:
-            st.session_state['draw_status'] = 'waiting_next_pot'
-    else:
-        st.session_state['draw_round'] += 1
-        st.session_state['draw_status'] = 'waiting_draw'
-    
-    # print(f"draw status: {st.session_state['draw_status']}")
-    # print(f'len drawn team ids: {len(st.session_state["drawn_team_ids"])}')
-    
-    if cur_team['name'] == 'FC Bayern München':
-        st.toast("#ESMUELLERT", icon='2️⃣')
+            st.toast("Siuuuuu!!!", icon='7️⃣')
+    elif worker.status == 'timeout':
+        st.toast('Drawing opponents took too long, try again!', icon='⏱️')
+    elif worker.status == 'cancelled':
+        st.toast('Drawing opponents cancelled', icon='🛑')
     else:
-        st.toast("Siuuuuu!!!", icon='7️⃣')
-   
+        st.error(f'Drawing opponents failed: {worker.error}')
+
 def finish_draw():
-    st.session_state['draw_status'] = 'done'
-    st.balloons()  
-    
+    st.session_state['engine'].finish_draw()
+    st.balloons()
+
 def draw_next_pot():
-    st.session_state['draw_status'] = 'waiting_draw'
-    st.session_state['draw_round'] += 1
-    
+    st.session_state['engine'].draw_next_pot()
+
 # display methods
-    
-def add_log(log):
-    st.session_state['selecting_logs'].append(log)
-    
-def st_print_opponents_by_team_id(team_id, size='small', hide_header=False, transpose=False, highlight_ids=None):
+
+def get_side_labels():
+    return ['Home', 'Away'] if competition.matches_per_pot == 2 else ['Opponent']
+
+def st_print_opponents_by_team_id(team_id, size='small', hide_header=False, transpose=False, highlight_ids=None, probabilities=None):
     col_match_idx_map = {}
-    row_num = 3 if transpose else 5
-    col_num = 5 if transpose else 3
+    side_labels = get_side_labels()
+    row_num = len(side_labels) + 1 if transpose else competition.pot_num + 1
+    col_num = competition.pot_num + 1 if transpose else len(side_labels) + 1
     for row_idx in range(row_num):
         if hide_header and row_idx == 0:
             continue
@@ -318,34 +193,94 @@ def st_print_opponents_by_team_id(team_id, size='small', hide_header=False, tran
                 for col_idx in range(1, col_num):
                     cols[col_idx].write(f"Pot {col_idx}")
             else:
-                cols[1].write('Home')
-                cols[2].write('Away')
+                for col_idx, label in enumerate(side_labels):
+                    cols[col_idx + 1].write(label)
         else:
             for col_idx, col in enumerate(cols):
                 if col_idx == 0:
                     if transpose:
-                        col.write('Home' if row_idx == 1 else 'Away')
+                        col.write(side_labels[row_idx - 1])
                     else:
                         col.write(f"Pot {row_idx}")
                 else:
                     if transpose:
-                        col_match_idx_map[(col_idx-1) * 2 + row_idx - 1] = col
+                        col_match_idx_map[(col_idx-1) * len(side_labels) + row_idx - 1] = col
                     else:
-                        col_match_idx_map[(row_idx-1) * 2 + col_idx - 1] = col
+                        col_match_idx_map[(row_idx-1) * len(side_labels) + col_idx - 1] = col
     
     if highlight_ids is None:
         highlight_ids = []  
-    for match_idx, opponent_id in enumerate(st.session_state['cur_full_state'][team_id]):
+    for match_idx, opponent_id in enumerate(engine.cur_full_state[team_id]):
         with col_match_idx_map[match_idx]:
             st_display_team(opponent_id, size=size, highlight=opponent_id in highlight_ids, available=opponent_id != -1)
+            if probabilities is not None and opponent_id == -1:
+                st_print_probabilities(probabilities[match_idx])
+
+def st_print_probabilities(slot_probabilities, top_num=3):
+    top_probabilities = sorted(slot_probabilities.items(), key=lambda x: x[1], reverse=True)[:top_num]
+    st.caption('  \n'.join([f"{teams_id_map[opponent_id]['name']}: {prob:.0%}" for opponent_id, prob in top_probabilities]))
    
+@st.fragment(run_every=0.5)
+def st_selection_progress():
+    # only this fragment reruns while the worker searches, the whole page reruns once it is done
+    worker = st.session_state.get('selection_worker')
+    if worker is None:
+        return
+    if not worker.running:
+        st.rerun()
+    progress = worker.progress()
+    with st.spinner(f"Drawing opponents... {progress['elapsed']:.1f}s, {progress['nodes']} nodes explored, {progress['backtracks']} backtracks"):
+        st.button('Cancel', on_click=worker.cancel)
+
+def get_probability_worker(engine):
+    # one worker per drawn team and state, started on the first rerun that needs it
+    worker = st.session_state.get('probability_worker')
+    if worker is None or worker.key != (engine.cur_team['id'], engine.cur_state):
+        worker = ProbabilityWorker(engine).start()
+        st.session_state['probability_worker'] = worker
+    return worker
+
+@st.fragment(run_every=0.5)
+def st_probability_progress():
+    # the whole page reruns once the probabilities are ready
+    worker = st.session_state.get('probability_worker')
+    if worker is None or not worker.running:
+        st.rerun()
+    st.caption('Computing the chances of each opponent...')
+
+def st_print_trace(trace, page_size=50):
+    # summary events first, then the search steps one page at a time in a single block
+    for event in trace.get_events('summary'):
+        st.write(format_event(event, teams_id_map))
+    if not trace.full:
+        return
+    page_num = trace.page_num(page_size)
+    page_idx = st.number_input(f'Search steps, page 1 to {page_num}', min_value=1, max_value=page_num, value=1) - 1
+    if trace.dropped_num > 0:
+        st.caption(f'The earliest {trace.dropped_num} steps are dropped')
+    st.code('\n'.join([format_event(event, teams_id_map) for event in trace.page(page_idx, page_size)]), language=None)
+
+def st_print_metrics(profiler, row_num=10):
+    # the latest selections first, profiled functions of the last profiled one below
+    metrics = list(profiler.metrics)[::-1][:row_num]
+    if not metrics:
+        st.caption('No selection yet')
+    else:
+        st.dataframe([{'team': teams_id_map[selection['team_id']]['name'], **{key: value for key, value in selection.items() if key not in ['time', 'team_id', 'profile']}}
+                      for selection in metrics], hide_index=True)
+    profiler.cprofile = st.toggle('Profile selections with cProfile', value=profiler.cprofile)
+    profiled = next((selection for selection in metrics if 'profile' in selection), None)
+    if profiled is not None:
+        st.dataframe(profiled['profile'], hide_index=True)
+
 def get_team_logo_html(logo_url, height=100, width=None, alt='logo', inline=False):
+    src = logo_src(logo_url, height)
     if width is None:
         width = 'auto' # this will create a centered effect
     else:
         width = f'{width}px'
     height = f'{height}px'
-    img_core = f'<img src="{logo_url}" alt={alt} width="100%" height="100%" style="object-fit:contain">'
+    img_core = f'<img src="{src}" alt={alt} width="100%" height="100%" style="object-fit:contain">'
     if inline:
         return f'''<span style="width:{width};height:{height}">
                 {img_core}
@@ -356,44 +291,15 @@ def get_team_logo_html(logo_url, height=100, width=None, alt='logo', inline=Fals
             </div>'''
     
 def get_country_flag_html(country, size=15):
-    NATION_CODE_MAP = {
-        'ENG': 'gb-eng',
-        'SCO': 'gb-sct',
-        'GER': 'de',
-        'ESP': 'es',
-        'ITA': 'it',
-        'FRA': 'fr',
-        'POR': 'pt',
-        'NED': 'nl',
-        'BEL': 'be',
-        'UKR': 'ua',
-        'AUT': 'at',
-        'SUI': 'ch',
-        'CZE': 'cz',
-        'CRO': 'hr',
-        'SRB': 'rs',
-        'SVK': 'sk',
-    }
-    if country not in NATION_CODE_MAP:
-        url = 'https://hatscripts.github.io/circle-flags/flags/xx.svg'
-    # elif country in ['ESP']:
-    #     url = f'https://flagicons.lipis.dev/flags/4x3/{NATION_CODE_MAP[country]}.svg'
-    else:
-        url = f'https://flagicons.lipis.dev/flags/4x3/{NATION_CODE_MAP[country]}.svg'
-    # return f'''
-    # <div style="width: {size}px; height: {size}px; border-radius: 100%; overflow: hidden; display: inline-flex; margin: 2px; box-shadow: 0 0 0 2px rgba(0, 0, 0, .08);">
-    #     <img src="{url}" alt="{country}" style="width: 100%; height: 100%; object-fit: cover; object-position: center;" />
-    # </div>
-    # '''
     return f'''
     <div style="width: {size*4/3}px; height: {size}px; display: inline-flex; margin: 2px; box-shadow: 0 0 0 2px rgba(0, 0, 0, .08);">
-        <img src="{url}" alt="{country}" style="width: 100%; height: 100%; object-fit: cover; object-position: center;" />
+        <img src="{flag_src(country, size)}" alt="{country}" style="width: 100%; height: 100%; object-fit: cover; object-position: center;" />
     </div>
     '''
     
 def st_display_team(team_id, size='big', available=True, highlight=False):
     if team_id == -1:
-        team = {'name': 'TBD', 'logo': 'https://hatscripts.github.io/circle-flags/flags/xx.svg', 'country': 'XX'}
+        team = {'name': 'TBD', 'logo': UNKNOWN_FLAG_URL, 'country': 'XX'}
     else:
         team = teams_id_map[team_id]
     
@@ -427,17 +333,94 @@ def st_display_team(team_id, size='big', available=True, highlight=False):
                         background-color: {'rgba(0,106,255,0.2)' if highlight else 'auto'}
                     ">{core_html}</div>""")
 
+STATUS_BOARD_STYLE = '''<style>
+    .status-board {width: 100%; border-collapse: collapse; table-layout: fixed}
+    .status-board th, .status-board td {border: 1px solid rgba(128,128,128,0.2); padding: 4px; font-size: 0.85em}
+    .status-board th {text-align: center; font-weight: normal}
+    .status-board td div {display: flex; align-items: center; gap: 6px}
+    .status-board td img {width: 24px; height: 24px; object-fit: contain; flex-shrink: 0}
+    .status-board .team-cell img {width: 40px; height: 40px}
+</style>'''
+
+@st.cache_data
+def get_team_cell_html(competition_key, team_id):
+    # competition_key only keys the cache, team ids of different competitions overlap
+    team = teams_id_map[team_id]
+    return f'''<td class="team-cell"><div>
+            <img src="{logo_src(team['logo'], 40)}" alt="{team['name']}">
+            <span><b>{team['name']}</b><br/>{get_country_flag_html(team['country'], size=10)}{'🏆'*team.get('champions', 0)}</span>
+        </div></td>'''
+
+@st.cache_data(max_entries=4096)
+def get_status_row_html(competition_key, team_id, opponent_ids, highlight_match_idxs):
+    # a row only depends on its own fixtures, so rows untouched by the last selection are served from the cache across reruns and sessions
+    cells = [get_team_cell_html(competition_key, team_id)]
+    for match_idx, opponent_id in enumerate(opponent_ids):
+        if opponent_id == -1:
+            cells.append('<td style="opacity:0.5"><div>TBD</div></td>')
+            continue
+        opponent = teams_id_map[opponent_id]
+        background = 'rgba(0,106,255,0.2)' if match_idx in highlight_match_idxs else 'transparent'
+        cells.append(f'''<td style="background-color:{background}"><div>
+                <img src="{logo_src(opponent['logo'], 24)}" alt="{opponent['name']}"><span>{opponent['name']}</span>
+            </div></td>''')
+    return f"<tr>{''.join(cells)}</tr>"
+
+def get_highlight_match_idxs(team_id, opponent_ids, cur_team_id, newly_sel_team_ids):
+    # the slots filled by the last selection, on the row of the drawn team and on the rows of its new opponents
+    if team_id == cur_team_id:
+        return tuple(idx for idx, opponent_id in enumerate(opponent_ids) if opponent_id in newly_sel_team_ids)
+    if team_id in newly_sel_team_ids:
+        return tuple(idx for idx, opponent_id in enumerate(opponent_ids) if opponent_id == cur_team_id)
+    return ()
+
+def get_status_board_html(pot, full_state, cur_team_id, newly_sel_team_ids):
+    side_labels = get_side_labels()
+    header = '<tr><th rowspan="2" style="width:20%">Team</th>' + ''.join(f'<th colspan="{len(side_labels)}">Pot {i+1}</th>' for i in range(competition.pot_num)) + '</tr>'
+    header += '<tr>' + ''.join(f'<th>{label}</th>' for label in side_labels) * competition.pot_num + '</tr>'
+    rows = []
+    for team_id in competition.pot_team_ids(pot):
+        opponent_ids = tuple(full_state[team_id])
+        highlight_match_idxs = get_highlight_match_idxs(team_id, opponent_ids, cur_team_id, newly_sel_team_ids)
+        rows.append(get_status_row_html(competition.key, team_id, opponent_ids, highlight_match_idxs))
+    return f"{STATUS_BOARD_STYLE}<table class='status-board'><thead>{header}</thead><tbody>{''.join(rows)}</tbody></table>"
+
+@st.fragment
+def st_status_board():
+    # one HTML table per pot instead of a container per team and fixture
+    engine = st.session_state['engine']
+    cur_team_id = engine.cur_team['id'] if engine.cur_team else None
+    newly_sel_team_ids = frozenset(engine.newly_sel_team_ids)
+    result_pot_tabs = st.tabs([f'Pot {i+1}' for i in range(competition.pot_num)])
+    for pot, tab in enumerate(result_pot_tabs):
+        with tab:
+            st.html(get_status_board_html(pot + 1, engine.cur_full_state, cur_team_id, newly_sel_team_ids))
+
 # init
-if 'draw_round' not in st.session_state:
+if 'engine' not in st.session_state:
     init_session()
+engine = st.session_state['engine']
+collect_selection()
+
+with st.sidebar:
+    st.subheader('Save and replay')
+    # a snapshot reseeds the rng, never take one while a selection is searching with it
+    selecting = 'selection_worker' in st.session_state
+    st.button('Save to URL', on_click=save_to_url, disabled=selecting)
+    if not selecting:
+        st.download_button('Download snapshot', json.dumps(engine.snapshot()), file_name='draw_snapshot.json', mime='application/json')
+    st.file_uploader('Restore snapshot', type='json', key='snapshot_file', on_change=upload_snapshot)
+    if engine.drawn_team_ids:
+        st.number_input('Drawn teams', min_value=0, max_value=len(engine.drawn_team_ids), value=len(engine.drawn_team_ids), key='replay_upto')
+        st.button('Replay', on_click=replay_draw, disabled=selecting)
     
 # teams
 st.header('⚽ Meet the teams')
 with st.container():
-    team_pot_tabs = st.tabs([f'Pot {i+1}' for i in range(4)])
+    team_pot_tabs = st.tabs([f'Pot {i+1}' for i in range(competition.pot_num)])
     for pot, tab in enumerate(team_pot_tabs):
         with tab:
-            pot_teams = [team for team in teams_data if team['pot'] == pot + 1]
+            pot_teams = [teams_id_map[team_id] for team_id in competition.pot_team_ids(pot + 1)]
             for row_idx in range(0, len(pot_teams), 3):
                 row_teams = pot_teams[row_idx:row_idx+3]
                 columns = st.columns(3)
@@ -447,36 +430,36 @@ with st.container():
             
 
 # draw
-if st.session_state['draw_status'] != 'done':
+if engine.draw_status != 'done':
     st.header('🎲 Draw now!')
     
-    if st.session_state['draw_status'] == 'waiting_done':
+    if engine.draw_status == 'waiting_done':
         st.button('Finish!', on_click=finish_draw, type='primary')
-    if st.session_state['draw_status'] == 'waiting_next_pot':
+    if engine.draw_status == 'waiting_next_pot':
         st.button('Next pot', on_click=draw_next_pot, type='primary')
     
     draw_col, sel_col = st.columns([1, 1], gap='medium')
-    cur_pot = st.session_state['draw_round'] // 9 + 1
-    cur_pot_team_ids = [team['id'] for team in teams_data if team['pot'] == cur_pot]
-    available_team_ids = [idx for idx in cur_pot_team_ids if idx not in st.session_state['drawn_team_ids']]
+    cur_pot = engine.cur_pot
+    cur_pot_team_ids = competition.pot_team_ids(cur_pot)
+    available_team_ids = [idx for idx in cur_pot_team_ids if idx not in engine.drawn_team_ids]
     
     with draw_col:
-        btn_title = f"Draw #{st.session_state['draw_round'] % 9 + 1} from Pot {cur_pot}"
-        if st.session_state['draw_status'] == 'drawing':
+        btn_title = f"Draw #{engine.draw_round % competition.pot_size + 1} from Pot {cur_pot}"
+        if engine.draw_status == 'drawing':
             btn_title = 'Drawing...'
-        elif st.session_state['draw_status'] == 'waiting_done':
+        elif engine.draw_status == 'waiting_done':
             btn_title = 'All teams are drawn!'
-        elif st.session_state['draw_status'] == 'waiting_next_pot':
+        elif engine.draw_status == 'waiting_next_pot':
             btn_title = f'All teams from Pot {cur_pot} are drawn!'
             
         st.button(btn_title, 
             type='primary',
-            disabled=st.session_state['draw_status'] != 'waiting_draw',
+            disabled=engine.draw_status != 'waiting_draw',
             on_click=draw_new_team)
-        if st.session_state['cur_team'] and st.session_state['draw_status'] not in ['drawing'] \
-                and len(available_team_ids) < 9:
-            st.write(f"**{st.session_state['cur_team']['name']}** is drawn!")
-            st_display_team(st.session_state['cur_team']['id'], highlight=True)
+        if engine.cur_team and engine.draw_status not in ['drawing'] \
+                and len(available_team_ids) < competition.pot_size:
+            st.write(f"**{engine.cur_team['name']}** is drawn!")
+            st_display_team(engine.cur_team['id'], highlight=True)
         st.write(f'**Teams from Pot {cur_pot}:**')
         for row_idx in range(0, len(cur_pot_team_ids), 3):
             row_team_ids = cur_pot_team_ids[row_idx:row_idx+3]
@@ -484,54 +467,51 @@ if st.session_state['draw_status'] != 'done':
             for col_idx, team_id in enumerate(row_team_ids):
                 with columns[col_idx]:
                     st_display_team(team_id, size='small', available=team_id in available_team_ids,)
-                                    # highlight=team_id == st.session_state['cur_team']['id'] if st.session_state['cur_team'] else False)
+                                    # highlight=team_id == engine.cur_team['id'] if engine.cur_team else False)
 
     with sel_col:
         # see if we need to select opponents
         st.button('Draw opponents',
             type='primary',
-            disabled=st.session_state['draw_status'] != 'waiting_select',
+            disabled=engine.draw_status != 'waiting_select' or 'selection_worker' in st.session_state,
             on_click=select_opponents)
-        if st.session_state['cur_team'] and st.session_state['draw_status'] not in ['drawing'] and len(available_team_ids) < 9:            
-            if st.session_state['draw_status'] == 'selecting':
-                with st.spinner('Drawing opponents...'):
-                    while True:
-                        pass
-            if st.session_state['draw_status'] in ['waiting_draw', 'waiting_next_pot', 'waiting_done']:
-                st.write(f'Opponents for **{st.session_state["cur_team"]["name"]}** are drawn!')
-                if st.session_state['no_need_to_select']:
+        if engine.cur_team and engine.draw_status not in ['drawing'] and len(available_team_ids) < competition.pot_size:            
+            if 'selection_worker' in st.session_state:
+                st_selection_progress()
+            if engine.draw_status in ['waiting_draw', 'waiting_next_pot', 'waiting_done']:
+                st.write(f'Opponents for **{engine.cur_team["name"]}** are drawn!')
+                if engine.no_need_to_select:
                     image_name = random.choice(SAD_IMAGES)
-                elif st.session_state['cur_team']['name'] == 'FC Bayern München':
+                elif engine.cur_team['name'] == 'FC Bayern München':
                     image_name = random.choice(MUELLER_IMAGES)
                 else:
                     image_name = random.choice(SIU_IMAGES)
-                st.image(f'static/{image_name}')
-            st.write(f"**Fixtures for {st.session_state['cur_team']['name']}**:")
-            st_print_opponents_by_team_id(st.session_state['cur_team']['id'], highlight_ids=st.session_state['newly_sel_team_ids'])
+                st.image(image_src(image_name))
+            st.write(f"**Fixtures for {engine.cur_team['name']}**:")
+            probabilities = None
+            if engine.draw_status == 'waiting_select':
+                # exact late in the draw, estimated by sampling within about a second early on, cached per state
+                # computed on a worker so the page never waits for it
+                probability_worker = get_probability_worker(engine)
+                if probability_worker.running:
+                    st_probability_progress()
+                elif probability_worker.status == 'done':
+                    probabilities, exact = probability_worker.result
+                    st.caption('Chances of each opponent' + ('' if exact else ' (estimated)'))
+            st_print_opponents_by_team_id(engine.cur_team['id'], highlight_ids=engine.newly_sel_team_ids, probabilities=probabilities)
             
-            if st.session_state['draw_status'] != 'waiting_select':
-                with st.status('Loading drawing logs...'):
-                    for log in st.session_state['selecting_logs']:
-                        st.write(log)
+            if engine.draw_status != 'waiting_select':
+                with st.status('Drawing logs'):
+                    st_print_trace(engine.trace)
                         
                 
-if st.session_state['draw_status'] == 'done':
+if engine.draw_status == 'done':
     st.header('🏆 Draw result!')
 else:
     st.header('📺 Current status')
 with st.container():
     # st.subheader('By pot')
-    result_pot_tabs = st.tabs([f'Pot {i+1}' for i in range(4)])
-    for pot, tab in enumerate(result_pot_tabs):
-        with tab:
-            pot_teams = [team for team in teams_data if team['pot'] == pot + 1]
-            for team in pot_teams:
-                team_col, opponents_col = st.columns([1, 3], vertical_alignment='center', gap='medium')
-                with team_col:
-                    st_display_team(team['id'], size='big')
-                with opponents_col:
-                    st_print_opponents_by_team_id(team['id'], hide_header=False, transpose=True)
-                st.write('---')
+    st_status_board()
     
     # st.subheader('By team')
     # sorted_teams_data = sorted(teams_data, key=lambda x: x['name'])
@@ -540,4 +520,7 @@ with st.container():
     # st.write(f"**Opponents for {sel_team['name']}:**")
     # st_print_opponents_by_team_id(sel_team['id'], size='big')
     
+with st.expander('Solver metrics'):
+    st_print_metrics(engine.profiler)
+
 st.button('Restart', on_click=init_session, type='primary')
\ No newline at end of file
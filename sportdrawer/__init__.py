@@ -0,0 +1,3 @@
+from .engine import DrawEngine
+from .competition import Competition, load_competition, load_teams
+from .book import OpeningBook, build_book, load_book
@@ -0,0 +1,303 @@
+import argparse
+import sys
+import time
+from .engine import DrawEngine, SOLVERS
+from .simulate import simulate, DEFAULT_TEAMS_FILE
+from .results import DrawWriter, load_draws
+from .competition import load_competition, load_teams
+from .assets import build_assets
+from .book import build_book, save_book, book_path, DEFAULT_BOOK_SLOTS
+from .parallel import ParallelSearch
+from .snapshot import check_snapshot, encode_snapshot, load_snapshot, save_snapshot
+from . import ingest
+from . import bench
+from . import profiling
+from . import validate
+from . import api
+
+def run_simulate(args):
+    start_time = time.perf_counter()
+    writer = None
+    on_draw = None
+    if args.draws_file is not None:
+        engine = DrawEngine(args.teams)
+        writer = DrawWriter(args.draws_file, len(engine.teams_data), engine.team_index.slot_num)
+        on_draw = lambda draw_idx, state: writer.write(draw_idx, engine.convert_full_state(state))
+
+    def on_progress(finished_num, elapsed):
+        print(f'{finished_num}/{args.n} draws, {finished_num / elapsed:.1f} draws/s', file=sys.stderr)
+
+    try:
+        stats = simulate(args.teams, args.n, seed=args.seed, workers=args.workers, solver=args.solver, output=args.output,
+                         on_draw=on_draw, on_progress=on_progress)
+    finally:
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - start_time
+    print(f'{stats.draw_num} draws in {elapsed:.1f}s ({stats.draw_num / elapsed:.1f} draws/s)')
+    print('Most frequent pairings:')
+    for name1, name2, freq in stats.top_pairs():
+        print(f'  {name1} vs {name2}: {freq:.2%}')
+    if args.output is not None:
+        print(f'Pairing and slot counts written to {args.output}')
+    if args.draws_file is not None:
+        print(f'Draws appended to {args.draws_file}')
+
+def run_bench(args):
+    competition = load_competition(args.teams)
+    scenarios = bench.load_scenarios(args.scenarios) if args.scenarios else bench.default_scenarios(competition)
+
+    def on_run(run):
+        print(f"{run['scenario']:<32} {run['solver']:<4} {run['wall_time']:7.3f}s {run['nodes']:>8} nodes {run['backtracks']:>8} backtracks"
+              f"{' TIMEOUT' if run['timeout'] else ''}")
+
+    parallel = ParallelSearch(competition, workers=args.parallel) if args.parallel else None
+    try:
+        result = bench.run_bench(competition, scenarios, args.solver, repeat=args.repeat, timeout=args.timeout, on_run=on_run, parallel=parallel)
+    finally:
+        if parallel is not None:
+            parallel.close()
+    if args.output is not None:
+        bench.save_json(result, args.output)
+        print(f'Benchmark results written to {args.output}')
+
+def run_find_hard(args):
+    competition = load_competition(args.teams)
+
+    def on_scenario(scenario):
+        print(f"{scenario['name']:<40} {scenario['backtracks']:>8} backtracks{' TIMEOUT' if scenario['timeout'] else ''}")
+
+    scenarios = bench.find_hard_scenarios(competition, sample_num=args.samples, top_num=args.top, solver=args.solver,
+                                          capture_from=args.capture_from, timeout=args.timeout, on_scenario=on_scenario)
+    bench.save_json(scenarios, args.output)
+    print(f'{len(scenarios)} hardest scenarios written to {args.output}')
+
+def run_build_book(args):
+    competition = load_competition(args.teams)
+    start_time = time.perf_counter()
+    team_num = competition.pot_size
+    book = build_book(competition, max_slots=args.slots,
+                      on_team=lambda team_idx, size: print(f'{team_idx + 1}/{team_num} teams of pot 1, {size} entries'))
+    output = args.output if args.output is not None else book_path(args.teams)
+    save_book(book, output)
+    print(f'{len(book)} entries up to {args.slots} slots of the first selection in {time.perf_counter() - start_time:.1f}s, written to {output}')
+
+def run_ingest(args):
+    token = args.token if args.token is not None else ingest.load_token()
+    if token is None and not args.offline:
+        print(f'No api token, set {ingest.TOKEN_ENV} or football_data_key in {ingest.SECRET_FILE}')
+
+    def on_result(result):
+        target = f"{result['competition']} {result['season']}"
+        if result['status'] == 'failed':
+            print(f"{target}: failed, {result['error']}")
+        else:
+            print(f"{target}: {result['fetch']}, {result['team_num']} teams {result['status']} in {result['teams_file']}")
+
+    results = ingest.ingest([(args.competition, season) for season in args.season], data_dir=args.data, cache_dir=args.cache,
+                            base_url=args.base_url, token=token, workers=args.workers, offline=args.offline, on_result=on_result)
+    failed_num = sum(result['status'] == 'failed' for result in results)
+    print(f'{len(results) - failed_num} of {len(results)} seasons ingested')
+
+def run_replay(args):
+    snapshot = load_snapshot(args.snapshot)
+    engine = DrawEngine(args.teams, seed=snapshot['seed'], solver=snapshot['solver'])
+    if args.upto is None:
+        engine.restore(snapshot)
+    else:
+        # the recorded opponents are taken as they are, without searching
+        check_snapshot(snapshot, engine.teams_data)
+        engine.replay(snapshot['drawn'], engine.parse_compressed_state(snapshot['state']), upto=args.upto)
+    if args.finish:
+        engine.run_full_draw()
+    print(f'{len(engine.drawn_team_ids)} of {len(engine.teams_data)} teams drawn, {engine.draw_status}')
+    if engine.cur_team is not None:
+        opponent_names = [engine.teams_id_map[idx]['name'] if idx != -1 else '-' for idx in engine.cur_full_state[engine.cur_team['id']]]
+        print(f"{engine.cur_team['name']}: {', '.join(opponent_names)}")
+    snapshot = engine.snapshot()
+    if args.output is not None:
+        save_snapshot(snapshot, args.output)
+        print(f'Snapshot written to {args.output}')
+    print(encode_snapshot(snapshot))
+
+def run_profile(args):
+    competition = load_competition(args.teams)
+    profiler = profiling.Profiler(log_file=args.log, cprofile=args.cprofile, max_size=None)
+    summary = profiling.profile_draws(competition, args.n, profiler, seed=args.seed, solver=args.solver,
+                                      on_draw=lambda draw_idx: print(f'{draw_idx + 1}/{args.n} draws', file=sys.stderr))
+    elapsed = summary['elapsed']
+    print(f"{summary['selections']} selections in {elapsed:.3f}s, {summary['nodes']} nodes, {summary['backtracks']} backtracks, "
+          f"{summary['restarts']} restarts, {summary['cache_hits']} cached dead ends, max depth {summary['max_depth']}")
+    for phase in ['search'] + profiling.PHASES:
+        phase_time = summary[f'{phase}_time']
+        print(f"  {phase:<8} {phase_time:8.3f}s {phase_time / elapsed if elapsed else 0:6.1%}")
+    print('Slowest selections:')
+    for metrics in sorted(profiler.metrics, key=lambda metrics: metrics['elapsed'], reverse=True)[:5]:
+        print(f"  {competition.teams_id_map[metrics['team_id']]['name']} with {metrics['drawn']} drawn: {metrics['elapsed']:.3f}s, "
+              f"{metrics['nodes']} nodes, depth {metrics['max_depth']}")
+    if args.cprofile:
+        print(profiler.profile_text(args.lines))
+    if args.log is not None:
+        print(f'Selection metrics appended to {args.log}')
+
+def run_validate(args):
+    competition = load_competition(args.teams)
+    draw_idxs, states = load_draws(args.draws_file)
+    start_time = time.perf_counter()
+    valid = validate.validate_draws(competition, states)
+    invalid_idxs = (~valid).nonzero()[0]
+    print(f'{len(states) - len(invalid_idxs)} of {len(states)} draws valid in {time.perf_counter() - start_time:.1f}s')
+    for idx in invalid_idxs[:args.show]:
+        violations = validate.draw_violations(competition, states[idx].tolist())
+        print(f'Draw {draw_idxs[idx]}: ' + '; '.join(message for _, message in violations[:3]))
+    if len(invalid_idxs):
+        sys.exit(1)
+
+def run_conformance(args):
+    competition = load_competition(args.teams)
+    engine = validate.selection_at(competition, args.drawn, seed=args.draw_seed)
+    if engine is None:
+        print(f'The draw ends before {args.drawn} teams are drawn')
+        sys.exit(1)
+    print(f"{engine.cur_team['name']} with {len(engine.drawn_team_ids)} teams drawn")
+    # the samples are forks of the engine, they all select with its parallel search
+    engine.parallel = ParallelSearch(competition, workers=args.parallel) if args.parallel else None
+    results = []
+    try:
+        for solver in args.solver:
+            result = validate.conformance_test(engine, args.samples, seed=args.seed, solver=solver)
+            results.append(result)
+            slots = ', '.join(f"slot {slot['match_idx']} p={slot['p_value']:.3f}" for slot in result['slots'])
+            print(f"{solver:<4} {result['outcome_num']} outcomes, chi2={result['statistic']:.1f} df={result['df']} p={result['p_value']:.3f}; {slots}")
+    finally:
+        if engine.parallel is not None:
+            engine.parallel.close()
+    if args.output is not None:
+        bench.save_json(results, args.output)
+        print(f'Conformance results written to {args.output}')
+    p_values = [p_value for result in results for p_value in [result['p_value']] + [slot['p_value'] for slot in result['slots']]]
+    if min(p_values) < args.alpha:
+        print(f'Distribution differs from the exact one at the {args.alpha} level')
+        sys.exit(1)
+
+def run_serve(args):
+    app = api.create_app(args.teams, workers=args.workers, ttl=args.ttl, max_sessions=args.max_draws, select_timeout=args.timeout)
+    print(f"Serving {', '.join(app.competitions)} on http://{args.host}:{args.port}")
+    api.serve(app, host=args.host, port=args.port)
+
+def run_build_assets(args):
+    teams_data = [team for teams_file in args.teams for team in load_teams(teams_file)]
+    manifest, failed = build_assets(teams_data, args.static, force=args.force, on_asset=lambda kind, key: print(f'{kind}: {key}'))
+    print(f"{len(manifest['logos'])} logos, {len(manifest['flags'])} flags and {len(manifest['images'])} images in {args.static}")
+    for key, e in failed:
+        print(f'Failed to build {key}: {e}')
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m sportdrawer')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    simulate_parser = subparsers.add_parser('simulate', help='run many full draws and aggregate pairing frequencies')
+    simulate_parser.add_argument('--n', type=int, default=1000, help='number of draws')
+    simulate_parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    simulate_parser.add_argument('--seed', default=0, help='base seed, every draw derives its own seed from it')
+    simulate_parser.add_argument('--solver', choices=SOLVERS, default='mrv')
+    simulate_parser.add_argument('--teams', default=DEFAULT_TEAMS_FILE)
+    simulate_parser.add_argument('--output', help='JSON file for the pairing matrix and per-slot histogram')
+    simulate_parser.add_argument('--draws-file', help='binary file every finished draw is appended to')
+    simulate_parser.set_defaults(func=run_simulate)
+
+    bench_parser = subparsers.add_parser('bench', help='time the solvers on seeded full draws and captured mid-draw states')
+    bench_parser.add_argument('--solver', nargs='+', choices=SOLVERS, default=SOLVERS)
+    bench_parser.add_argument('--repeat', type=int, default=3, help='runs of every scenario with each solver')
+    bench_parser.add_argument('--timeout', type=float, default=bench.DEFAULT_BENCH_TIMEOUT, help='seconds before a run is given up')
+    bench_parser.add_argument('--scenarios', help='JSON scenarios file, e.g. written by find-hard, instead of the default suite')
+    bench_parser.add_argument('--teams', default=DEFAULT_TEAMS_FILE)
+    bench_parser.add_argument('--parallel', type=int, help='select with a speculative search over this many worker processes')
+    bench_parser.add_argument('--output', help='JSON file for the runs and their summary')
+    bench_parser.set_defaults(func=run_bench)
+
+    find_hard_parser = subparsers.add_parser('find-hard', help='search for selections where a solver backtracks the most')
+    find_hard_parser.add_argument('--samples', type=int, default=20, help='seeded draws to sample selections from')
+    find_hard_parser.add_argument('--top', type=int, default=10, help='number of scenarios to keep')
+    find_hard_parser.add_argument('--solver', choices=SOLVERS, default='dfs')
+    find_hard_parser.add_argument('--capture-from', type=int, default=18, help='only measure selections after this many drawn teams')
+    find_hard_parser.add_argument('--timeout', type=float, default=2, help='seconds before a measurement is given up')
+    find_hard_parser.add_argument('--teams', default=DEFAULT_TEAMS_FILE)
+    find_hard_parser.add_argument('--output', default='hard_scenarios.json')
+    find_hard_parser.set_defaults(func=run_find_hard)
+
+    book_parser = subparsers.add_parser('build-book', help='precompute the feasible opponents of the first selection')
+    book_parser.add_argument('--slots', type=int, default=DEFAULT_BOOK_SLOTS,
+                             help='slots of the first selection stored, each one about seven times the entries of the previous')
+    book_parser.add_argument('--teams', default=DEFAULT_TEAMS_FILE)
+    book_parser.add_argument('--output', help='book file, book.json next to the teams file by default')
+    book_parser.set_defaults(func=run_build_book)
+
+    ingest_parser = subparsers.add_parser('ingest', help='fetch teams from football-data.org into teams.json files, with an http cache')
+    ingest_parser.add_argument('--competition', default='CL', help='football-data.org competition code')
+    ingest_parser.add_argument('--season', nargs='+', type=int, required=True, help='starting years of the seasons')
+    ingest_parser.add_argument('--data', default='data', help='data directory holding one directory per competition season')
+    ingest_parser.add_argument('--cache', default=ingest.DEFAULT_CACHE_DIR, help='directory of the cached responses')
+    ingest_parser.add_argument('--base-url', default=ingest.API_URL, help='api root, e.g. a local stub server')
+    ingest_parser.add_argument('--token', help=f'api token, {ingest.TOKEN_ENV} or the streamlit secrets by default')
+    ingest_parser.add_argument('--workers', type=int, default=ingest.DEFAULT_WORKERS, help='concurrent requests')
+    ingest_parser.add_argument('--offline', action='store_true', help='only read the cached responses')
+    ingest_parser.set_defaults(func=run_ingest)
+
+    profile_parser = subparsers.add_parser('profile', help='record per-selection solver metrics of seeded full draws')
+    profile_parser.add_argument('--n', type=int, default=5, help='number of draws')
+    profile_parser.add_argument('--seed', default=0, help='base seed, every draw derives its own seed from it')
+    profile_parser.add_argument('--solver', choices=SOLVERS, default='mrv')
+    profile_parser.add_argument('--teams', default=DEFAULT_TEAMS_FILE)
+    profile_parser.add_argument('--cprofile', action='store_true', help='also run every selection under cProfile and print the aggregate')
+    profile_parser.add_argument('--lines', type=int, default=30, help='functions of the cProfile report')
+    profile_parser.add_argument('--log', help=f'JSON lines file the metrics of every selection are appended to, as {profiling.METRICS_LOG_ENV} does for the page')
+    profile_parser.set_defaults(func=run_profile)
+
+    validate_parser = subparsers.add_parser('validate', help='check every draw of a draws file against the rules')
+    validate_parser.add_argument('draws_file', help='binary file written by simulate --draws-file')
+    validate_parser.add_argument('--teams', default=DEFAULT_TEAMS_FILE)
+    validate_parser.add_argument('--show', type=int, default=5, help='invalid draws whose violations are printed')
+    validate_parser.set_defaults(func=run_validate)
+
+    conformance_parser = subparsers.add_parser('conformance', help='chi-square test of the sampled opponents of a selection against their exact distribution')
+    conformance_parser.add_argument('--drawn', type=int, default=30, help='test the first selection with this many teams drawn')
+    conformance_parser.add_argument('--draw-seed', default=0, help='seed of the draw leading to the selection')
+    conformance_parser.add_argument('--samples', type=int, default=1000, help='sampled selections per solver')
+    conformance_parser.add_argument('--seed', default=0, help='base seed, every sample derives its own seed from it')
+    conformance_parser.add_argument('--solver', nargs='+', choices=SOLVERS, default=SOLVERS)
+    conformance_parser.add_argument('--alpha', type=float, default=0.001, help='significance level of a failure')
+    conformance_parser.add_argument('--teams', default=DEFAULT_TEAMS_FILE)
+    conformance_parser.add_argument('--parallel', type=int, help='sample with a speculative search over this many worker processes')
+    conformance_parser.add_argument('--output', help='JSON file for the tests and their outcomes')
+    conformance_parser.set_defaults(func=run_conformance)
+
+    replay_parser = subparsers.add_parser('replay', help='restore a draw snapshot, or replay it to a round, and print its encoded snapshot')
+    replay_parser.add_argument('snapshot', help='snapshot json file, or an encoded snapshot as in the draw= url parameter')
+    replay_parser.add_argument('--upto', type=int, help='replay the recorded draw until this many teams are drawn')
+    replay_parser.add_argument('--finish', action='store_true', help='complete the draw from there')
+    replay_parser.add_argument('--teams', default=DEFAULT_TEAMS_FILE)
+    replay_parser.add_argument('--output', help='JSON file for the resulting snapshot')
+    replay_parser.set_defaults(func=run_replay)
+
+    serve_parser = subparsers.add_parser('serve', help='run the draw http api with uvicorn')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--workers', type=int, help='selection worker processes, one per cpu by default')
+    serve_parser.add_argument('--ttl', type=float, default=api.DEFAULT_SESSION_TTL, help='seconds before an idle draw is dropped')
+    serve_parser.add_argument('--max-draws', type=int, default=api.DEFAULT_MAX_SESSIONS, help='draws kept in memory at once')
+    serve_parser.add_argument('--timeout', type=float, default=api.DEFAULT_SELECT_TIMEOUT, help='seconds before a selection is given up')
+    serve_parser.add_argument('--teams', nargs='+', default=[DEFAULT_TEAMS_FILE], help='teams files of the competitions served')
+    serve_parser.set_defaults(func=run_serve)
+
+    assets_parser = subparsers.add_parser('build-assets', help='fetch logos and flags into local thumbnails and transcode the gifs')
+    assets_parser.add_argument('--teams', nargs='+', default=[DEFAULT_TEAMS_FILE])
+    assets_parser.add_argument('--static', default='static', help='static directory served by streamlit')
+    assets_parser.add_argument('--force', action='store_true', help='rebuild every asset instead of only new sources')
+    assets_parser.set_defaults(func=run_build_assets)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
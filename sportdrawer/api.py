@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from .engine import DrawEngine, SearchInterrupted, SOLVERS
+from .competition import load_competition
+from .worker import DEFAULT_SELECT_TIMEOUT
+
+# ASGI service running draws for other frontends, e.g. `python -m sportdrawer serve` or `uvicorn sportdrawer.api:app`
+# a draw is an engine kept in memory in the server process, selections run in a process pool on the state of the draw
+# POST /draws                  start a draw: {"competition", "seed", "solver"} all optional
+# GET /draws/{id}              the state of a draw
+# POST /draws/{id}/draw        draw the next team, opening the next pot when needed
+# POST /draws/{id}/select      select the opponents of the drawn team
+# DELETE /draws/{id}           drop a draw
+# GET /competitions            the teams of every competition
+DEFAULT_SESSION_TTL = 3600
+DEFAULT_MAX_SESSIONS = 1000
+MAX_BODY_SIZE = 4096
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class DrawSession:
+    # one draw, requests on it are serialized by its lock
+
+    def __init__(self, session_id, competition_name, engine):
+        self.id = session_id
+        self.competition_name = competition_name
+        self.engine = engine
+        self.lock = asyncio.Lock()
+        self.last_access = time.monotonic()
+
+class SessionStore:
+    # draws by id, ordered by last access so the idle ones are evicted from the front
+
+    def __init__(self, ttl=DEFAULT_SESSION_TTL, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def evict_expired(self):
+        deadline = time.monotonic() - self.ttl
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_access > deadline:
+                break
+            self.sessions.popitem(last=False)
+
+    def add(self, competition_name, engine):
+        self.evict_expired()
+        if len(self.sessions) >= self.max_sessions:
+            raise ApiError(503, 'Too many draws in progress, try again later')
+        session = DrawSession(secrets.token_urlsafe(12), competition_name, engine)
+        self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        self.evict_expired()
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ApiError(404, f'No draw {session_id}')
+        session.last_access = time.monotonic()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def remove(self, session_id):
+        if self.sessions.pop(session_id, None) is None:
+            raise ApiError(404, f'No draw {session_id}')
+
+# engines of the selection workers, one per competition and solver in every worker thread
+_worker_local = threading.local()
+
+def _select_in_worker(teams_file, solver, drawn_team_ids, state, rng_seed, timeout):
+    # replay the draw without searching up to the selection of its last team, then select
+    # return the compressed state with its opponents and the search stats, or the reason of an interrupted search
+    # as the exception does not survive pickling back from a process
+    engines = getattr(_worker_local, 'engines', None)
+    if engines is None:
+        engines = _worker_local.engines = {}
+    key = (teams_file, solver)
+    if key not in engines:
+        engines[key] = DrawEngine(load_competition(teams_file), solver=solver, trace_level='off')
+    engine = engines[key]
+    engine.replay(drawn_team_ids, engine.parse_compressed_state(state), upto=len(drawn_team_ids))
+    engine.rng.seed(rng_seed)
+    try:
+        engine.select_opponents(timeout=timeout)
+    except SearchInterrupted as e:
+        return None, dict(engine.search_stats), e.reason
+    return engine.print_compressed_state(engine.cur_state), dict(engine.search_stats), None
+
+def draw_state(session):
+    engine = session.engine
+    return {
+        'id': session.id,
+        'competition': session.competition_name,
+        'solver': engine.solver,
+        'status': engine.draw_status,
+        'pot': engine.cur_pot,
+        'drawn': engine.drawn_team_ids,
+        'current': engine.cur_team['id'] if engine.cur_team is not None else None,
+        'new_opponents': engine.newly_sel_team_ids,
+        # team_num rows of slot_num opponent ids, -1 for an open slot
+        'opponents': engine.cur_full_state,
+    }
+
+class DrawApi:
+    # the ASGI application, competitions maps names to teams files
+
+    def __init__(self, competitions, executor=None, workers=None, ttl=DEFAULT_SESSION_TTL, max_sessions=DEFAULT_MAX_SESSIONS,
+                 select_timeout=DEFAULT_SELECT_TIMEOUT):
+        self.competitions = {name: os.path.abspath(teams_file) for name, teams_file in competitions.items()}
+        self.default_competition = next(iter(self.competitions))
+        self._executor = executor
+        self.workers = workers
+        self.store = SessionStore(ttl, max_sessions)
+        self.select_timeout = select_timeout
+        self.routes = [
+            ('POST', re.compile(r'/draws'), self.create_draw),
+            ('GET', re.compile(r'/draws/([\w-]+)'), self.get_draw),
+            ('DELETE', re.compile(r'/draws/([\w-]+)'), self.delete_draw),
+            ('POST', re.compile(r'/draws/([\w-]+)/draw'), self.draw_team),
+            ('POST', re.compile(r'/draws/([\w-]+)/select'), self.select_opponents),
+            ('GET', re.compile(r'/competitions'), self.get_competitions),
+            ('GET', re.compile(r'/health'), self.health),
+        ]
+
+    @property
+    def executor(self):
+        # the pool is created on first use, so importing the app never starts processes
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        try:
+            handler, args = self.route(scope['method'], scope['path'])
+            body = await self.read_body(receive)
+            status, data = await handler(body, *args)
+        except ApiError as e:
+            status, data = e.status, {'error': str(e)}
+        content = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(content)).encode('ascii'))]})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def route(self, method, path):
+        path = path.rstrip('/') or '/'
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            if route_method == method:
+                return handler, match.groups()
+            allowed = True
+        if allowed:
+            raise ApiError(405, f'{method} is not allowed on {path}')
+        raise ApiError(404, f'No route {path}')
+
+    async def read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                raise ApiError(413, 'Request body too large')
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        body = b''.join(chunks)
+        if not body:
+            return {}
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise ApiError(400, 'Request body is not valid JSON')
+        if not isinstance(data, dict):
+            raise ApiError(400, 'Request body must be a JSON object')
+        return data
+
+    async def create_draw(self, body):
+        competition_name = body.get('competition', self.default_competition)
+        if competition_name not in self.competitions:
+            raise ApiError(400, f'Unknown competition {competition_name}, available: {list(self.competitions)}')
+        solver = body.get('solver', 'mrv')
+        if solver not in SOLVERS:
+            raise ApiError(400, f'Unknown solver {solver}, available solvers: {SOLVERS}')
+        seed = body.get('seed')
+        if seed is not None and not isinstance(seed, (int, str)):
+            raise ApiError(400, 'seed must be an integer or a string')
+        engine = DrawEngine(load_competition(self.competitions[competition_name]), seed=seed, solver=solver, trace_level='off')
+        session = self.store.add(competition_name, engine)
+        return 201, draw_state(session)
+
+    async def get_draw(self, body, session_id):
+        return 200, draw_state(self.store.get(session_id))
+
+    async def delete_draw(self, body, session_id):
+        self.store.remove(session_id)
+        return 200, {'id': session_id, 'deleted': True}
+
+    async def draw_team(self, body, session_id):
+        session = self.store.get(session_id)
+        async with session.lock:
+            engine = session.engine
+            if engine.draw_status == 'waiting_next_pot':
+                engine.draw_next_pot()
+            if engine.draw_status != 'waiting_draw':
+                raise ApiError(409, f'No team to draw while {engine.draw_status}')
+            engine.draw_team()
+            self.finish_if_done(engine)
+            return 200, draw_state(session)
+
+    async def select_opponents(self, body, session_id):
+        session = self.store.get(session_id)
+        async with session.lock:
+            engine = session.engine
+            if engine.draw_status != 'waiting_select':
+                raise ApiError(409, f'No opponents to select while {engine.draw_status}')
+            loop = asyncio.get_running_loop()
+            rng_seed = engine.rng.getrandbits(64)
+            state, search_stats, interrupted = await loop.run_in_executor(
+                self.executor, _select_in_worker, self.competitions[session.competition_name], engine.solver,
+                list(engine.drawn_team_ids), engine.print_compressed_state(engine.cur_state), rng_seed, self.select_timeout)
+            if interrupted is not None:
+                raise ApiError(504, f'Selecting opponents was interrupted ({interrupted}), try again')
+            # the selected opponents are applied by replaying the draw with them
+            engine.replay(list(engine.drawn_team_ids), engine.parse_compressed_state(state))
+            self.finish_if_done(engine)
+            return 200, dict(draw_state(session), search_stats=search_stats)
+
+    def finish_if_done(self, engine):
+        if engine.draw_status == 'waiting_done':
+            engine.finish_draw()
+
+    async def get_competitions(self, body):
+        competitions = {}
+        for name, teams_file in self.competitions.items():
+            competition = load_competition(teams_file)
+            competitions[name] = {
+                'name': competition.name,
+                'matches_per_pot': competition.matches_per_pot,
+                'teams': [{'id': team['id'], 'name': team['name'], 'country': team['country'], 'pot': team['pot']} for team in competition.teams_data],
+            }
+        return 200, competitions
+
+    async def health(self, body):
+        return 200, {'draws': len(self.store)}
+
+def create_app(teams_files, **kwargs):
+    # one competition per teams file, named after its directory, e.g. ucl_2024
+    return DrawApi({os.path.basename(os.path.dirname(os.path.abspath(teams_file))): teams_file for teams_file in teams_files}, **kwargs)
+
+def serve(app, host='127.0.0.1', port=8000):
+    try:
+        import uvicorn
+    except ImportError:
+        raise ImportError('uvicorn is required to serve the api, or run the app with another ASGI server')
+    uvicorn.run(app, host=host, port=port)
+
+# for `uvicorn sportdrawer.api:app`, teams files from SPORTDRAWER_TEAMS separated by os.pathsep
+app = create_app(os.environ.get('SPORTDRAWER_TEAMS', './data/ucl_2024/teams.json').split(os.pathsep))
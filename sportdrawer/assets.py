@@ -0,0 +1,192 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import urllib.request
+
+# build step fetching crests and flags once into static/assets, served by streamlit static serving
+# outputs are content-hashed, identical images are stored once, the manifest maps sources to files
+ASSET_DIR = 'assets'
+MANIFEST_FILE = 'manifest.json'
+# thumbnail sizes in px of the longest side, the page picks the smallest one not below the displayed size
+LOGO_SIZES = [30, 100, 300]
+FLAG_SIZES = [30]
+# streamlit only serves png, jpg and gif from static/ with their real content type
+THUMBNAIL_FORMAT = 'PNG'
+USER_AGENT = 'sport-drawer-assets/1.0'
+
+NATION_CODE_MAP = {
+    'ENG': 'gb-eng',
+    'SCO': 'gb-sct',
+    'GER': 'de',
+    'ESP': 'es',
+    'ITA': 'it',
+    'FRA': 'fr',
+    'POR': 'pt',
+    'NED': 'nl',
+    'BEL': 'be',
+    'UKR': 'ua',
+    'AUT': 'at',
+    'SUI': 'ch',
+    'CZE': 'cz',
+    'CRO': 'hr',
+    'SRB': 'rs',
+    'SVK': 'sk',
+}
+UNKNOWN_FLAG_URL = 'https://hatscripts.github.io/circle-flags/flags/xx.svg'
+
+def get_flag_url(country):
+    if country not in NATION_CODE_MAP:
+        return UNKNOWN_FLAG_URL
+    return f'https://flagicons.lipis.dev/flags/4x3/{NATION_CODE_MAP[country]}.svg'
+
+class AssetManifest:
+    # read side of the build, no dependency beyond the standard library
+    # logos: source url -> {size: file}, flags: country -> {size: file}, images: name -> {format: file}
+
+    def __init__(self, data, base_url):
+        self.logos = data.get('logos', {})
+        self.flags = data.get('flags', {})
+        self.images = data.get('images', {})
+        self.base_url = base_url
+
+    def _pick(self, sizes, size):
+        fitting = [int(s) for s in sizes if int(s) >= size]
+        best = min(fitting) if fitting else max(int(s) for s in sizes)
+        return sizes[str(best)]
+
+    def logo_url(self, url, size):
+        # local thumbnail url of a logo, or the source url when it was not built
+        if url not in self.logos:
+            return url
+        return f'{self.base_url}/{self._pick(self.logos[url], size)}'
+
+    def flag_url(self, country, size):
+        key = country if country in self.flags else 'XX'
+        if key not in self.flags:
+            return get_flag_url(country)
+        return f'{self.base_url}/{self._pick(self.flags[key], size)}'
+
+    def image_path(self, static_dir, name, formats=('webp', 'gif')):
+        # file path of a celebration image in the first available format, the original otherwise
+        for fmt in formats:
+            if fmt in self.images.get(name, {}):
+                return os.path.join(static_dir, ASSET_DIR, self.images[name][fmt])
+        return os.path.join(static_dir, name)
+
+def load_manifest(static_dir='static', base_url='app/static'):
+    # None if the assets were never built, callers then use the remote urls
+    path = os.path.join(static_dir, ASSET_DIR, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return AssetManifest(data, f'{base_url}/{ASSET_DIR}')
+
+def fetch(source):
+    # download a url, or import a local file
+    if not source.startswith(('http://', 'https://')):
+        with open(source, 'rb') as f:
+            return f.read()
+    request = urllib.request.Request(source, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+def open_image(data, size):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError('Pillow is required to build the assets')
+    if b'<svg' in data[:1024]:
+        try:
+            import cairosvg
+        except ImportError:
+            raise ImportError('cairosvg is required to rasterize svg logos and flags')
+        # rasterize at twice the largest size so downscaling stays sharp
+        data = cairosvg.svg2png(bytestring=data, output_height=size * 2)
+    return Image.open(io.BytesIO(data)).convert('RGBA')
+
+def save_hashed(data, out_dir, ext):
+    name = f'{hashlib.sha256(data).hexdigest()[:16]}.{ext}'
+    path = os.path.join(out_dir, name)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return name
+
+def make_thumbnails(data, sizes, out_dir):
+    thumbnails = {}
+    for size in sizes:
+        image = open_image(data, size)
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, THUMBNAIL_FORMAT, optimize=True)
+        thumbnails[str(size)] = save_hashed(buffer.getvalue(), out_dir, THUMBNAIL_FORMAT.lower())
+    return thumbnails
+
+def transcode_animation(path, out_dir, quality=60):
+    # animated webp with pillow, h264 mp4 with ffmpeg when it is installed
+    from PIL import Image
+    outputs = {}
+    with Image.open(path) as image:
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', save_all=True, quality=quality, method=6, loop=0)
+        outputs['webp'] = save_hashed(buffer.getvalue(), out_dir, 'webp')
+    if shutil.which('ffmpeg') is not None:
+        tmp_path = os.path.join(out_dir, 'tmp.mp4')
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', path, '-movflags', 'faststart', '-pix_fmt', 'yuv420p',
+                        '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', tmp_path], check=True)
+        with open(tmp_path, 'rb') as f:
+            outputs['mp4'] = save_hashed(f.read(), out_dir, 'mp4')
+        os.remove(tmp_path)
+    return outputs
+
+def build_assets(teams_data, static_dir='static', force=False, on_asset=None):
+    # fetch every logo and flag once and transcode the gifs of static/, sources already in the manifest are skipped
+    out_dir = os.path.join(static_dir, ASSET_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    manifest = {'logos': {}, 'flags': {}, 'images': {}}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest.update(json.load(f))
+
+    logo_urls = sorted({team['logo'] for team in teams_data})
+    countries = sorted({team['country'] for team in teams_data} | {'XX'})
+    image_names = sorted(name for name in os.listdir(static_dir) if name.endswith('.gif'))
+    jobs = [('logos', url, url, LOGO_SIZES) for url in logo_urls]
+    jobs += [('flags', country, get_flag_url(country), FLAG_SIZES) for country in countries]
+
+    failed = []
+    for kind, key, source, sizes in jobs:
+        if key in manifest[kind]:
+            continue
+        try:
+            manifest[kind][key] = make_thumbnails(fetch(source), sizes, out_dir)
+        except (OSError, ValueError) as e:
+            failed.append((key, e))
+            continue
+        if on_asset is not None:
+            on_asset(kind, key)
+    for name in image_names:
+        if name in manifest['images']:
+            continue
+        try:
+            manifest['images'][name] = transcode_animation(os.path.join(static_dir, name), out_dir)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            # a failed ffmpeg run leaves its tmp.mp4 behind, removed with the unreferenced files below
+            failed.append((name, e))
+            continue
+        if on_asset is not None:
+            on_asset('images', name)
+
+    # drop files no longer referenced, e.g. after a logo changed upstream
+    used_files = {name for kind in ['logos', 'flags', 'images'] for files in manifest[kind].values() for name in files.values()}
+    for name in os.listdir(out_dir):
+        if name != MANIFEST_FILE and name not in used_files:
+            os.remove(os.path.join(out_dir, name))
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    return manifest, failed
@@ -0,0 +1,194 @@
+import heapq
+import json
+import platform
+import statistics
+import subprocess
+import time
+from .engine import DrawEngine, SearchInterrupted
+from .cache import StateCache
+
+# seconds a single scenario run may take before it is recorded as a timeout
+DEFAULT_BENCH_TIMEOUT = 10
+# scenarios of the default suite: seeded full draws, and the first 2 selections of every pot of some seeded draws
+# the searches are largest when a pot opens, the last selections of a pot are mostly forced
+DEFAULT_FULL_DRAW_SEEDS = [0, 1, 2]
+DEFAULT_CAPTURE_SEEDS = [0, 1, 2]
+DEFAULT_CAPTURE_PER_POT = 2
+
+STAT_KEYS = ['nodes', 'backtracks', 'restarts', 'autofill_rounds']
+
+def new_engine(competition, solver, seed, parallel=None):
+    # a fresh state cache for every run, so runs do not speed each other up
+    return DrawEngine(competition, seed=seed, solver=solver, trace_level='off', state_cache=StateCache(), parallel=parallel)
+
+def capture_scenarios(competition, seed, capture_from=0, per_pot=None, solver='mrv'):
+    # run a seeded draw and record the state before every selection from the given number of drawn teams on
+    # with per_pot, only before the first per_pot selections of every pot
+    engine = new_engine(competition, solver, seed)
+    scenarios = []
+    while engine.draw_status != 'done':
+        if engine.draw_status == 'waiting_select':
+            drawn_num = len(engine.drawn_team_ids)
+            if drawn_num > capture_from and (per_pot is None or (drawn_num - 1) % competition.pot_size < per_pot):
+                scenarios.append(make_select_scenario(engine, f'seed{seed}-round{len(engine.drawn_team_ids)}'))
+            engine.select_opponents()
+        elif engine.draw_status == 'waiting_draw':
+            engine.draw_team()
+        elif engine.draw_status == 'waiting_next_pot':
+            engine.draw_next_pot()
+        elif engine.draw_status == 'waiting_done':
+            engine.finish_draw()
+    return scenarios
+
+def make_select_scenario(engine, name, team_id=None):
+    drawn_team_ids = engine.drawn_team_ids.copy()
+    if team_id is None:
+        team_id = engine.cur_team['id']
+    else:
+        drawn_team_ids[-1] = team_id
+    return {
+        'name': name,
+        'type': 'select',
+        'state': engine.print_compressed_state(engine.cur_state),
+        'team_id': team_id,
+        'drawn_team_ids': drawn_team_ids,
+    }
+
+def default_scenarios(competition):
+    scenarios = [{'name': f'full-draw-seed{seed}', 'type': 'full_draw', 'seed': seed} for seed in DEFAULT_FULL_DRAW_SEEDS]
+    for seed in DEFAULT_CAPTURE_SEEDS:
+        scenarios.extend(capture_scenarios(competition, seed, per_pot=DEFAULT_CAPTURE_PER_POT))
+    return scenarios
+
+def run_scenario(competition, scenario, solver, seed, timeout=DEFAULT_BENCH_TIMEOUT, parallel=None):
+    start_time = time.perf_counter()
+    totals = dict.fromkeys(STAT_KEYS, 0)
+    timed_out = False
+    if scenario['type'] == 'full_draw':
+        # the draw only depends on the scenario seed, repeats measure the same draw
+        engine = new_engine(competition, solver, scenario['seed'], parallel)
+        while engine.draw_status != 'done':
+            if engine.draw_status == 'waiting_select':
+                remaining = timeout - (time.perf_counter() - start_time)
+                try:
+                    engine.select_opponents(timeout=remaining)
+                except SearchInterrupted:
+                    timed_out = True
+                for key in STAT_KEYS:
+                    totals[key] += engine.search_stats[key]
+                if timed_out:
+                    break
+            elif engine.draw_status == 'waiting_draw':
+                engine.draw_team()
+            elif engine.draw_status == 'waiting_next_pot':
+                engine.draw_next_pot()
+            elif engine.draw_status == 'waiting_done':
+                engine.finish_draw()
+    else:
+        engine = new_engine(competition, solver, seed, parallel)
+        load_select_scenario(engine, scenario)
+        try:
+            engine.select_opponents(timeout=timeout)
+        except SearchInterrupted:
+            timed_out = True
+        totals = {key: engine.search_stats[key] for key in STAT_KEYS}
+    return {
+        'scenario': scenario['name'],
+        'solver': solver,
+        'seed': seed,
+        'wall_time': time.perf_counter() - start_time,
+        'timeout': timed_out,
+        **totals,
+    }
+
+def load_select_scenario(engine, scenario):
+    engine.cur_state = engine.parse_compressed_state(scenario['state'])
+    engine.cur_full_state = engine.convert_full_state(engine.cur_state)
+    engine.drawn_team_ids = list(scenario['drawn_team_ids'])
+    engine.cur_team = engine.teams_id_map[scenario['team_id']]
+    engine.draw_status = 'waiting_select'
+
+def summarize(runs):
+    groups = {}
+    for run in runs:
+        groups.setdefault((run['scenario'], run['solver']), []).append(run)
+    summary = []
+    for (scenario, solver), group in groups.items():
+        wall_times = [run['wall_time'] for run in group]
+        summary.append({
+            'scenario': scenario,
+            'solver': solver,
+            'runs': len(group),
+            'timeouts': sum(run['timeout'] for run in group),
+            'median_wall_time': statistics.median(wall_times),
+            'max_wall_time': max(wall_times),
+            **{f'mean_{key}': statistics.mean(run[key] for run in group) for key in STAT_KEYS},
+        })
+    return summary
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_bench(competition, scenarios, solvers, repeat=3, timeout=DEFAULT_BENCH_TIMEOUT, on_run=None, parallel=None):
+    # parallel is an optional ParallelSearch every run selects with, its workers keep their own state caches across runs
+    runs = []
+    for scenario in scenarios:
+        for solver in solvers:
+            for seed in range(repeat):
+                run = run_scenario(competition, scenario, solver, seed, timeout, parallel)
+                runs.append(run)
+                if on_run is not None:
+                    on_run(run)
+    return {
+        'meta': {
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'teams': competition.key,
+            'solvers': solvers,
+            'repeat': repeat,
+            'timeout': timeout,
+            'parallel_workers': parallel.workers if parallel is not None else None,
+        },
+        'runs': runs,
+        'summary': summarize(runs),
+    }
+
+def find_hard_scenarios(competition, sample_num=20, top_num=10, solver='dfs', capture_from=18, timeout=2, on_scenario=None):
+    # adversarial search for selections where the solver backtracks the most
+    # sample seeded draws, measure every selection from capture_from on, then try the other undrawn teams of the pot at the hardest ones
+    hardest = []
+
+    def measure(scenario):
+        run = run_scenario(competition, scenario, solver, 0, timeout)
+        scenario = dict(scenario, backtracks=run['backtracks'], timeout=run['timeout'])
+        item = (run['backtracks'], scenario['name'], scenario)
+        if len(hardest) < top_num:
+            heapq.heappush(hardest, item)
+        else:
+            heapq.heappushpop(hardest, item)
+        if on_scenario is not None:
+            on_scenario(scenario)
+
+    for seed in range(sample_num):
+        for scenario in capture_scenarios(competition, seed, capture_from):
+            measure(scenario)
+    for _, _, scenario in sorted(hardest, reverse=True):
+        engine = new_engine(competition, solver, 0)
+        load_select_scenario(engine, scenario)
+        pot = engine.cur_team['pot']
+        for team_id in competition.pot_team_ids(pot):
+            if team_id in scenario['drawn_team_ids'] or -1 not in engine.cur_full_state[team_id]:
+                continue
+            measure(make_select_scenario(engine, f"{scenario['name']}-team{team_id}", team_id))
+    return [scenario for _, _, scenario in sorted(hardest, reverse=True)]
+
+def load_scenarios(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_json(data, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
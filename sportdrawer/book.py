@@ -0,0 +1,128 @@
+import json
+import os
+from functools import lru_cache
+from .engine import DrawEngine
+from .probability import FeasibilityChecker
+
+# book file written next to the teams file of a competition
+BOOK_FILE = 'book.json'
+BOOK_VERSION = 2
+# slots of the first selection stored by default, the states of the next slot are about seven times as many
+DEFAULT_BOOK_SLOTS = 3
+
+class OpeningBook:
+    # feasible opponents of the first open slot of a drawn team, keyed on the team and the compressed state
+    # the selection takes every slot by rank among the opponents that leave a valid completion,
+    # so picking from a book entry is the same procedure with the feasibility checks done offline
+    # a key only recurs while the state holds nothing else than the drawn team's opponents, i.e. in the first selection
+
+    def __init__(self, team_names, draw_format, max_drawn, entries=None):
+        self.team_names = team_names
+        self.draw_format = draw_format
+        # the engine only consults the book up to this number of drawn teams
+        self.max_drawn = max_drawn
+        self.entries = entries if entries is not None else {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def check_teams(self, teams_data, draw_format):
+        if self.team_names != [team['name'] for team in teams_data]:
+            raise ValueError('The opening book was built for other teams')
+        if self.draw_format != draw_format:
+            raise ValueError('The opening book was built for another draw format')
+
+    def feasible_opponents(self, draw_state, team_id, match_idx):
+        # list of the feasible opponents of team_id at match_idx, or None when the state is not in the book
+        key = chr(team_id) + draw_state.to_compressed()
+        feasible_team_ids = self.entries.get(key)
+        if feasible_team_ids is not None:
+            self.hits += 1
+            return feasible_team_ids
+        self.misses += 1
+        return None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def to_dict(self):
+        # keys as the team id and the printed state, like print_compressed_state
+        entries = {}
+        for key, feasible_team_ids in self.entries.items():
+            printed_state = '-'.join(str(ord(char)) for char in key[1:])
+            entries[f'{ord(key[0])}:{printed_state}'] = feasible_team_ids
+        return {
+            'version': BOOK_VERSION,
+            'teams': self.team_names,
+            'format': self.draw_format,
+            'max_drawn': self.max_drawn,
+            'entries': entries,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != BOOK_VERSION:
+            raise ValueError(f"Unsupported opening book version {data.get('version')}")
+        entries = {}
+        for printed_key, feasible_team_ids in data['entries'].items():
+            team_id, printed_state = printed_key.split(':')
+            state = ''.join(chr(int(char)) for char in printed_state.split('-')) if printed_state else ''
+            entries[chr(int(team_id)) + state] = feasible_team_ids
+        return cls(data['teams'], data['format'], data['max_drawn'], entries)
+
+def book_path(teams_file):
+    return os.path.join(os.path.dirname(teams_file), BOOK_FILE)
+
+def save_book(book, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(book.to_dict(), f)
+
+@lru_cache(maxsize=None)
+def _load_book(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return OpeningBook.from_dict(json.load(f))
+
+def load_book(path):
+    # loaded once per process and shared read-only by every engine, None if there is no book file
+    path = os.path.abspath(path)
+    if not os.path.exists(path):
+        return None
+    return _load_book(path)
+
+def build_book(competition, max_slots=DEFAULT_BOOK_SLOTS, on_team=None):
+    # store the feasible opponents of every slot the first selection can go through for every team of pot 1,
+    # up to max_slots slots of the drawn team, the first selection being the only one whose states recur between draws
+    book = OpeningBook([team['name'] for team in competition.teams_data], competition.draw_format, 1)
+    engine = DrawEngine(competition, solver='mrv', trace_level='off')
+    checker = FeasibilityChecker(engine)
+    for team_idx, team_id in enumerate(competition.pot_team_ids(1)):
+        _add_selection(book, engine, checker, engine._decode(engine.cur_state), team_id, max_slots)
+        if on_team is not None:
+            on_team(team_idx, len(book))
+    return book
+
+def _add_selection(book, engine, checker, draw_state, team_id, max_slots):
+    # add the first open slot of team_id and every state its feasible opponents lead to, as the selection fills them
+    row = draw_state.slots[team_id]
+    if max_slots == 0 or -1 not in row:
+        return
+    match_idx = row.index(-1)
+    key = chr(team_id) + draw_state.to_compressed()
+    if key in book.entries:
+        return
+    feasible_team_ids = checker.feasible_candidates(draw_state, team_id, match_idx)
+    book.entries[key] = feasible_team_ids
+    trail_len = len(draw_state.trail)
+    for opponent_id in feasible_team_ids:
+        draw_state.assign(team_id, match_idx, opponent_id)
+        engine._autofill(draw_state)
+        _add_selection(book, engine, checker, draw_state, team_id, max_slots - 1)
+        draw_state.undo(trail_len)
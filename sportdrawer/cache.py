@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 50000
+# opponent probabilities kept per competition, keyed on the team and the state
+PROBABILITY_CACHE_SIZE = 1000
+
+class StateCache:
+    # size capped LRU cache of feasibility results, keyed on compressed states
+    # a value is None for a dead end, or the compressed state of one valid completion
+    # shared by the session and worker threads, every access to the entries holds the lock
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, state):
+        with self.lock:
+            return state in self.entries
+
+    def get(self, state):
+        # return (found, witness), witness is None for a known dead end
+        with self.lock:
+            if state in self.entries:
+                self.entries.move_to_end(state)
+                self.hits += 1
+                return True, self.entries[state]
+            self.misses += 1
+            return False, None
+
+    def put(self, state, witness=None):
+        with self.lock:
+            self.entries[state] = witness
+            self.entries.move_to_end(state)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+# caches shared by every engine of the process, one per teams data
+_state_caches = {}
+_state_caches_lock = threading.Lock()
+
+def get_state_cache(key, max_size=DEFAULT_CACHE_SIZE):
+    with _state_caches_lock:
+        if key not in _state_caches:
+            _state_caches[key] = StateCache(max_size)
+        return _state_caches[key]
@@ -0,0 +1,110 @@
+import json
+import os
+from collections import Counter
+from functools import lru_cache
+from .state import TeamIndex
+from .cache import StateCache, get_state_cache, PROBABILITY_CACHE_SIZE
+
+# draw format of a competition, read from format.json next to its teams file
+# matches_per_pot: 2 for a home and an away opponent from every pot, 1 for a single opponent per pot without drawn venues,
+# so not for formats with a set number of home matches per team
+# max_per_country: opponents a team may meet from any one country, teams never meet teams of their own country
+# pots and country_codes only apply to teams files without pots, e.g. crawled from football-data.org:
+# pots lists the team names of every pot, country_codes maps their area codes to the country codes of the flags
+FORMAT_FILE = 'format.json'
+TEAMS_FILE = 'teams.json'
+DEFAULT_FORMAT = {
+    'name': 'UEFA Champions League league phase',
+    'matches_per_pot': 2,
+    'max_per_country': 2,
+}
+
+def load_format(teams_file):
+    draw_format = dict(DEFAULT_FORMAT)
+    format_file = os.path.join(os.path.dirname(teams_file), FORMAT_FILE)
+    if os.path.exists(format_file):
+        with open(format_file, 'r', encoding='utf-8') as f:
+            draw_format.update(json.load(f))
+    return draw_format
+
+def load_teams(teams_file, draw_format=None):
+    with open(teams_file, 'r', encoding='utf-8') as f:
+        teams_data = json.load(f)
+    if isinstance(teams_data, dict):
+        teams_data = convert_football_data_teams(teams_data, draw_format if draw_format is not None else load_format(teams_file))
+    for idx, team in enumerate(teams_data):
+        teams_data[idx]['id'] = idx
+    return teams_data
+
+def convert_football_data_teams(data, draw_format):
+    # football-data.org teams response to the teams schema, ordered by pot
+    if 'pots' not in draw_format:
+        raise ValueError('The format of a football-data.org teams file needs the team names of every pot')
+    team_pots = {name: pot + 1 for pot, names in enumerate(draw_format['pots']) for name in names}
+    country_codes = draw_format.get('country_codes', {})
+    teams_data = []
+    for team in data['teams']:
+        if team['name'] not in team_pots:
+            raise ValueError(f"{team['name']} is in no pot of the format")
+        area_code = team['area']['code']
+        teams_data.append({
+            'name': team['name'],
+            'country': country_codes.get(area_code, area_code),
+            'pot': team_pots[team['name']],
+            'logo': team['crest'],
+        })
+    return sorted(teams_data, key=lambda team: team['pot'])
+
+class Competition:
+    # teams of a competition with every index derived from them, built once and shared read-only by all engines
+
+    def __init__(self, teams_data, key=None, draw_format=None):
+        self.key = key
+        self.draw_format = dict(DEFAULT_FORMAT, **(draw_format or {}))
+        self.teams_data = teams_data
+        # convert json to id map
+        self.teams_id_map = {idx: team for idx, team in enumerate(teams_data)}
+        # Generate a map of team id to the number of teams of the same country
+        country_counts = Counter(team['country'] for team in teams_data)
+        self.team_country_counts = {team['id']: country_counts[team['country']] for team in teams_data}
+        self.team_index = TeamIndex(teams_data, self.draw_format['matches_per_pot'], self.draw_format['max_per_country'])
+        pot_sizes = set(len(team_ids) for team_ids in self.team_index.pot_team_ids)
+        if len(pot_sizes) != 1:
+            raise ValueError(f'Every pot must hold the same number of teams, got {sorted(pot_sizes)}')
+        self.pot_size = pot_sizes.pop()
+        # dead ends only hold for these teams and this format, a competition without a key gets a cache of its own
+        self.state_cache = get_state_cache(key) if key is not None else StateCache()
+        self.probability_cache = StateCache(PROBABILITY_CACHE_SIZE)
+
+    @property
+    def name(self):
+        return self.draw_format['name']
+
+    @property
+    def team_num(self):
+        return len(self.teams_data)
+
+    @property
+    def pot_num(self):
+        return self.team_index.pot_num
+
+    @property
+    def matches_per_pot(self):
+        return self.team_index.matches_per_pot
+
+    @property
+    def slot_num(self):
+        return self.team_index.slot_num
+
+    def pot_team_ids(self, pot):
+        # team ids of a 1-based pot
+        return self.team_index.pot_team_ids[pot - 1]
+
+@lru_cache(maxsize=None)
+def _load_competition(teams_file):
+    draw_format = load_format(teams_file)
+    return Competition(load_teams(teams_file, draw_format), key=teams_file, draw_format=draw_format)
+
+def load_competition(teams_file):
+    # loaded once per process for every path to the same file
+    return _load_competition(os.path.abspath(teams_file))
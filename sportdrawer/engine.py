@@ -0,0 +1,655 @@
+import copy
+import random
+import time
+from .state import DrawState, iter_bits, compress_slots, expand_compressed
+from .competition import Competition, load_competition
+from .probability import opponent_probabilities
+from .trace import Trace
+from .snapshot import SNAPSHOT_VERSION, teams_digest, check_snapshot
+
+# available solvers for completing the other teams once the drawn team is filled
+# dfs: fill teams one by one in country count order, mrv: always branch on the slot with the fewest candidates
+SOLVERS = ['dfs', 'mrv']
+# nodes of the first mrv search before a restart, doubled on every restart
+MRV_RESTART_NODES = 500
+# counters of the last search, max_depth counts branching assignments on the search path, cache_hits the known dead ends met
+SEARCH_STAT_KEYS = ['nodes', 'backtracks', 'restarts', 'autofill_rounds', 'max_depth', 'cache_lookups', 'cache_hits']
+
+def new_search_stats():
+    return dict.fromkeys(SEARCH_STAT_KEYS, 0)
+
+class SearchLimitReached(Exception):
+    pass
+
+class SearchInterrupted(Exception):
+    # raised out of a search that was cancelled or ran out of time, reason is 'cancelled' or 'timeout'
+    def __init__(self, reason):
+        super().__init__(f'Search {reason}')
+        self.reason = reason
+
+class DrawEngine:
+    # headless draw engine, holds the whole state of one draw and never touches streamlit
+
+    def __init__(self, teams_file, seed=None, state_cache=None, solver='dfs', trace_level='summary', book=None, profiler=None, parallel=None):
+        # teams_file is a path to a teams json, or an already loaded Competition
+        # book is an optional OpeningBook answering the early selections without searching
+        # profiler is an optional Profiler recording the metrics of every selection
+        # parallel is an optional ParallelSearch splitting the search of every selection over worker processes
+        if solver not in SOLVERS:
+            raise ValueError(f'Unknown solver {solver}, available solvers: {SOLVERS}')
+        self.solver = solver
+        competition = teams_file if isinstance(teams_file, Competition) else load_competition(teams_file)
+        self.competition = competition
+        self.teams_data = competition.teams_data
+        self.teams_id_map = competition.teams_id_map
+        self.team_country_counts = competition.team_country_counts
+        self.team_index = competition.team_index
+        # feasibility results of searched states, shared by all engines on the same competition by default
+        self.state_cache = state_cache if state_cache is not None else competition.state_cache
+        if book is not None:
+            book.check_teams(self.teams_data, competition.draw_format)
+        self.book = book
+        self.profiler = profiler
+        if parallel is not None:
+            parallel.check_teams(self.teams_data, competition.draw_format)
+        self.parallel = parallel
+        self.rng = random.Random(seed)
+        # order of the searches completing a draw, reseeded from rng at every selection
+        self.search_rng = random.Random()
+        self.node_limit = None
+        # set from another thread to stop the running search
+        self.cancel_requested = False
+        self.deadline = None
+        self.trace = Trace(trace_level)
+        self.reset()
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = random.Random(seed)
+        self.draw_round = 0
+        self.drawn_team_ids = []
+        # every team is represented by the character of its id
+        # match state is compressed by sorting and concatenating all opponent pairs
+        self.cur_state = ''
+        # full state is a team_num*slot_num matrix
+        # each row is the opponent state of a team
+        # slots for home vs pot 1, away vs pot 1, home vs pot 2, away vs pot 2, ..., or one per pot without venues
+        self.cur_full_state = self.convert_full_state(self.cur_state)
+        self.cur_team = None
+        # available draw status: waiting_draw, drawing, waiting_select, selecting, waiting_next_pot, waiting_done, done
+        self.draw_status = 'waiting_draw'
+        self.trace.clear()
+        # counters of the last search
+        self.search_stats = new_search_stats()
+        # newly selected team ids, for highlight them in the UI
+        self.newly_sel_team_ids = []
+        # whether no need to select, for skipping the selection process
+        self.no_need_to_select = False
+
+    def fork(self, seed=None, solver=None, trace_level='off'):
+        # copy of the engine sharing teams data, indexes and caches, with its own rng, trace and draw state
+        engine = copy.copy(self)
+        engine.rng = random.Random(seed)
+        engine.search_rng = random.Random()
+        engine.solver = solver if solver is not None else self.solver
+        engine.drawn_team_ids = self.drawn_team_ids.copy()
+        engine.cur_full_state = [row.copy() for row in self.cur_full_state]
+        engine.trace = Trace(trace_level)
+        engine.profiler = None
+        engine.search_stats = new_search_stats()
+        engine.newly_sel_team_ids = self.newly_sel_team_ids.copy()
+        return engine
+
+    @property
+    def cur_pot(self):
+        return self.draw_round // self.competition.pot_size + 1
+
+    def available_team_ids(self):
+        return [team_id for team_id in self.competition.pot_team_ids(self.cur_pot) if team_id not in self.drawn_team_ids]
+
+    # draw flow
+
+    def draw_team(self, team_id=None):
+        # team_id forces the drawn team instead of the random choice, for replays
+        if self.draw_status != 'waiting_draw':
+            return None
+        if team_id is not None and team_id not in self.available_team_ids():
+            raise ValueError(f'Team {team_id} can not be drawn from pot {self.cur_pot}')
+        self.draw_status = 'drawing'
+
+        drawn_team_id = self.rng.choice(self.available_team_ids()) if team_id is None else team_id
+
+        self.drawn_team_ids.append(drawn_team_id)
+        self.cur_team = self.teams_id_map[drawn_team_id]
+        self.newly_sel_team_ids = []
+        self.trace.clear()
+        if self.cur_full_state[drawn_team_id].count(-1) == 0:
+            self.no_need_to_select = True
+            self._advance_round()
+        else:
+            self.no_need_to_select = False
+            self.draw_status = 'waiting_select'
+        return self.cur_team
+
+    def select_opponents(self, timeout=None):
+        # raise SearchInterrupted if cancelled or out of time, the draw is back to waiting_select after any error
+        if self.draw_status != 'waiting_select':
+            return None
+        cur_team = self.cur_team
+        self.draw_status = 'selecting'
+
+        self.cancel_requested = False
+        self.deadline = time.perf_counter() + timeout if timeout is not None else None
+        # the draw rng moves by the same amount at every selection, whatever the searches find in the state cache
+        ranks = self._slot_ranks()
+        self.search_rng.seed(self.rng.getrandbits(64))
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start_selection()
+        try:
+            choice_state, book_slots, book_done = self._select_from_book(cur_team, ranks)
+            if book_done:
+                self.search_stats = new_search_stats()
+            elif self.parallel is not None:
+                choice_state = self.parallel.search(self, cur_team, choice_state, self.drawn_team_ids, ranks)
+            else:
+                choice_state = self.gen_possible_state(cur_team, choice_state, 0, self.drawn_team_ids, ranks=ranks)
+            self.search_stats['book_slots'] = book_slots
+            if choice_state is None:
+                raise Exception('No possible state found!')
+            choice_full_state = self.convert_full_state(choice_state)
+        except Exception as e:
+            self.draw_status = 'waiting_select'
+            if profiler is not None:
+                profiler.finish_selection(self, e.reason if isinstance(e, SearchInterrupted) else 'failed')
+            raise
+        finally:
+            self.deadline = None
+        # choose only matches that are related to the current team
+        opponent_ids = choice_full_state[cur_team['id']]
+        self._apply_opponents(opponent_ids)
+        if profiler is not None:
+            profiler.finish_selection(self, 'done')
+        if self.trace.summary:
+            self.trace.add('summary', 'stats', search_stats=dict(self.search_stats), cache_stats=self.state_cache.stats())
+        self._advance_round()
+        return opponent_ids
+
+    def _apply_opponents(self, opponent_ids):
+        # update current state by the opponent ids of the current team
+        cur_team = self.cur_team
+        cur_full_state = self.cur_full_state
+        original_sel_team_ids = [idx for idx in cur_full_state[cur_team['id']] if idx != -1]
+        for match_idx, opponent_id in enumerate(opponent_ids):
+            cur_full_state[cur_team['id']][match_idx] = opponent_id
+            cur_full_state[opponent_id][self.team_index.reverse_slot(cur_team['id'], match_idx)] = cur_team['id']
+        self.cur_state = self.convert_compressed_state(cur_full_state)
+        self.newly_sel_team_ids = [idx for idx in opponent_ids if idx not in original_sel_team_ids]
+        if self.trace.summary:
+            self.trace.add('summary', 'select', team_id=cur_team['id'], opponent_ids=list(opponent_ids))
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def _slot_ranks(self):
+        # a random rank of every team for every slot, each slot of the drawn team takes its feasible candidate of lowest rank
+        # which is uniform among the feasible ones, and only depends on which candidates are feasible, not on the search order
+        team_num = len(self.teams_data)
+        return [self.rng.sample(range(team_num), team_num) for _ in range(self.team_index.slot_num)]
+
+    def _select_from_book(self, cur_team, ranks):
+        # take the slots of cur_team answered by the opening book, uniformly among their feasible opponents
+        # return the compressed state with these slots filled, the number of slots taken from the book and whether all are filled
+        if self.book is None or len(self.drawn_team_ids) > self.book.max_drawn:
+            return self.cur_state, 0, False
+        draw_state = self._decode(self.cur_state)
+        team_id = cur_team['id']
+        row = draw_state.slots[team_id]
+        book_slots = 0
+        while -1 in row:
+            match_idx = row.index(-1)
+            feasible_team_ids = self.book.feasible_opponents(draw_state, team_id, match_idx)
+            if not feasible_team_ids:
+                break
+            opponent_id = min(feasible_team_ids, key=ranks[match_idx].__getitem__)
+            if self.trace.full:
+                self.trace.add('full', 'book', team_id=team_id, match_idx=match_idx, opponent_id=opponent_id, team_ids=list(feasible_team_ids))
+            draw_state.assign(team_id, match_idx, opponent_id)
+            self._autofill(draw_state)
+            book_slots += 1
+        return self._encode(draw_state), book_slots, -1 not in row
+
+    def _check_interrupt(self):
+        if self.cancel_requested:
+            raise SearchInterrupted('cancelled')
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchInterrupted('timeout')
+
+    def opponent_probabilities(self, team_id=None, state=None, **kwargs):
+        # per slot probabilities of the opponents of team_id, the current team by default
+        if team_id is None:
+            team_id = self.cur_team['id']
+        return opponent_probabilities(self, team_id, state, **kwargs)
+
+    def draw_next_pot(self):
+        if self.draw_status != 'waiting_next_pot':
+            return
+        self.draw_status = 'waiting_draw'
+        self.draw_round += 1
+
+    def finish_draw(self):
+        if self.draw_status != 'waiting_done':
+            return
+        self.draw_status = 'done'
+
+    def run_full_draw(self):
+        # run the pot loop to the end without any interaction
+        while self.draw_status != 'done':
+            if self.draw_status == 'waiting_draw':
+                self.draw_team()
+            elif self.draw_status == 'waiting_select':
+                self.select_opponents()
+            elif self.draw_status == 'waiting_next_pot':
+                self.draw_next_pot()
+            elif self.draw_status == 'waiting_done':
+                self.finish_draw()
+        return self.cur_full_state
+
+    # snapshot methods
+
+    def snapshot(self):
+        # compact dict of the whole draw, restore() on an engine of the same teams continues it exactly
+        # the rng is reseeded from itself so its state fits in a seed, take snapshots between steps
+        rng_seed = self.rng.getrandbits(64)
+        self.rng.seed(rng_seed)
+        draw_status = self.draw_status
+        drawn_team_ids = list(self.drawn_team_ids)
+        draw_round = self.draw_round
+        if draw_status == 'selecting':
+            # a running selection is started again after a restore
+            draw_status = 'waiting_select'
+        elif draw_status == 'drawing':
+            draw_status, draw_round = self._settled_status(drawn_team_ids, draw_round)
+        return {
+            'version': SNAPSHOT_VERSION,
+            'teams': teams_digest(self.teams_data),
+            'solver': self.solver,
+            'round': draw_round,
+            'status': draw_status,
+            'drawn': drawn_team_ids,
+            'state': self.print_compressed_state(self.cur_state),
+            'newly_selected': list(self.newly_sel_team_ids),
+            'no_need_to_select': self.no_need_to_select,
+            'seed': rng_seed,
+        }
+
+    def _settled_status(self, drawn_team_ids, draw_round):
+        # (status, round) a draw_team caught half way ends in, so a snapshot never holds the transient drawing status
+        if len(drawn_team_ids) == draw_round:
+            # no team appended yet, or the round already advanced
+            return 'waiting_draw', draw_round
+        if -1 in self.cur_full_state[drawn_team_ids[-1]]:
+            return 'waiting_select', draw_round
+        if len(drawn_team_ids) % self.competition.pot_size:
+            return 'waiting_draw', draw_round + 1
+        if len(drawn_team_ids) == len(self.teams_data):
+            return 'waiting_done', draw_round
+        return 'waiting_next_pot', draw_round
+
+    def _check_progress(self, drawn_team_ids, full_state, draw_round, draw_status):
+        # raise ValueError unless the round and status are the ones the draw flow reaches with these drawn teams and opponents
+        pot_size = self.competition.pot_size
+        for idx, team_id in enumerate(drawn_team_ids):
+            if self.teams_id_map[team_id]['pot'] != idx // pot_size + 1:
+                raise ValueError(f"{self.teams_id_map[team_id]['name']} can not be drawn in round {idx}")
+            if idx + 1 < len(drawn_team_ids) and -1 in full_state[team_id]:
+                raise ValueError(f"{self.teams_id_map[team_id]['name']} was drawn before the last team without all its opponents")
+        drawn_num = len(drawn_team_ids)
+        if drawn_num == 0:
+            expected = [('waiting_draw', 0)]
+        elif -1 in full_state[drawn_team_ids[-1]]:
+            expected = [('waiting_select', drawn_num - 1)]
+        elif drawn_num % pot_size:
+            expected = [('waiting_draw', drawn_num)]
+        elif drawn_num == len(self.teams_data):
+            expected = [('waiting_done', drawn_num - 1), ('done', drawn_num - 1)]
+        else:
+            expected = [('waiting_next_pot', drawn_num - 1), ('waiting_draw', drawn_num)]
+        if (draw_status, draw_round) not in expected:
+            raise ValueError(f'Status {draw_status} in round {draw_round} does not fit {drawn_num} drawn teams')
+
+    def restore(self, snapshot):
+        # raise ValueError if the snapshot does not fit the teams, its round and status do not fit its drawn teams,
+        # or its state has no valid completion
+        check_snapshot(snapshot, self.teams_data)
+        state = self.parse_compressed_state(snapshot['state'])
+        self._check_progress(snapshot['drawn'], self.convert_full_state(state), snapshot['round'], snapshot['status'])
+        if self.check_state(state) is None:
+            raise ValueError('The state of the snapshot has no valid completion')
+        self.reset(seed=snapshot['seed'])
+        if snapshot['solver'] in SOLVERS:
+            self.solver = snapshot['solver']
+        self.draw_round = snapshot['round']
+        self.drawn_team_ids = list(snapshot['drawn'])
+        self.cur_state = state
+        self.cur_full_state = self.convert_full_state(state)
+        self.cur_team = self.teams_id_map[self.drawn_team_ids[-1]] if self.drawn_team_ids else None
+        self.draw_status = snapshot['status']
+        self.newly_sel_team_ids = list(snapshot['newly_selected'])
+        self.no_need_to_select = snapshot['no_need_to_select']
+
+    def replay(self, drawn_team_ids, state, upto=None):
+        # fast forward a recorded draw without searching: teams are drawn in the recorded order and take their recorded opponents
+        # with upto, stop once that many teams are drawn, before the selection of the last one
+        # a team whose recorded opponents are incomplete is left waiting for its selection
+        full_state = self.convert_full_state(state)
+        self.reset()
+        for idx, team_id in enumerate(drawn_team_ids[:upto]):
+            if self.draw_status == 'waiting_next_pot':
+                self.draw_next_pot()
+            self.draw_team(team_id)
+            if self.draw_status != 'waiting_select':
+                continue
+            opponent_ids = full_state[team_id]
+            if idx + 1 == upto or -1 in opponent_ids:
+                break
+            self._apply_opponents(opponent_ids)
+            self._advance_round()
+        return self.cur_full_state
+
+    def _advance_round(self):
+        if len(self.drawn_team_ids) % self.competition.pot_size == 0:
+            if len(self.drawn_team_ids) == len(self.teams_data):
+                self.draw_status = 'waiting_done'
+            else:
+                self.draw_status = 'waiting_next_pot'
+        else:
+            self.draw_round += 1
+            self.draw_status = 'waiting_draw'
+
+    # state methods
+
+    def convert_full_state(self, state):
+        if self.profiler is None:
+            return expand_compressed(self.team_index, state)
+        start_time = time.perf_counter()
+        full_state = expand_compressed(self.team_index, state)
+        self.profiler.add_time('decode', time.perf_counter() - start_time)
+        return full_state
+
+    def convert_compressed_state(self, full_state):
+        if self.profiler is None:
+            return compress_slots(self.team_index, full_state)
+        start_time = time.perf_counter()
+        state = compress_slots(self.team_index, full_state)
+        self.profiler.add_time('encode', time.perf_counter() - start_time)
+        return state
+
+    def _decode(self, state):
+        # DrawState of a compressed state, timed when profiling
+        if self.profiler is None:
+            return DrawState.from_compressed(self.team_index, state)
+        start_time = time.perf_counter()
+        draw_state = DrawState.from_compressed(self.team_index, state)
+        self.profiler.add_time('decode', time.perf_counter() - start_time)
+        return draw_state
+
+    def _encode(self, draw_state):
+        # compressed state of a DrawState, timed when profiling
+        if self.profiler is None:
+            return draw_state.to_compressed()
+        start_time = time.perf_counter()
+        state = draw_state.to_compressed()
+        self.profiler.add_time('encode', time.perf_counter() - start_time)
+        return state
+
+    def print_compressed_state(self, state):
+        return '-'.join([str(ord(char)) for char in state])
+
+    def parse_compressed_state(self, printed_state):
+        # inverse of print_compressed_state
+        return ''.join([chr(int(team_id)) for team_id in printed_state.split('-')]) if printed_state else ''
+
+    def autofill_state(self, state):
+        draw_state = DrawState.from_compressed(self.team_index, state)
+        if self._autofill(draw_state) is None:
+            return None
+        return draw_state.to_compressed()
+
+    def _autofill(self, draw_state):
+        if self.profiler is None:
+            filled = draw_state.autofill()
+        else:
+            start_time = time.perf_counter()
+            filled = draw_state.autofill()
+            self.profiler.add_time('autofill', time.perf_counter() - start_time)
+        if filled is None:
+            return None
+        if self.trace.full:
+            for team_id, match_idx, opponent_id in filled:
+                self.trace.add('full', 'autofill', team_id=team_id, match_idx=match_idx, opponent_id=opponent_id)
+        return filled
+
+    def gen_possible_state(self, cur_team, cur_state, match_idx, drawn_team_ids, shuffle=True, ranks=None):
+        # generate one possible combinations of opponents by dfs
+        # first generate a possible solution match by match, then repeat the whole routine for each other team
+        # to check if the solution is valid, we can check if the state is valid after all teams are processed
+        # return the compressed state if the solution is valid, otherwise return None
+        # with ranks from _slot_ranks, cur_team tries its candidates by rank instead of shuffling them
+        self.search_stats = new_search_stats()
+        draw_state = self._decode(cur_state)
+        try:
+            found = self._search(draw_state, cur_team['id'], match_idx, list(drawn_team_ids), shuffle, ranks)
+        finally:
+            self.search_stats['autofill_rounds'] += draw_state.autofill_rounds
+        if found:
+            result = self._encode(draw_state)
+            self.state_cache.put(cur_state, result)
+            return result
+        self.state_cache.put(cur_state)
+        return None
+
+    def check_state(self, state):
+        # return one valid completion of state, or None if it has none
+        # a cancel left over from a stopped selection must not interrupt this check
+        self.cancel_requested = False
+        found, witness = self.state_cache.get(state)
+        if found:
+            return witness
+        witness = None
+        draw_state = DrawState.from_compressed(self.team_index, state)
+        if self._autofill(draw_state) is not None:
+            witness = draw_state.to_compressed()
+            for team_id, row in enumerate(draw_state.slots):
+                if -1 in row:
+                    witness = self.gen_possible_state(self.teams_id_map[team_id], witness, 0, [team_id])
+                    break
+        self.state_cache.put(state, witness)
+        return witness
+
+    def _search(self, draw_state, cur_id, match_idx, drawn_team_ids, shuffle, ranks=None):
+        # depth first search updating draw_state in place, every failed branch is undone through the trail
+        # return True with the solution left in draw_state, otherwise False with draw_state untouched
+        # the search path is an explicit stack of branching slots, so memory grows with the assignments and not with python frames
+        # a frame is [team_id, match_idx, candidates, next candidate position, trail length, drawn team count, state key of the tried candidate,
+        # whether the team shuffles its candidates]
+        trace = self.trace
+        search_stats = self.search_stats
+        slot_num = self.team_index.slot_num
+        drawn_num = len(drawn_team_ids)
+        ranked_id = cur_id if ranks is not None else None
+        stack = []
+        # forward: walk from (cur_id, match_idx) to the next open slot, fail: the branch of the top frame failed, next: try its next candidate
+        mode = 'forward'
+        while True:
+            if mode == 'forward':
+                cur_team_opponents = draw_state.slots[cur_id]
+                if match_idx == slot_num:
+                    # reach the last match
+                    if trace.full:
+                        trace.add('full', 'team_done', team_id=cur_id, opponent_ids=cur_team_opponents.copy())
+                    if self.solver == 'mrv':
+                        # the opponents of the drawn team are fixed slot by slot above, which keeps the draw distribution
+                        # the rest is only a feasibility check, so the order of the other slots does not matter
+                        if self._complete_mrv(draw_state, len(stack)):
+                            return True
+                        mode = 'fail'
+                        continue
+                    # check next team for validity
+                    max_country_count = 0
+                    next_team_id = -1
+                    for i in range(len(self.teams_data)):
+                        if i not in drawn_team_ids:
+                            if self.team_country_counts[i] > max_country_count:
+                                max_country_count = self.team_country_counts[i]
+                                next_team_id = i
+                    if next_team_id == -1:
+                        # all teams are processed, solution is valid
+                        trace.add('full', 'solution')
+                        return True
+                    # at this point, we don't need to shuffle the order of teams in order to make full use of state caches
+                    drawn_team_ids.append(next_team_id)
+                    cur_id, match_idx, shuffle = next_team_id, 0, True
+                    continue
+                if trace.full:
+                    trace.add('full', 'search', team_id=cur_id, match_idx=match_idx, opponent_ids=cur_team_opponents.copy())
+                if cur_team_opponents[match_idx] != -1:
+                    match_idx += 1
+                    continue
+                available_team_ids = list(iter_bits(draw_state.candidates(cur_id, match_idx)))
+                if cur_id == ranked_id:
+                    available_team_ids.sort(key=ranks[match_idx].__getitem__)
+                elif shuffle:
+                    self.search_rng.shuffle(available_team_ids)
+                if trace.full:
+                    trace.add('full', 'candidates', team_id=cur_id, match_idx=match_idx, team_ids=available_team_ids.copy())
+                if len(available_team_ids) == 0:
+                    if trace.full:
+                        trace.add('full', 'deadend', team_id=cur_id, match_idx=match_idx, reason='No available team')
+                    mode = 'fail'
+                    continue
+                stack.append([cur_id, match_idx, available_team_ids, 0, len(draw_state.trail), len(drawn_team_ids), None, shuffle])
+                if len(stack) > search_stats['max_depth']:
+                    search_stats['max_depth'] = len(stack)
+                mode = 'next'
+            elif mode == 'fail':
+                if not stack:
+                    del drawn_team_ids[drawn_num:]
+                    return False
+                frame = stack[-1]
+                # a failed subtree proves the state has no completion whatever the search order, so dead ends are cached
+                self.state_cache.put(frame[6])
+                search_stats['backtracks'] += 1
+                draw_state.undo(frame[4])
+                del drawn_team_ids[frame[5]:]
+                mode = 'next'
+
+            frame = stack[-1]
+            team_id, frame_match_idx, available_team_ids, position, trail_len = frame[:5]
+            if position == len(available_team_ids):
+                if trace.full:
+                    trace.add('full', 'deadend', team_id=team_id, match_idx=frame_match_idx, reason='No valid team found')
+                stack.pop()
+                mode = 'fail'
+                continue
+            opponent_id = available_team_ids[position]
+            frame[3] = position + 1
+            search_stats['nodes'] += 1
+            self._check_interrupt()
+            if trace.full:
+                trace.add('full', 'try', team_id=team_id, match_idx=frame_match_idx, opponent_id=opponent_id)
+            draw_state.assign(team_id, frame_match_idx, opponent_id)
+            if self._autofill(draw_state) is None:
+                if trace.full:
+                    trace.add('full', 'deadend', team_id=team_id, match_idx=frame_match_idx, reason='Autofill reached a deadend')
+                draw_state.undo(trail_len)
+                continue
+            # found completions are not reused here, that would always give the same opponents for the same state
+            state_key = self._encode(draw_state)
+            found, witness = self.state_cache.get(state_key)
+            search_stats['cache_lookups'] += 1
+            if found and witness is None:
+                search_stats['cache_hits'] += 1
+                if trace.full:
+                    trace.add('full', 'deadend', team_id=team_id, match_idx=frame_match_idx, reason='State cache: known deadend')
+                search_stats['backtracks'] += 1
+                draw_state.undo(trail_len)
+                continue
+            frame[6] = state_key
+            cur_id, match_idx, shuffle = team_id, frame_match_idx + 1, frame[7]
+            mode = 'forward'
+
+    def _complete_mrv(self, draw_state, depth=0):
+        # a single randomized search order has a heavy tail, so restart with a new order and a doubled node limit
+        # dead ends proven before a restart stay in the state cache
+        trail_len = len(draw_state.trail)
+        node_limit = MRV_RESTART_NODES
+        while True:
+            self.node_limit = self.search_stats['nodes'] + node_limit
+            try:
+                return self._search_mrv(draw_state, depth)
+            except SearchLimitReached:
+                draw_state.undo(trail_len)
+                self.search_stats['restarts'] += 1
+                self.trace.add('full', 'restart', node_limit=node_limit)
+                node_limit *= 2
+            finally:
+                self.node_limit = None
+
+    def _search_mrv(self, draw_state, depth=0):
+        # complete draw_state by propagation, branching on the open slot with the fewest candidates
+        # autofill runs after every assignment so single candidates are forced and empty domains fail early
+        # an explicit stack like _search, a frame is [candidates, next candidate position, team_id, match_idx, trail length, state key]
+        search_stats = self.search_stats
+        stack = []
+        mode = 'forward'
+        while True:
+            if mode == 'forward':
+                team_id, match_idx, mask = draw_state.min_candidates_slot()
+                if team_id is None:
+                    self.trace.add('full', 'solution')
+                    return True
+                if mask == 0:
+                    mode = 'fail'
+                else:
+                    available_team_ids = list(iter_bits(mask))
+                    self.search_rng.shuffle(available_team_ids)
+                    if self.trace.full:
+                        self.trace.add('full', 'mrv_branch', team_id=team_id, match_idx=match_idx, candidate_num=len(available_team_ids))
+                    stack.append([available_team_ids, 0, team_id, match_idx, len(draw_state.trail), None])
+                    if depth + len(stack) > search_stats['max_depth']:
+                        search_stats['max_depth'] = depth + len(stack)
+            if mode == 'fail':
+                if not stack:
+                    return False
+                frame = stack[-1]
+                self.state_cache.put(frame[5])
+                search_stats['backtracks'] += 1
+                draw_state.undo(frame[4])
+
+            frame = stack[-1]
+            available_team_ids, position, team_id, match_idx, trail_len, _ = frame
+            if position == len(available_team_ids):
+                stack.pop()
+                mode = 'fail'
+                continue
+            opponent_id = available_team_ids[position]
+            frame[1] = position + 1
+            mode = 'next'
+            search_stats['nodes'] += 1
+            if self.node_limit is not None and search_stats['nodes'] > self.node_limit:
+                raise SearchLimitReached()
+            self._check_interrupt()
+            draw_state.assign(team_id, match_idx, opponent_id)
+            if self._autofill(draw_state) is not None:
+                state_key = self._encode(draw_state)
+                found, witness = self.state_cache.get(state_key)
+                search_stats['cache_lookups'] += 1
+                if found and witness is None:
+                    search_stats['cache_hits'] += 1
+                else:
+                    frame[5] = state_key
+                    mode = 'forward'
+                    continue
+            search_stats['backtracks'] += 1
+            draw_state.undo(trail_len)
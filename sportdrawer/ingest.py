@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import time
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+from .competition import TEAMS_FILE, load_format, convert_football_data_teams
+
+# ingestion of football-data.org teams into the teams schema of the engine
+# responses are kept in an on-disk cache and revalidated with ETag / If-Modified-Since,
+# the cache doubles as recorded fixtures: offline runs only read from it
+# only teams files whose format.json sets "source" to INGEST_SOURCE are written, hand-curated ones are never overwritten
+API_URL = 'https://api.football-data.org/v4'
+SECRET_FILE = '.streamlit/secrets.toml'
+TOKEN_ENV = 'FOOTBALL_DATA_KEY'
+INGEST_SOURCE = 'football-data.org'
+DEFAULT_CACHE_DIR = '.http_cache'
+DEFAULT_WORKERS = 4
+REQUEST_TIMEOUT = 30
+USER_AGENT = 'sport-drawer-ingest/1.0'
+# data directory prefix of football-data.org competition codes, other codes are lowercased
+COMPETITION_DIRS = {
+    'CL': 'ucl',
+    'EL': 'uel',
+}
+
+def load_token(secret_file=SECRET_FILE):
+    # api token from the environment, or from the streamlit secrets, None without any
+    if os.environ.get(TOKEN_ENV):
+        return os.environ[TOKEN_ENV]
+    if not os.path.exists(secret_file):
+        return None
+    with open(secret_file, 'rb') as f:
+        return tomllib.load(f).get('football_data_key')
+
+def new_session(workers=DEFAULT_WORKERS):
+    # one pooled session shared by every fetch, sized for the concurrent workers
+    try:
+        import requests
+        from requests.adapters import HTTPAdapter
+    except ImportError:
+        raise ImportError('requests is required to fetch from the api, use offline to read the cache only')
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+class HttpCache:
+    # one json file per url: the response body with its ETag and Last-Modified validators
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, url):
+        path = self.path(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put(self, url, body, etag=None, last_modified=None):
+        entry = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time(),
+            'body': body,
+        }
+        # written aside then renamed, so a concurrent or interrupted run never reads half a file
+        path = self.path(url)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return entry
+
+def fetch_json(session, cache, url, headers=None, offline=False):
+    # return (body, status), status is fetched, not_modified, or cached when offline
+    entry = cache.get(url)
+    if offline:
+        if entry is None:
+            raise LookupError(f'{url} is not in the cache')
+        return entry['body'], 'cached'
+    headers = dict(headers or {})
+    if entry is not None:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and entry is not None:
+        return entry['body'], 'not_modified'
+    response.raise_for_status()
+    body = response.json()
+    cache.put(url, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return body, 'fetched'
+
+def teams_url(base_url, competition, season):
+    return f'{base_url}/competitions/{competition}/teams?season={season}'
+
+def target_dir(data_dir, competition, season):
+    return os.path.join(data_dir, f'{COMPETITION_DIRS.get(competition, competition.lower())}_{season}')
+
+def write_teams(teams_file, teams_data):
+    # return whether the file changed, an unchanged file is left untouched
+    content = json.dumps(teams_data, indent=4, ensure_ascii=False)
+    if os.path.exists(teams_file):
+        with open(teams_file, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    with open(teams_file, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+def ingest_target(session, cache, competition, season, data_dir='data', base_url=API_URL, token=None, offline=False):
+    # fetch the teams of one season and normalize them into teams.json, with pots and country codes from its format.json
+    url = teams_url(base_url, competition, season)
+    output_dir = target_dir(data_dir, competition, season)
+    teams_file = os.path.join(output_dir, TEAMS_FILE)
+    result = {'competition': competition, 'season': season, 'url': url, 'teams_file': teams_file}
+    try:
+        draw_format = load_format(teams_file)
+        if draw_format.get('source') != INGEST_SOURCE:
+            raise ValueError(f'{teams_file} is not managed by ingest, its format.json needs "source": "{INGEST_SOURCE}" and the pots')
+        headers = {'X-Auth-Token': token} if token else None
+        data, result['fetch'] = fetch_json(session, cache, url, headers, offline)
+        teams_data = convert_football_data_teams(data, draw_format)
+        os.makedirs(output_dir, exist_ok=True)
+        result['status'] = 'updated' if write_teams(teams_file, teams_data) else 'unchanged'
+        result['team_num'] = len(teams_data)
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    return result
+
+def ingest(targets, data_dir='data', cache_dir=DEFAULT_CACHE_DIR, base_url=API_URL, token=None, workers=DEFAULT_WORKERS,
+           offline=False, session=None, on_result=None):
+    # ingest (competition, season) targets concurrently, return one result dict per target in order
+    cache = HttpCache(cache_dir)
+    if session is None and not offline:
+        session = new_session(workers)
+    base_url = base_url.rstrip('/')
+
+    def run(target):
+        competition, season = target
+        result = ingest_target(session, cache, competition, season, data_dir, base_url, token, offline)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(run, targets))
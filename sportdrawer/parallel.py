@@ -0,0 +1,218 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from .engine import DrawEngine, SearchInterrupted, new_search_stats
+from .competition import Competition, load_competition
+from .snapshot import teams_digest
+from .state import iter_bits
+
+# seconds between two checks of a waiting selection for its timeout, and of a worker search for its cancellation
+POLL_INTERVAL = 0.01
+
+_worker_engine = None
+# [generation, cutoff] of the running selection, a worker task (generation, idx) is only needed while idx <= cutoff
+_worker_cancel = None
+_worker_task = None
+_worker_lock = threading.Lock()
+
+def _init_worker(teams_data, key, draw_format, cancel):
+    global _worker_engine, _worker_cancel
+    _worker_engine = DrawEngine(Competition(teams_data, key=key, draw_format=draw_format), trace_level='off')
+    _worker_cancel = cancel
+    threading.Thread(target=_watch_cancel, daemon=True).start()
+
+def _is_cancelled(task):
+    generation, idx = task
+    with _worker_cancel.get_lock():
+        return _worker_cancel[0] != generation or idx > _worker_cancel[1]
+
+def _watch_cancel():
+    # cancel the running search once the selection no longer needs it
+    while True:
+        time.sleep(POLL_INTERVAL)
+        with _worker_lock:
+            if _worker_task is not None and _is_cancelled(_worker_task):
+                _worker_engine.cancel()
+
+def _complete_state(task, state, seed):
+    # search one completion of a state in any order, only its existence matters
+    # return (compressed completion or None for a dead end, search stats, reason of an interrupted search or None)
+    global _worker_task
+    engine = _worker_engine
+    with _worker_lock:
+        if _is_cancelled(task):
+            return None, new_search_stats(), 'cancelled'
+        _worker_task = task
+        engine.cancel_requested = False
+    engine.rng.seed(seed)
+    engine.search_stats = new_search_stats()
+    draw_state = engine._decode(state)
+    try:
+        found = engine._complete_mrv(draw_state)
+    except SearchInterrupted as e:
+        return None, dict(engine.search_stats), e.reason
+    finally:
+        engine.search_stats['autofill_rounds'] += draw_state.autofill_rounds
+        with _worker_lock:
+            _worker_task = None
+    completion = engine._encode(draw_state) if found else None
+    engine.state_cache.put(state, completion)
+    return completion, dict(engine.search_stats), None
+
+class ParallelSearch:
+    # speculative search of the drawn team's opponents over a pool of worker processes, for the heavy tail of late selections
+    # the sequential search fixes the slots of the drawn team one by one, each to the candidate of lowest random rank
+    # that still has a completion, so the opponent of every slot is uniform among its feasible ones
+    # here the candidates of a slot are checked at once, each by a worker searching a completion in any order with restarts,
+    # and the first one by rank with a completion is taken, the later ones are cancelled
+    # a later candidate found feasible first is never taken over an earlier one still searching: taking the fastest would
+    # favour the opponents that are quick to complete and bias the draw
+    # one selection runs at a time and uses the whole pool, close() stops the workers
+
+    def __init__(self, teams_file, workers=None):
+        competition = teams_file if isinstance(teams_file, Competition) else load_competition(teams_file)
+        self.competition = competition
+        self.workers = workers if workers is not None else os.cpu_count()
+        context = multiprocessing.get_context()
+        self.cancel = context.Array('q', 2)
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                            initargs=(competition.teams_data, competition.key, competition.draw_format, self.cancel))
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def check_teams(self, teams_data, draw_format):
+        # the workers search completions under the format of the competition they were started with
+        if teams_digest(self.competition.teams_data) != teams_digest(teams_data):
+            raise ValueError('The parallel search was started for other teams')
+        if self.competition.draw_format != draw_format:
+            raise ValueError('The parallel search was started for another draw format')
+
+    def _set_cutoff(self, generation, cutoff):
+        with self.cancel.get_lock():
+            self.cancel[0] = generation
+            self.cancel[1] = cutoff
+
+    def search(self, engine, cur_team, cur_state, drawn_team_ids, ranks):
+        # complete cur_state with opponents of cur_team drawn by ranks as gen_possible_state does, return the compressed state or None
+        # raise SearchInterrupted when the engine is cancelled or out of time, after stopping the workers
+        with self.lock:
+            engine.search_stats = new_search_stats()
+            engine.search_stats['speculative_tasks'] = 0
+            team_id = cur_team['id']
+            draw_state = engine._decode(cur_state)
+            row = draw_state.slots[team_id]
+            completion = None
+            while -1 in row:
+                match_idx = row.index(-1)
+                opponent_id, completion = self._first_feasible(engine, draw_state, team_id, match_idx, ranks[match_idx], completion)
+                if opponent_id is None:
+                    break
+                draw_state.assign(team_id, match_idx, opponent_id)
+                engine._autofill(draw_state)
+            else:
+                if completion is None:
+                    # nothing left to choose, only check the state has a completion
+                    result = self._race(engine, [engine._encode(draw_state)], {})
+                    completion = result[1] if result is not None else None
+            engine.search_stats['autofill_rounds'] += draw_state.autofill_rounds
+            engine.state_cache.put(cur_state, completion)
+            return completion
+
+    def _first_feasible(self, engine, draw_state, team_id, match_idx, rank, completion):
+        # (first candidate of the slot by rank with a completion, the completion), or (None, None) for a dead end
+        # completion is one of the current state, its opponent in the slot is known feasible and no later candidate is needed
+        search_stats = engine.search_stats
+        known_id = engine.convert_full_state(completion)[team_id][match_idx] if completion is not None else None
+        candidate_ids = list(iter_bits(draw_state.candidates(team_id, match_idx)))
+        candidate_ids.sort(key=rank.__getitem__)
+        trail_len = len(draw_state.trail)
+        opponent_ids, states, known = [], [], {}
+        for opponent_id in candidate_ids:
+            search_stats['nodes'] += 1
+            draw_state.assign(team_id, match_idx, opponent_id)
+            if engine._autofill(draw_state) is not None:
+                state_key = engine._encode(draw_state)
+                found, witness = engine.state_cache.get(state_key)
+                search_stats['cache_lookups'] += 1
+                if opponent_id == known_id:
+                    found, witness = True, completion
+                if found and witness is None:
+                    search_stats['cache_hits'] += 1
+                else:
+                    if found:
+                        known[len(states)] = witness
+                    opponent_ids.append(opponent_id)
+                    states.append(state_key)
+            draw_state.undo(trail_len)
+            if opponent_id == known_id:
+                break
+        result = self._race(engine, states, known)
+        if result is None:
+            return None, None
+        idx, completion = result
+        return opponent_ids[idx], completion
+
+    def _race(self, engine, states, known):
+        # check the states at once, known maps the index of a state to a completion found before
+        # return (index, completion) of the first state in order with a completion, or None when all are dead ends
+        search_stats = engine.search_stats
+        results = dict(known)
+        self.generation += 1
+        generation = self.generation
+        cutoff = min(known, default=len(states))
+        self._set_cutoff(generation, cutoff)
+        futures = {self.executor.submit(_complete_state, (generation, idx), state, engine.search_rng.getrandbits(64)): idx
+                   for idx, state in enumerate(states[:cutoff])}
+        search_stats['speculative_tasks'] += len(futures)
+        pending = set(futures)
+        next_idx = 0
+        try:
+            while True:
+                # the first state in order decides once every earlier one is a proven dead end
+                while next_idx in results and results[next_idx] is None:
+                    next_idx += 1
+                if next_idx == len(states):
+                    return None
+                if next_idx in results:
+                    return next_idx, results[next_idx]
+                engine._check_interrupt()
+                done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    idx = futures[future]
+                    completion, stats, interrupted = future.result()
+                    self._add_stats(search_stats, stats)
+                    if interrupted is not None:
+                        # only states after one with a completion are cancelled
+                        continue
+                    results[idx] = completion
+                    engine.state_cache.put(states[idx], completion)
+                    if completion is not None and idx < cutoff:
+                        cutoff = idx
+                        self._set_cutoff(generation, cutoff)
+                        for later, later_idx in futures.items():
+                            if later_idx > cutoff:
+                                later.cancel()
+        finally:
+            self._set_cutoff(generation, -1)
+            for future in futures:
+                future.cancel()
+
+    def _add_stats(self, search_stats, stats):
+        for key, value in stats.items():
+            if key == 'max_depth':
+                search_stats[key] = max(search_stats[key], value)
+            else:
+                search_stats[key] += value
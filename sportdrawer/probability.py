@@ -0,0 +1,197 @@
+import time
+from collections import Counter
+from .state import DrawState, iter_bits
+
+# feasibility checks allowed for the exact computation before falling back to sampling
+MAX_EXACT_CHECKS = 100
+# sampled selections used when the exact computation is too big, sampling stops early when out of time
+SAMPLE_NUM = 200
+MIN_SAMPLE_NUM = 20
+SAMPLE_TIME_BUDGET = 1.0
+# completions kept to prove feasibility without searching
+MAX_WITNESS_NUM = 500
+
+class ExactBudgetExceeded(Exception):
+    pass
+
+class FeasibilityChecker:
+    # answers whether a draw state still has a valid completion
+    # every completion found is kept as a bitmask of matches, a state whose matches are all in one of them is feasible
+
+    def __init__(self, engine, max_witness_num=MAX_WITNESS_NUM):
+        self.engine = engine
+        self.max_witness_num = max_witness_num
+        self.witnesses = []
+        self.checks = 0
+        self.searches = 0
+
+    def match_mask(self, draw_state):
+        team_index = self.engine.team_index
+        team_num = team_index.team_num
+        mask = 0
+        for team_id1, row in enumerate(draw_state.slots):
+            for match_idx in team_index.pair_slots:
+                if row[match_idx] != -1:
+                    mask |= 1 << (team_id1 * team_num + row[match_idx])
+        return mask
+
+    def is_feasible(self, draw_state):
+        self.checks += 1
+        mask = self.match_mask(draw_state)
+        for witness in self.witnesses:
+            if mask & ~witness == 0:
+                return True
+        engine = self.engine
+        state_key = draw_state.to_compressed()
+        found, witness = engine.state_cache.get(state_key)
+        if found and witness is None:
+            return False
+        self.searches += 1
+        trail_len = len(draw_state.trail)
+        if engine._autofill(draw_state) is not None and engine._complete_mrv(draw_state):
+            self.witnesses.append(self.match_mask(draw_state))
+            if len(self.witnesses) > self.max_witness_num:
+                self.witnesses.pop(0)
+            draw_state.undo(trail_len)
+            return True
+        draw_state.undo(trail_len)
+        engine.state_cache.put(state_key)
+        return False
+
+    def feasible_candidates(self, draw_state, team_id, match_idx, budget=None):
+        trail_len = len(draw_state.trail)
+        feasible_team_ids = []
+        for opponent_id in iter_bits(draw_state.candidates(team_id, match_idx)):
+            if budget is not None:
+                if budget['checks'] <= 0:
+                    raise ExactBudgetExceeded()
+                budget['checks'] -= 1
+            draw_state.assign(team_id, match_idx, opponent_id)
+            if self.is_feasible(draw_state):
+                feasible_team_ids.append(opponent_id)
+            draw_state.undo(trail_len)
+        return feasible_team_ids
+
+def opponent_probabilities(engine, team_id, state=None, max_exact_checks=MAX_EXACT_CHECKS, sample_num=SAMPLE_NUM, time_budget=SAMPLE_TIME_BUDGET,
+                           seed=None, timeout=None):
+    # probability of each opponent in each slot of team_id, following the selection procedure:
+    # slot by slot, every opponent that still leaves a valid completion is equally likely
+    # return (list of slot_num {opponent_id: probability} dicts, whether the result is exact), or (None, True) for a dead end
+    # raise SearchInterrupted when not done within timeout seconds
+    if state is None:
+        state = engine.cur_state
+    # results are kept on the competition so every engine on the same teams data reuses them
+    cache = engine.competition.probability_cache
+    cache_key = chr(team_id) + state
+    found, result = cache.get(cache_key)
+    if found:
+        return result
+    # a forked engine keeps the rng and trace of the draw untouched, mrv is the fastest feasibility check
+    worker = engine.fork(seed=seed, solver='mrv')
+    worker.cancel_requested = False
+    worker.deadline = time.perf_counter() + timeout if timeout is not None else None
+    checker = FeasibilityChecker(worker)
+    draw_state = DrawState.from_compressed(worker.team_index, state)
+    if not checker.is_feasible(draw_state):
+        result = (None, True)
+    elif estimate_tree_size(draw_state, team_id) > max_exact_checks:
+        result = (_sampled_probabilities(checker, draw_state, team_id, sample_num, time_budget), False)
+    else:
+        try:
+            budget = {'checks': max_exact_checks}
+            result = (_exact_probabilities(checker, draw_state, team_id, {}, budget), True)
+        except ExactBudgetExceeded:
+            draw_state.undo()
+            result = (_sampled_probabilities(checker, draw_state, team_id, sample_num, time_budget), False)
+    cache.put(cache_key, result)
+    return result
+
+def estimate_tree_size(draw_state, team_id):
+    # upper bound of the feasibility checks needed by the exact computation
+    size = 1
+    for match_idx, opponent_id in enumerate(draw_state.slots[team_id]):
+        if opponent_id == -1:
+            size *= max(draw_state.candidates(team_id, match_idx).bit_count(), 1)
+    return size
+
+def _exact_probabilities(checker, draw_state, team_id, memo, budget):
+    row = draw_state.slots[team_id]
+    if -1 not in row:
+        return [{opponent_id: 1.0} for opponent_id in row]
+    state_key = draw_state.to_compressed()
+    if state_key in memo:
+        return memo[state_key]
+    match_idx = row.index(-1)
+    trail_len = len(draw_state.trail)
+    feasible_team_ids = checker.feasible_candidates(draw_state, team_id, match_idx, budget)
+    probabilities = [Counter() for _ in row]
+    for opponent_id in feasible_team_ids:
+        draw_state.assign(team_id, match_idx, opponent_id)
+        checker.engine._autofill(draw_state)
+        sub_probabilities = _exact_probabilities(checker, draw_state, team_id, memo, budget)
+        draw_state.undo(trail_len)
+        for slot, sub_slot in zip(probabilities, sub_probabilities):
+            for sub_id, prob in sub_slot.items():
+                slot[sub_id] += prob / len(feasible_team_ids)
+    probabilities = [dict(slot) for slot in probabilities]
+    memo[state_key] = probabilities
+    return probabilities
+
+def _sampled_probabilities(checker, draw_state, team_id, sample_num, time_budget):
+    # estimate by repeating the procedure: for each open slot, the first feasible opponent in a shuffled order
+    counts = [Counter() for _ in draw_state.slots[team_id]]
+    start_time = time.perf_counter()
+    for sample_idx in range(sample_num):
+        if sample_idx >= MIN_SAMPLE_NUM and time.perf_counter() - start_time > time_budget:
+            sample_num = sample_idx
+            break
+        for match_idx, opponent_id in enumerate(_sample_opponents(checker, draw_state, team_id)):
+            counts[match_idx][opponent_id] += 1
+    return [{opponent_id: count / sample_num for opponent_id, count in slot.items()} for slot in counts]
+
+def _sample_opponents(checker, draw_state, team_id):
+    # first take, for every slot, the first opponent of a shuffled order that passes autofill, then check the whole row once
+    # if the row is feasible every prefix is too, so the procedure would have taken exactly these opponents
+    # otherwise replay the procedure slot by slot, reusing the same orders while the choices are unchanged
+    rng = checker.engine.rng
+    row = draw_state.slots[team_id]
+    orders = {}
+    choices = []
+    for match_idx in range(len(row)):
+        if row[match_idx] != -1:
+            continue
+        available_team_ids = list(iter_bits(draw_state.candidates(team_id, match_idx)))
+        rng.shuffle(available_team_ids)
+        orders[match_idx] = available_team_ids
+        for opponent_id in available_team_ids:
+            trail_len = len(draw_state.trail)
+            draw_state.assign(team_id, match_idx, opponent_id)
+            if checker.engine._autofill(draw_state) is not None:
+                choices.append((match_idx, opponent_id))
+                break
+            draw_state.undo(trail_len)
+    if -1 not in row and checker.is_feasible(draw_state):
+        opponent_ids = row.copy()
+        draw_state.undo()
+        return opponent_ids
+    draw_state.undo()
+    replaying = True
+    for match_idx in range(len(row)):
+        if row[match_idx] != -1:
+            continue
+        if replaying and match_idx in orders:
+            available_team_ids = orders[match_idx]
+        else:
+            available_team_ids = list(iter_bits(draw_state.candidates(team_id, match_idx)))
+            rng.shuffle(available_team_ids)
+        for opponent_id in available_team_ids:
+            trail_len = len(draw_state.trail)
+            draw_state.assign(team_id, match_idx, opponent_id)
+            if checker.is_feasible(draw_state):
+                checker.engine._autofill(draw_state)
+                replaying = replaying and (match_idx, opponent_id) in choices
+                break
+            draw_state.undo(trail_len)
+    opponent_ids = row.copy()
+    draw_state.undo()
+    return opponent_ids
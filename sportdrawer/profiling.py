@@ -0,0 +1,141 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from collections import deque
+from .engine import DrawEngine
+from .cache import StateCache
+from .simulate import draw_seed
+
+# per-selection solver metrics, kept in memory for the UI and appended as json lines to an optional log
+# times split a selection into autofill, encode (slots to compressed state), decode (compressed state to slots) and the rest of the search
+METRICS_LOG_ENV = 'SPORTDRAWER_METRICS_LOG'
+PHASES = ['autofill', 'encode', 'decode']
+DEFAULT_METRICS_SIZE = 200
+# functions of a selection profile kept in its metrics, by cumulative time
+DEFAULT_PROFILE_TOP = 15
+
+# one lock per log file, sessions of a server may share it
+_log_locks = {}
+_log_locks_lock = threading.Lock()
+
+def _log_lock(path):
+    with _log_locks_lock:
+        if path not in _log_locks:
+            _log_locks[path] = threading.Lock()
+        return _log_locks[path]
+
+def top_functions(stats, top=DEFAULT_PROFILE_TOP):
+    # the functions of a pstats.Stats with the largest cumulative time, as json friendly dicts
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({'function': f'{filename}:{line}({name})', 'calls': calls, 'tottime': tottime, 'cumtime': cumtime})
+    rows.sort(key=lambda row: row['cumtime'], reverse=True)
+    return rows[:top]
+
+class Profiler:
+    # opt-in instrumentation of the selections of an engine: DrawEngine(..., profiler=Profiler())
+    # timings are per thread, so only the selection running on the thread that started it is measured
+    # with cprofile every selection also runs under cProfile, its top functions go to the metrics and all are aggregated
+
+    def __init__(self, log_file=None, cprofile=False, max_size=DEFAULT_METRICS_SIZE, profile_top=DEFAULT_PROFILE_TOP):
+        self.log_file = log_file
+        self.cprofile = cprofile
+        self.profile_top = profile_top
+        self.metrics = deque(maxlen=max_size)
+        self.stats = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def start_selection(self):
+        self.local.timings = dict.fromkeys(PHASES, 0.0)
+        self.local.profile = None
+        if self.cprofile:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self.local.profile = profile
+            except ValueError:
+                # another profiler is already active, the selection is only timed
+                pass
+        self.local.start_time = time.perf_counter()
+
+    def add_time(self, phase, seconds):
+        timings = getattr(self.local, 'timings', None)
+        if timings is not None:
+            timings[phase] += seconds
+
+    def finish_selection(self, engine, status):
+        # record the metrics of the selection engine just ran, return them
+        elapsed = time.perf_counter() - self.local.start_time
+        profile = self.local.profile
+        timings = self.local.timings
+        self.local.timings = None
+        metrics = {
+            'time': time.time(),
+            'team_id': engine.cur_team['id'],
+            'drawn': len(engine.drawn_team_ids),
+            'solver': engine.solver,
+            'status': status,
+            'elapsed': elapsed,
+            **{f'{phase}_time': timings[phase] for phase in PHASES},
+            'search_time': elapsed - sum(timings.values()),
+            **engine.search_stats,
+        }
+        if profile is not None:
+            profile.disable()
+            stats = pstats.Stats(profile)
+            metrics['profile'] = top_functions(stats, self.profile_top)
+        with self.lock:
+            self.metrics.append(metrics)
+            if profile is not None:
+                if self.stats is None:
+                    self.stats = stats
+                else:
+                    self.stats.add(profile)
+        if self.log_file is not None:
+            line = json.dumps(metrics) + '\n'
+            with _log_lock(self.log_file):
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(line)
+        return metrics
+
+    @property
+    def last(self):
+        return self.metrics[-1] if self.metrics else None
+
+    def summary(self):
+        # totals over the recorded selections
+        with self.lock:
+            metrics = list(self.metrics)
+        totals = {'selections': len(metrics)}
+        for key in ['elapsed', 'search_time'] + [f'{phase}_time' for phase in PHASES] + ['nodes', 'backtracks', 'restarts', 'cache_hits']:
+            totals[key] = sum(selection.get(key, 0) for selection in metrics)
+        totals['max_depth'] = max((selection.get('max_depth', 0) for selection in metrics), default=0)
+        return totals
+
+    def profile_text(self, lines=30, sort='cumulative'):
+        # aggregated cProfile report of every profiled selection, None without any
+        with self.lock:
+            if self.stats is None:
+                return None
+            output = io.StringIO()
+            self.stats.stream = output
+            self.stats.sort_stats(sort).print_stats(lines)
+        return output.getvalue()
+
+def profile_draws(competition, draw_num, profiler, seed=0, solver='mrv', on_draw=None):
+    # run seeded full draws with every selection recorded by profiler, on a fresh state cache like the benchmark
+    engine = DrawEngine(competition, solver=solver, trace_level='off', state_cache=StateCache(), profiler=profiler)
+    for draw_idx in range(draw_num):
+        engine.reset(seed=draw_seed(seed, draw_idx))
+        engine.run_full_draw()
+        if on_draw is not None:
+            on_draw(draw_idx)
+    return profiler.summary()
+
+def load_metrics_log(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
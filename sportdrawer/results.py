@@ -0,0 +1,89 @@
+import os
+import struct
+
+# draws file layout, little endian:
+# header: magic, format version, team number, slot number, value size, padded to 16 bytes
+# records: draw index as uint32, then the full state as team_num*slot_num opponent ids (-1 for an open slot)
+# ids are int8 up to 127 teams, int16 up to 32767 and int32 above
+MAGIC = b'SDRW'
+VERSION = 2
+HEADER = struct.Struct('<4sHHHB5x')
+VALUE_FORMATS = {1: 'b', 2: 'h', 4: 'i'}
+
+def value_size(team_num):
+    if team_num <= 0x7f:
+        return 1
+    if team_num <= 0x7fff:
+        return 2
+    return 4
+
+def record_size(team_num, slot_num=8):
+    return 4 + team_num * slot_num * value_size(team_num)
+
+def read_header(f):
+    magic, version, team_num, slot_num, size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a draws file')
+    if version != VERSION:
+        raise ValueError(f'Unsupported draws file version {version}')
+    if size != value_size(team_num):
+        raise ValueError(f'Unsupported value size {size} for {team_num} teams')
+    return team_num, slot_num
+
+class DrawWriter:
+    # appends fixed width draw records to a draws file, writing the header when the file is new
+
+    def __init__(self, path, team_num, slot_num=8):
+        self.team_num = team_num
+        self.slot_num = slot_num
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                if read_header(f) != (team_num, slot_num):
+                    raise ValueError(f'{path} holds draws of a different format')
+            self.f = open(path, 'ab')
+        else:
+            self.f = open(path, 'wb')
+            self.f.write(HEADER.pack(MAGIC, VERSION, team_num, slot_num, value_size(team_num)))
+        self.record = struct.Struct(f'<I{team_num * slot_num}{VALUE_FORMATS[value_size(team_num)]}')
+
+    def write(self, draw_idx, full_state):
+        self.f.write(self.record.pack(draw_idx, *[opponent_id for row in full_state for opponent_id in row]))
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def iter_draws_file(path):
+    # yield (draw_idx, full state) without numpy
+    with open(path, 'rb') as f:
+        team_num, slot_num = read_header(f)
+        size = record_size(team_num, slot_num)
+        while True:
+            record = f.read(size)
+            if len(record) < size:
+                return
+            draw_idx, = struct.unpack_from('<I', record)
+            values = struct.unpack_from(f'<{team_num * slot_num}{VALUE_FORMATS[value_size(team_num)]}', record, 4)
+            yield draw_idx, [list(values[i:i+slot_num]) for i in range(0, len(values), slot_num)]
+
+def load_draws(path, mmap=True):
+    # return (draw indexes, states) as numpy arrays of shapes (n,) and (n, team_num, slot_num)
+    # with mmap the arrays are views of the file, nothing is read until used
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError('numpy is required to load draws as arrays, use iter_draws_file otherwise')
+    with open(path, 'rb') as f:
+        team_num, slot_num = read_header(f)
+    dtype = np.dtype([('idx', '<u4'), ('state', f'<i{value_size(team_num)}', (team_num, slot_num))])
+    draw_num = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+    if mmap:
+        records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER.size, shape=(draw_num,))
+    else:
+        records = np.fromfile(path, dtype=dtype, count=draw_num, offset=HEADER.size)
+    return records['idx'], records['state']
@@ -0,0 +1,99 @@
+import json
+import time
+from multiprocessing import Pool
+from .engine import DrawEngine
+
+DEFAULT_TEAMS_FILE = './data/ucl_2024/teams.json'
+# draws handed to a worker at once, results are streamed back chunk by chunk
+CHUNK_SIZE = 100
+# finished draws between two progress reports
+PROGRESS_EVERY = 1000
+
+def draw_seed(seed, draw_idx):
+    # every draw gets its own seed, so results do not depend on the number of workers or the chunking
+    return f'{seed}:{draw_idx}'
+
+# one engine per worker process, built once by the pool initializer
+# its state cache fills up over the draws of the worker, which only speeds the later draws up and never changes them
+_worker_engine = None
+
+def _init_worker(teams_file, solver):
+    global _worker_engine
+    _worker_engine = DrawEngine(teams_file, solver=solver, trace_level='off')
+
+def _simulate_chunk(args):
+    seed, start_idx, draw_num = args
+    engine = _worker_engine
+    states = []
+    for draw_idx in range(start_idx, start_idx + draw_num):
+        engine.reset(seed=draw_seed(seed, draw_idx))
+        engine.run_full_draw()
+        states.append(engine.cur_state)
+    return start_idx, states
+
+def iter_draws(teams_file, draw_num, seed=0, workers=1, solver='mrv', chunk_size=CHUNK_SIZE):
+    # yield (draw_idx, compressed state) of finished draws as they come back from the workers
+    chunk_size = max(1, min(chunk_size, -(-draw_num // workers)))
+    chunks = [(seed, start_idx, min(chunk_size, draw_num - start_idx)) for start_idx in range(0, draw_num, chunk_size)]
+    if workers <= 1:
+        _init_worker(teams_file, solver)
+        results = map(_simulate_chunk, chunks)
+        for start_idx, states in results:
+            for offset, state in enumerate(states):
+                yield start_idx + offset, state
+        return
+    with Pool(workers, initializer=_init_worker, initargs=(teams_file, solver)) as pool:
+        for start_idx, states in pool.imap_unordered(_simulate_chunk, chunks):
+            for offset, state in enumerate(states):
+                yield start_idx + offset, state
+
+class DrawStats:
+    # running aggregates of finished draws
+    # pair_counts[i][j]: draws in which team i meets team j
+    # slot_counts[i][match_idx][j]: draws in which team i meets team j at match_idx
+
+    def __init__(self, engine):
+        self.engine = engine
+        team_num = len(engine.teams_data)
+        self.draw_num = 0
+        self.pair_counts = [[0] * team_num for _ in range(team_num)]
+        self.slot_counts = [[[0] * team_num for _ in range(engine.team_index.slot_num)] for _ in range(team_num)]
+
+    def add(self, state):
+        self.draw_num += 1
+        full_state = self.engine.convert_full_state(state)
+        for team_id, row in enumerate(full_state):
+            for match_idx, opponent_id in enumerate(row):
+                self.pair_counts[team_id][opponent_id] += 1
+                self.slot_counts[team_id][match_idx][opponent_id] += 1
+
+    def pair_frequencies(self):
+        return [[count / self.draw_num for count in row] for row in self.pair_counts]
+
+    def to_dict(self):
+        return {
+            'draw_num': self.draw_num,
+            'teams': [team['name'] for team in self.engine.teams_data],
+            'pair_counts': self.pair_counts,
+            'slot_counts': self.slot_counts,
+        }
+
+    def top_pairs(self, top_num=10):
+        pairs = [(count, team_id1, team_id2) for team_id1, row in enumerate(self.pair_counts) for team_id2, count in enumerate(row) if team_id1 < team_id2]
+        pairs = sorted(pairs, reverse=True)[:top_num]
+        return [(self.engine.teams_id_map[team_id1]['name'], self.engine.teams_id_map[team_id2]['name'], count / self.draw_num) for count, team_id1, team_id2 in pairs]
+
+def simulate(teams_file, draw_num, seed=0, workers=1, solver='mrv', output=None, on_draw=None, on_progress=None):
+    # on_progress(finished draw number, elapsed seconds) is called every PROGRESS_EVERY draws
+    stats = DrawStats(DrawEngine(teams_file))
+    start_time = time.perf_counter()
+    for draw_idx, state in iter_draws(teams_file, draw_num, seed=seed, workers=workers, solver=solver):
+        stats.add(state)
+        if on_draw is not None:
+            on_draw(draw_idx, state)
+        if on_progress is not None and stats.draw_num % PROGRESS_EVERY == 0:
+            on_progress(stats.draw_num, time.perf_counter() - start_time)
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(stats.to_dict(), f)
+    return stats
@@ -0,0 +1,49 @@
+import base64
+import hashlib
+import json
+import zlib
+
+# a snapshot is a small json dict holding a whole draw: drawn teams in order, compressed state, round, status, rng seed
+# and the newly selected teams and skipped selection of the current team shown by the UI
+# encoded snapshots are deflated json in url-safe base64, short enough for a url parameter
+SNAPSHOT_VERSION = 1
+SNAPSHOT_STATUSES = ['waiting_draw', 'waiting_select', 'waiting_next_pot', 'waiting_done', 'done']
+
+def teams_digest(teams_data):
+    # short fingerprint of the teams, so a snapshot is never restored on other teams
+    return hashlib.sha1('\n'.join(team['name'] for team in teams_data).encode('utf-8')).hexdigest()[:12]
+
+def check_snapshot(snapshot, teams_data):
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {snapshot.get('version')}")
+    if snapshot.get('teams') != teams_digest(teams_data):
+        raise ValueError('The snapshot was taken on other teams')
+    if snapshot.get('status') not in SNAPSHOT_STATUSES:
+        raise ValueError(f"Unknown draw status {snapshot.get('status')}")
+    team_num = len(teams_data)
+    if any(not 0 <= team_id < team_num for team_id in snapshot['drawn']) or len(set(snapshot['drawn'])) != len(snapshot['drawn']):
+        raise ValueError('Invalid drawn teams in the snapshot')
+    if any(not 0 <= team_id < team_num for team_id in snapshot['newly_selected']):
+        raise ValueError('Invalid newly selected teams in the snapshot')
+
+def encode_snapshot(snapshot):
+    data = zlib.compress(json.dumps(snapshot, separators=(',', ':')).encode('utf-8'), 9)
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_snapshot(text):
+    try:
+        data = base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+        return json.loads(zlib.decompress(data))
+    except (ValueError, zlib.error) as e:
+        raise ValueError(f'Invalid snapshot: {e}')
+
+def save_snapshot(snapshot, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+
+def load_snapshot(path_or_text):
+    # a snapshot file, or an encoded snapshot as found in a url
+    if path_or_text.endswith('.json'):
+        with open(path_or_text, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return decode_snapshot(path_or_text)
@@ -0,0 +1,231 @@
+# teams are encoded as one character each in compressed states, ids must stay below the utf-16 surrogates
+MAX_TEAM_NUM = 0xD800
+
+class TeamIndex:
+    # per-process index of the teams, shared by every draw state built on the same teams data
+    # teams are referred to by id, sets of teams are int bitmasks with bit i for team i
+    # each team has matches_per_pot slots against every pot: home then away with 2, a single slot with 1
+    # with 1 the venues are not drawn and nothing limits the home or away matches of a team
+
+    def __init__(self, teams_data, matches_per_pot=2, max_per_country=2):
+        if len(teams_data) > MAX_TEAM_NUM:
+            raise ValueError(f'At most {MAX_TEAM_NUM} teams are supported')
+        if matches_per_pot not in (1, 2):
+            raise ValueError(f'Unsupported matches per pot {matches_per_pot}, available: 1 or 2')
+        self.team_num = len(teams_data)
+        self.matches_per_pot = matches_per_pot
+        self.max_per_country = max_per_country
+        # 0-based pot of each team
+        self.pots = [team['pot'] - 1 for team in teams_data]
+        self.pot_num = max(self.pots) + 1
+        country_names = sorted(set(team['country'] for team in teams_data))
+        self.country_names = country_names
+        self.countries = [country_names.index(team['country']) for team in teams_data]
+        self.pot_masks = [0] * self.pot_num
+        for team_id, pot in enumerate(self.pots):
+            self.pot_masks[pot] |= 1 << team_id
+        self.country_masks = [0] * len(country_names)
+        for team_id, country in enumerate(self.countries):
+            self.country_masks[country] |= 1 << team_id
+        # team ids of each pot, the candidate list of every slot against that pot
+        self.pot_team_ids = [list(iter_bits(pot_mask)) for pot_mask in self.pot_masks]
+        # teams a team can never meet, its own country including itself
+        self.conflict_masks = [self.country_masks[country] for country in self.countries]
+        self.slot_num = self.pot_num * matches_per_pot
+        # with home and away slots, a match is taken on the opposite side by the opponent
+        self.home_away = matches_per_pot == 2
+        # candidates of each slot before any match, and its offset in the slots of the opponent against our pot
+        self.slot_pot_masks = [self.pot_masks[match_idx // matches_per_pot] for match_idx in range(self.slot_num)]
+        self.reverse_offsets = [1 - match_idx % 2 if self.home_away else 0 for match_idx in range(self.slot_num)]
+        # slots holding each match once in compressed states: home slots, or every slot when the venue is not drawn
+        self.pair_slots = list(range(0, self.slot_num, matches_per_pot))
+
+    def reverse_slot(self, team_id, match_idx):
+        # slot taken on the opponent side by a match of team_id at match_idx
+        return self.pots[team_id] * self.matches_per_pot + self.reverse_offsets[match_idx]
+
+    def match_slot(self, opponent_id):
+        # slot holding a match recorded as a pair in compressed states, the home slot against the pot of opponent_id
+        return self.pots[opponent_id] * self.matches_per_pot
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def compress_slots(index, slots):
+    # every match once as the characters of its two team ids, pairs sorted so equal states give equal strings
+    state_chunks = []
+    for team_id1, row in enumerate(slots):
+        for match_idx in index.pair_slots:
+            team_id2 = row[match_idx]
+            if team_id2 != -1 and (index.home_away or team_id1 < team_id2):
+                state_chunks.append(chr(team_id1) + chr(team_id2))
+    state_chunks = sorted(state_chunks)
+    return ''.join(state_chunks)
+
+def expand_compressed(index, state):
+    # full state of a compressed state, team_num rows of slot_num opponent ids with -1 for an open slot
+    full_state = [([-1] * index.slot_num) for _ in range(index.team_num)]
+    for i in range(0, len(state), 2):
+        team_id1 = ord(state[i])
+        team_id2 = ord(state[i+1])
+        match_idx = index.match_slot(team_id2)
+        full_state[team_id1][match_idx] = team_id2
+        full_state[team_id2][index.reverse_slot(team_id1, match_idx)] = team_id1
+    return full_state
+
+class DrawState:
+    # mutable draw state updated in place, every assignment is pushed on a trail so it can be undone
+    # slots follow the full state layout: home vs pot 1, away vs pot 1, home vs pot 2, away vs pot 2, ...
+    # or one slot per pot when the competition does not draw venues
+
+    def __init__(self, index):
+        self.index = index
+        team_num = index.team_num
+        self.slots = [([-1] * index.slot_num) for _ in range(team_num)]
+        # teams already met by each team
+        self.opp_masks = [0] * team_num
+        # opponents count per country for each team
+        self.country_counts = [[0] * len(index.country_masks) for _ in range(team_num)]
+        # teams a team can no longer meet because of countries, its own country is always blocked
+        self.blocked_masks = index.conflict_masks.copy()
+        # teams that already have the maximum number of opponents from a country
+        self.full_country_masks = [0] * len(index.country_masks)
+        # teams whose slot is still free
+        self.free_masks = [(1 << team_num) - 1 for _ in range(index.slot_num)]
+        self.trail = []
+        # passes made by autofill over all the slots
+        self.autofill_rounds = 0
+
+    @classmethod
+    def from_compressed(cls, index, state):
+        draw_state = cls(index)
+        for i in range(0, len(state), 2):
+            team_id1 = ord(state[i])
+            team_id2 = ord(state[i+1])
+            draw_state.assign(team_id1, index.match_slot(team_id2), team_id2)
+        draw_state.trail = []
+        return draw_state
+
+    def to_compressed(self):
+        return compress_slots(self.index, self.slots)
+
+    def to_full_state(self):
+        return [row.copy() for row in self.slots]
+
+    def reverse_slot(self, team_id, match_idx):
+        # slot taken on the opponent side by a match of team_id at match_idx
+        return self.index.reverse_slot(team_id, match_idx)
+
+    def candidates(self, team_id, match_idx):
+        index = self.index
+        if self.slots[team_id][match_idx] != -1:
+            return 0
+        return index.slot_pot_masks[match_idx] \
+            & self.free_masks[self.reverse_slot(team_id, match_idx)] \
+            & ~self.blocked_masks[team_id] \
+            & ~self.opp_masks[team_id] \
+            & ~self.full_country_masks[index.countries[team_id]]
+
+    def assign(self, team_id, match_idx, opponent_id):
+        reverse_idx = self.reverse_slot(team_id, match_idx)
+        self.slots[team_id][match_idx] = opponent_id
+        self.slots[opponent_id][reverse_idx] = team_id
+        self.free_masks[match_idx] &= ~(1 << team_id)
+        self.free_masks[reverse_idx] &= ~(1 << opponent_id)
+        self.opp_masks[team_id] |= 1 << opponent_id
+        self.opp_masks[opponent_id] |= 1 << team_id
+        self._count_country(team_id, self.index.countries[opponent_id], 1)
+        self._count_country(opponent_id, self.index.countries[team_id], 1)
+        self.trail.append((team_id, match_idx, opponent_id))
+
+    def undo(self, trail_len=0):
+        # revert assignments until the trail is back to trail_len
+        countries = self.index.countries
+        while len(self.trail) > trail_len:
+            team_id, match_idx, opponent_id = self.trail.pop()
+            reverse_idx = self.reverse_slot(team_id, match_idx)
+            self.slots[team_id][match_idx] = -1
+            self.slots[opponent_id][reverse_idx] = -1
+            self.free_masks[match_idx] |= 1 << team_id
+            self.free_masks[reverse_idx] |= 1 << opponent_id
+            self.opp_masks[team_id] &= ~(1 << opponent_id)
+            self.opp_masks[opponent_id] &= ~(1 << team_id)
+            self._count_country(team_id, countries[opponent_id], -1)
+            self._count_country(opponent_id, countries[team_id], -1)
+
+    def _count_country(self, team_id, country, delta):
+        index = self.index
+        counts = self.country_counts[team_id]
+        counts[country] += delta
+        if delta > 0 and counts[country] == index.max_per_country:
+            self.blocked_masks[team_id] |= index.country_masks[country]
+            self.full_country_masks[country] |= 1 << team_id
+        elif delta < 0 and counts[country] == index.max_per_country - 1:
+            if country != index.countries[team_id]:
+                self.blocked_masks[team_id] &= ~index.country_masks[country]
+            self.full_country_masks[country] &= ~(1 << team_id)
+
+    def autofill(self):
+        # fill every slot left with exactly one candidate until nothing changes
+        # return the filled (team_id, match_idx, opponent_id) list, or None if some slot has no candidate
+        # candidates are computed inline here, this loop is the hot path of every search
+        index = self.index
+        slot_pot_masks = index.slot_pot_masks
+        reverse_offsets = index.reverse_offsets
+        matches_per_pot = index.matches_per_pot
+        pots = index.pots
+        countries = index.countries
+        filled = []
+        changed = True
+        while changed:
+            changed = False
+            self.autofill_rounds += 1
+            for team_id, row in enumerate(self.slots):
+                if -1 not in row:
+                    continue
+                reverse_base = pots[team_id] * matches_per_pot
+                exclude_mask = self.blocked_masks[team_id] | self.opp_masks[team_id] | self.full_country_masks[countries[team_id]]
+                for match_idx in range(len(row)):
+                    if row[match_idx] != -1:
+                        continue
+                    mask = slot_pot_masks[match_idx] & self.free_masks[reverse_base + reverse_offsets[match_idx]] & ~exclude_mask
+                    if mask == 0:
+                        return None
+                    if mask & (mask - 1) == 0:
+                        opponent_id = mask.bit_length() - 1
+                        self.assign(team_id, match_idx, opponent_id)
+                        filled.append((team_id, match_idx, opponent_id))
+                        exclude_mask = self.blocked_masks[team_id] | self.opp_masks[team_id] | self.full_country_masks[countries[team_id]]
+                        changed = True
+        return filled
+
+    def min_candidates_slot(self):
+        # open slot with the fewest candidates as (team_id, match_idx, candidates mask)
+        # the mask is 0 if some slot has no candidate, and (None, None, 0) is returned when every slot is filled
+        index = self.index
+        slot_pot_masks = index.slot_pot_masks
+        reverse_offsets = index.reverse_offsets
+        matches_per_pot = index.matches_per_pot
+        pots = index.pots
+        countries = index.countries
+        best_slot = (None, None, 0)
+        best_count = 0
+        for team_id, row in enumerate(self.slots):
+            if -1 not in row:
+                continue
+            reverse_base = pots[team_id] * matches_per_pot
+            exclude_mask = self.blocked_masks[team_id] | self.opp_masks[team_id] | self.full_country_masks[countries[team_id]]
+            for match_idx in range(len(row)):
+                if row[match_idx] != -1:
+                    continue
+                mask = slot_pot_masks[match_idx] & self.free_masks[reverse_base + reverse_offsets[match_idx]] & ~exclude_mask
+                count = mask.bit_count()
+                if count == 0:
+                    return (team_id, match_idx, 0)
+                if best_slot[0] is None or count < best_count:
+                    best_slot = (team_id, match_idx, mask)
+                    best_count = count
+        return best_slot
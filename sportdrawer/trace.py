@@ -0,0 +1,79 @@
+from collections import deque
+
+# trace levels: off records nothing, summary one event per selection, full every search step
+TRACE_LEVELS = {'off': 0, 'summary': 1, 'full': 2}
+# events kept by a trace, the oldest are dropped first
+DEFAULT_TRACE_SIZE = 5000
+
+class Trace:
+    # structured trace of the draw, events are (level, name, fields) tuples holding ids only
+    # messages are only formatted when displayed, callers check trace.full before building the fields of a step event
+
+    def __init__(self, level='summary', max_size=DEFAULT_TRACE_SIZE):
+        if level not in TRACE_LEVELS:
+            raise ValueError(f'Unknown trace level {level}, available levels: {list(TRACE_LEVELS)}')
+        self.level = level
+        self.summary = TRACE_LEVELS[level] >= TRACE_LEVELS['summary']
+        self.full = TRACE_LEVELS[level] >= TRACE_LEVELS['full']
+        self.events = deque(maxlen=max_size)
+        self.event_num = 0
+
+    def add(self, level, name, **fields):
+        if TRACE_LEVELS[level] > TRACE_LEVELS[self.level]:
+            return
+        self.events.append((level, name, fields))
+        self.event_num += 1
+
+    def clear(self):
+        self.events.clear()
+        self.event_num = 0
+
+    @property
+    def dropped_num(self):
+        return self.event_num - len(self.events)
+
+    def get_events(self, level='full'):
+        return [event for event in self.events if TRACE_LEVELS[event[0]] <= TRACE_LEVELS[level]]
+
+    def page(self, page_idx, page_size=50, level='full'):
+        events = self.get_events(level)
+        return events[page_idx * page_size:(page_idx + 1) * page_size]
+
+    def page_num(self, page_size=50, level='full'):
+        return max(1, -(-len(self.get_events(level)) // page_size))
+
+def format_event(event, teams_id_map):
+    _, name, fields = event
+
+    def team_name(team_id):
+        return teams_id_map[team_id]['name'] if team_id != -1 else 'TBD'
+
+    def team_names(team_ids):
+        return [team_name(team_id) for team_id in team_ids]
+
+    match = f"match {fields['match_idx'] + 1}" if 'match_idx' in fields else ''
+    if name == 'search':
+        return f"Generating possible states for team {team_name(fields['team_id'])} at {match}, current opponents: {team_names(fields['opponent_ids'])}"
+    if name == 'candidates':
+        return f"Available teams for {team_name(fields['team_id'])} at {match}: {team_names(fields['team_ids'])}"
+    if name == 'try':
+        return f"Trying team {team_name(fields['opponent_id'])} for {team_name(fields['team_id'])} at {match}"
+    if name == 'autofill':
+        return f"Autofill: {team_name(fields['team_id'])} vs {team_name(fields['opponent_id'])} at {match}"
+    if name == 'deadend':
+        return f"{fields['reason']} for team {team_name(fields['team_id'])} at {match}, go back"
+    if name == 'team_done':
+        return f"For team {team_name(fields['team_id'])} found possible opponents: {team_names(fields['opponent_ids'])}"
+    if name == 'book':
+        return f"Opening book: {team_name(fields['opponent_id'])} for {team_name(fields['team_id'])} at {match}, out of {team_names(fields['team_ids'])}"
+    if name == 'mrv_branch':
+        return f"MRV: branching on team {team_name(fields['team_id'])} at {match} with {fields['candidate_num']} candidates"
+    if name == 'restart':
+        return f"MRV: no solution after {fields['node_limit']} nodes, restart"
+    if name == 'solution':
+        return 'Found valid solution!'
+    if name == 'select':
+        return f"Final result for {team_name(fields['team_id'])}: {team_names(fields['opponent_ids'])}"
+    if name == 'stats':
+        return f"Search: {fields['search_stats']}, state cache: {fields['cache_stats']}"
+    return f'{name}: {fields}'
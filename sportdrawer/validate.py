@@ -0,0 +1,234 @@
+import math
+from collections import Counter
+from .engine import DrawEngine
+from .probability import FeasibilityChecker
+from .simulate import draw_seed
+from .state import DrawState
+
+# rules of a finished draw, for any format of the competition:
+# every slot holds a team of the pot of the slot, and the opponent holds the team in the reverse slot (home against away),
+# a team meets distinct teams, none of its own country and at most max_per_country of any other one
+RULES = ['filled', 'pot', 'symmetric', 'distinct', 'own_country', 'max_per_country']
+# draws validated at once by validate_draws, bounds the memory of the intermediate arrays
+CHUNK_SIZE = 100000
+# feasibility checks allowed for an exact opponent distribution
+MAX_EXACT_CHECKS = 20000
+# outcomes expected less often than this are pooled before the chi-square test
+MIN_EXPECTED = 5
+
+def draw_violations(competition, full_state):
+    # list of (rule, message) a finished full state breaks, empty for a valid draw
+    index = competition.team_index
+    team_num = index.team_num
+    violations = []
+    if len(full_state) != team_num or any(len(row) != index.slot_num for row in full_state):
+        return [('filled', f'Expected {team_num} rows of {index.slot_num} slots')]
+    for team_id, row in enumerate(full_state):
+        name = competition.teams_id_map[team_id]['name']
+        if any(not 0 <= opponent_id < team_num for opponent_id in row):
+            violations.append(('filled', f'{name} has open or unknown opponents {row}'))
+            continue
+        for match_idx, opponent_id in enumerate(row):
+            opponent_name = competition.teams_id_map[opponent_id]['name']
+            if index.pots[opponent_id] != match_idx // index.matches_per_pot:
+                violations.append(('pot', f'{name} meets {opponent_name} of pot {index.pots[opponent_id] + 1} in slot {match_idx}'))
+            reverse_slot = index.reverse_slot(team_id, match_idx)
+            if full_state[opponent_id][reverse_slot] != team_id:
+                violations.append(('symmetric', f'{name} meets {opponent_name} in slot {match_idx}, but not the other way around'))
+        if len(set(row)) != len(row):
+            violations.append(('distinct', f'{name} meets a team twice: {row}'))
+        country_counts = Counter(index.countries[opponent_id] for opponent_id in row)
+        for country, count in country_counts.items():
+            country_name = index.country_names[country]
+            if country == index.countries[team_id]:
+                violations.append(('own_country', f'{name} meets {count} teams of its own country {country_name}'))
+            elif count > index.max_per_country:
+                violations.append(('max_per_country', f'{name} meets {count} teams of {country_name}'))
+    return violations
+
+def validate_draws(competition, states, chunk_size=CHUNK_SIZE):
+    # vectorized draw_violations over an (n, team_num, slot_num) array, e.g. the states of load_draws
+    # return a bool array of shape (n,), True for a valid draw
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError('numpy is required to validate draws as arrays, use draw_violations otherwise')
+    index = competition.team_index
+    team_num, slot_num = index.team_num, index.slot_num
+    pots = np.array(index.pots)
+    countries = np.array(index.countries, dtype=np.int32)
+    slot_pots = np.arange(slot_num) // index.matches_per_pot
+    reverse_slots = np.array([[index.reverse_slot(team_id, match_idx) for match_idx in range(slot_num)] for team_id in range(team_num)])
+    team_ids = np.arange(team_num)[None, :, None]
+    valid = np.empty(len(states), dtype=bool)
+    for start in range(0, len(states), chunk_size):
+        chunk = np.asarray(states[start:start + chunk_size], dtype=np.intp)
+        draw_num = len(chunk)
+        ok = ((chunk >= 0) & (chunk < team_num)).all(axis=(1, 2))
+        opponents = np.clip(chunk, 0, team_num - 1)
+        ok &= (pots[opponents] == slot_pots).all(axis=(1, 2))
+        # the opponent of every slot holds the team in the reverse slot
+        reverse = np.take_along_axis(chunk.reshape(draw_num, -1), (opponents * slot_num + reverse_slots).reshape(draw_num, -1), axis=1)
+        ok &= (reverse.reshape(draw_num, team_num, slot_num) == team_ids).all(axis=(1, 2))
+        if slot_num > 1:
+            ok &= (np.diff(np.sort(opponents, axis=2), axis=2) != 0).all(axis=(1, 2))
+        opponent_countries = countries[opponents]
+        ok &= (opponent_countries != countries[None, :, None]).all(axis=(1, 2))
+        # once sorted, a country met more than max_per_country times fills max_per_country + 1 consecutive places
+        max_per_country = index.max_per_country
+        if slot_num > max_per_country:
+            opponent_countries.sort(axis=2)
+            ok &= (opponent_countries[:, :, max_per_country:] != opponent_countries[:, :, :-max_per_country]).all(axis=(1, 2))
+        valid[start:start + draw_num] = ok
+    return valid
+
+def opponent_distribution(engine, team_id=None, state=None, max_checks=MAX_EXACT_CHECKS):
+    # exact distribution of the opponents of team_id under the selection procedure, as {opponent ids tuple: probability}:
+    # every open slot in order takes, uniformly, one of the opponents that still leave a valid completion
+    # raise ValueError when it needs more than max_checks feasibility checks, an early state has too many outcomes
+    if team_id is None:
+        team_id = engine.cur_team['id']
+    if state is None:
+        state = engine.cur_state
+    checker = FeasibilityChecker(engine.fork(solver='mrv'))
+    draw_state = DrawState.from_compressed(engine.team_index, state)
+    if not checker.is_feasible(draw_state):
+        raise ValueError('The state has no valid completion')
+    return _outcomes(checker, draw_state, team_id, {}, max_checks)
+
+def _outcomes(checker, draw_state, team_id, memo, max_checks):
+    # the rows a state ends in are the same however it was reached, so they are memoized on the state
+    row = draw_state.slots[team_id]
+    if -1 not in row:
+        return {tuple(row): 1.0}
+    state_key = draw_state.to_compressed()
+    if state_key in memo:
+        return memo[state_key]
+    match_idx = row.index(-1)
+    trail_len = len(draw_state.trail)
+    feasible_team_ids = checker.feasible_candidates(draw_state, team_id, match_idx)
+    if checker.checks > max_checks:
+        raise ValueError(f'More than {max_checks} feasibility checks, take a later state')
+    distribution = Counter()
+    for opponent_id in feasible_team_ids:
+        draw_state.assign(team_id, match_idx, opponent_id)
+        checker.engine._autofill(draw_state)
+        for outcome, probability in _outcomes(checker, draw_state, team_id, memo, max_checks).items():
+            distribution[outcome] += probability / len(feasible_team_ids)
+        draw_state.undo(trail_len)
+    memo[state_key] = dict(distribution)
+    return memo[state_key]
+
+def selection_at(competition, drawn_num, seed=0):
+    # engine of a seeded draw stopped at the first selection with at least drawn_num teams drawn, None if the draw ends before
+    engine = DrawEngine(competition, seed=seed, solver='mrv', trace_level='off')
+    while not (engine.draw_status == 'waiting_select' and len(engine.drawn_team_ids) >= drawn_num):
+        if engine.draw_status == 'waiting_draw':
+            engine.draw_team()
+        elif engine.draw_status == 'waiting_select':
+            engine.select_opponents()
+        elif engine.draw_status == 'waiting_next_pot':
+            engine.draw_next_pot()
+        else:
+            return None
+    return engine
+
+def sample_selections(engine, sample_num, seed=0, solver=None):
+    # Counter of the opponents the selection gives the current team, over independently seeded forks of the engine
+    counts = Counter()
+    for sample_idx in range(sample_num):
+        fork = engine.fork(seed=draw_seed(seed, sample_idx), solver=solver)
+        counts[tuple(fork.select_opponents())] += 1
+    return counts
+
+def chi2_sf(statistic, df):
+    # survival function of the chi-square distribution, the regularized upper incomplete gamma Q(df / 2, statistic / 2)
+    a, x = df / 2, statistic / 2
+    if x <= 0:
+        return 1.0
+    log_prefix = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1:
+        # series of the lower function
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - total * math.exp(log_prefix))
+    # continued fraction of the upper function, modified Lentz
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return h * math.exp(log_prefix)
+
+def chi_square(counts, distribution, min_expected=MIN_EXPECTED):
+    # Pearson chi-square test of observed counts against a distribution, return (statistic, degrees of freedom, p value)
+    # outcomes expected less than min_expected times are pooled, an outcome of probability 0 gives a p value of 0
+    sample_num = sum(counts.values())
+    if any(outcome not in distribution for outcome in counts):
+        return math.inf, 0, 0.0
+    bins = sorted(((probability * sample_num, counts.get(outcome, 0)) for outcome, probability in distribution.items()), reverse=True)
+    pooled_expected, pooled_observed = 0.0, 0
+    while bins and bins[-1][0] < min_expected:
+        expected, observed = bins.pop()
+        pooled_expected += expected
+        pooled_observed += observed
+    if pooled_expected > 0:
+        if pooled_expected < min_expected and bins:
+            expected, observed = bins.pop()
+            pooled_expected += expected
+            pooled_observed += observed
+        bins.append((pooled_expected, pooled_observed))
+    if len(bins) < 2:
+        return 0.0, 0, 1.0
+    statistic = sum((observed - expected) ** 2 / expected for expected, observed in bins)
+    df = len(bins) - 1
+    return statistic, df, chi2_sf(statistic, df)
+
+def slot_marginals(outcomes, match_idx):
+    # counts or probabilities of the opponent of one slot, summed over whole rows
+    marginals = Counter()
+    for outcome, value in outcomes.items():
+        marginals[outcome[match_idx]] += value
+    return marginals
+
+def conformance_test(engine, sample_num=1000, seed=0, solver=None, max_checks=MAX_EXACT_CHECKS):
+    # test the selection of the current team, waiting to be selected, against the exact distribution of its opponents
+    # the whole rows are tested, and the opponents of every open slot, which stay informative when rows are too many to be expected often
+    distribution = opponent_distribution(engine, max_checks=max_checks)
+    counts = sample_selections(engine, sample_num, seed, solver)
+    statistic, df, p_value = chi_square(counts, distribution)
+    slot_tests = []
+    for match_idx, opponent_id in enumerate(engine.cur_full_state[engine.cur_team['id']]):
+        if opponent_id != -1:
+            continue
+        slot_statistic, slot_df, slot_p_value = chi_square(slot_marginals(counts, match_idx), slot_marginals(distribution, match_idx))
+        slot_tests.append({'match_idx': match_idx, 'statistic': slot_statistic, 'df': slot_df, 'p_value': slot_p_value})
+    return {
+        'team_id': engine.cur_team['id'],
+        'drawn': len(engine.drawn_team_ids),
+        'solver': solver if solver is not None else engine.solver,
+        'sample_num': sample_num,
+        'outcome_num': len(distribution),
+        'statistic': statistic,
+        'df': df,
+        'p_value': p_value,
+        'slots': slot_tests,
+        'outcomes': [{'opponent_ids': list(outcome), 'probability': probability, 'count': counts.get(outcome, 0)}
+                     for outcome, probability in sorted(distribution.items(), key=lambda item: -item[1])],
+    }
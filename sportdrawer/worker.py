@@ -0,0 +1,95 @@
+import threading
+import time
+from .engine import SearchInterrupted
+from .probability import opponent_probabilities
+
+# seconds a selection may search before it is given up
+DEFAULT_SELECT_TIMEOUT = 30
+# seconds the opponent probabilities may take, sampling itself stops after about a second
+DEFAULT_PROBABILITY_TIMEOUT = 10
+
+class SelectionWorker:
+    # runs engine.select_opponents on a background thread so the caller never blocks or spins while waiting
+    # status: running, done, cancelled, timeout or failed
+
+    def __init__(self, engine, timeout=DEFAULT_SELECT_TIMEOUT):
+        self.engine = engine
+        self.timeout = timeout
+        self.status = 'running'
+        self.result = None
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.result = self.engine.select_opponents(timeout=self.timeout)
+            self.status = 'done'
+        except SearchInterrupted as e:
+            self.status = e.reason
+        except Exception as e:
+            self.error = e
+            self.status = 'failed'
+        self.end_time = time.perf_counter()
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+        return self.status
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+    def progress(self):
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return {
+            'status': self.status,
+            'elapsed': end_time - self.start_time if self.start_time is not None else 0.0,
+            **self.engine.search_stats,
+        }
+
+class ProbabilityWorker:
+    # computes the opponent probabilities of the current team on a background thread, on a fork of the engine
+    # key is the (team_id, state) the result belongs to, a result for an older key is simply dropped by the caller
+    # status: running, done, timeout or failed
+
+    def __init__(self, engine, timeout=DEFAULT_PROBABILITY_TIMEOUT):
+        self.engine = engine
+        self.key = (engine.cur_team['id'], engine.cur_state)
+        self.timeout = timeout
+        self.status = 'running'
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        team_id, state = self.key
+        try:
+            self.result = opponent_probabilities(self.engine, team_id, state, timeout=self.timeout)
+            self.status = 'done'
+        except SearchInterrupted as e:
+            self.status = e.reason
+        except Exception as e:
+            self.error = e
+            self.status = 'failed'
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+        return self.status
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
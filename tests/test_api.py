@@ -0,0 +1,81 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sportdrawer import DrawEngine, load_competition
+from sportdrawer.api import create_app
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+@pytest.fixture
+def app():
+    executor = ThreadPoolExecutor(4)
+    app = create_app([TEAMS_FILE], executor=executor)
+    yield app
+    executor.shutdown()
+
+async def request(app, method, path, body=None):
+    # one http request straight to the ASGI app, return (status, json body)
+    content = json.dumps(body).encode('utf-8') if body is not None else b''
+    messages = [{'type': 'http.request', 'body': content, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'method': method, 'path': path}, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+async def run_draw(app, seed):
+    status, draw = await request(app, 'POST', '/draws', {'seed': seed})
+    assert status == 201
+    path = f"/draws/{draw['id']}"
+    while draw['status'] != 'done':
+        action = 'select' if draw['status'] == 'waiting_select' else 'draw'
+        status, draw = await request(app, 'POST', f'{path}/{action}')
+        assert status == 200, draw
+    return draw
+
+def test_full_draw_over_http(app):
+    draw = asyncio.run(run_draw(app, 1))
+    assert len(draw['drawn']) == 36
+    assert all(-1 not in row for row in draw['opponents'])
+    # the draw is the one an engine replaying its drawn teams and opponents ends in
+    engine = DrawEngine(load_competition(TEAMS_FILE), trace_level='off')
+    engine.replay(draw['drawn'], engine.convert_compressed_state(draw['opponents']))
+    assert engine.cur_full_state == draw['opponents']
+
+def test_concurrent_draws(app):
+    async def run_all():
+        return await asyncio.gather(*[run_draw(app, seed) for seed in range(4)])
+    draws = asyncio.run(run_all())
+    assert len({json.dumps(draw['opponents']) for draw in draws}) == 4
+    assert asyncio.run(request(app, 'GET', '/health')) == (200, {'draws': 4})
+
+def test_errors(app):
+    async def run():
+        assert (await request(app, 'GET', '/draws/missing'))[0] == 404
+        assert (await request(app, 'POST', '/draws', {'solver': 'bogus'}))[0] == 400
+        assert (await request(app, 'PUT', '/draws'))[0] == 405
+        _, draw = await request(app, 'POST', '/draws', {'seed': 0})
+        path = f"/draws/{draw['id']}"
+        assert (await request(app, 'POST', f'{path}/select'))[0] == 409
+        _, draw = await request(app, 'POST', f'{path}/draw')
+        assert draw['status'] == 'waiting_select' and draw['current'] == draw['drawn'][0]
+        assert (await request(app, 'POST', f'{path}/draw'))[0] == 409
+        assert (await request(app, 'DELETE', path))[0] == 200
+        assert (await request(app, 'GET', path))[0] == 404
+    asyncio.run(run())
+
+def test_idle_draws_are_evicted(app):
+    app.store.ttl = 0
+    async def run():
+        _, draw = await request(app, 'POST', '/draws')
+        return await request(app, 'GET', f"/draws/{draw['id']}")
+    assert asyncio.run(run())[0] == 404
+    app.store.ttl, app.store.max_sessions = 3600, 1
+    asyncio.run(request(app, 'POST', '/draws'))
+    assert asyncio.run(request(app, 'POST', '/draws'))[0] == 503
@@ -0,0 +1,29 @@
+import pytest
+from sportdrawer import DrawEngine, Competition, load_competition, build_book
+from sportdrawer.book import OpeningBook
+from sportdrawer.cache import StateCache
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+@pytest.fixture(scope='module')
+def book():
+    return build_book(load_competition(TEAMS_FILE), max_slots=2)
+
+def new_engine(seed, book=None):
+    return DrawEngine(load_competition(TEAMS_FILE), seed=seed, solver='mrv', trace_level='off', state_cache=StateCache(), book=book)
+
+def test_fresh_draw_takes_its_first_slots_from_the_book(book):
+    for seed in [3, 4]:
+        engine = new_engine(seed, OpeningBook.from_dict(book.to_dict()))
+        engine.draw_team()
+        engine.select_opponents()
+        assert engine.search_stats['book_slots'] == 2
+        assert engine.book.hits == 2
+        # the book makes the same choices as the search
+        plain = new_engine(seed)
+        assert engine.run_full_draw() == plain.run_full_draw()
+
+def test_book_of_another_format_is_refused(book):
+    competition = load_competition(TEAMS_FILE)
+    with pytest.raises(ValueError):
+        DrawEngine(Competition(competition.teams_data, draw_format=dict(competition.draw_format, max_per_country=3)), book=book)
@@ -0,0 +1,33 @@
+import threading
+from sportdrawer.cache import StateCache
+
+def test_lru_eviction():
+    cache = StateCache(max_size=2)
+    cache.put('a', 'x')
+    cache.put('b')
+    assert cache.get('a') == (True, 'x')
+    cache.put('c')
+    assert 'b' not in cache
+    assert cache.get('b') == (False, None)
+    assert cache.get('c') == (True, None)
+
+def test_concurrent_get_put():
+    # gets racing with evicting puts never raise
+    cache = StateCache(max_size=8)
+    errors = []
+
+    def run(offset):
+        try:
+            for i in range(20000):
+                cache.put(str((i + offset) % 16))
+                cache.get(str((i * 7 + offset) % 16))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(cache) <= 8
@@ -0,0 +1,56 @@
+import inspect
+import sys
+import pytest
+from sportdrawer import DrawEngine, Competition, load_competition
+from sportdrawer.cache import StateCache
+from sportdrawer.engine import SOLVERS
+from sportdrawer.worker import SelectionWorker
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+def new_engine(**kwargs):
+    return DrawEngine(load_competition(TEAMS_FILE), solver='mrv', trace_level='off', **kwargs)
+
+def test_failed_selection_can_be_retried():
+    engine = new_engine(seed=0)
+    engine.draw_team()
+    search = engine.gen_possible_state
+    engine.gen_possible_state = lambda *args: None
+    worker = SelectionWorker(engine).start()
+    assert worker.join() == 'failed'
+    assert engine.draw_status == 'waiting_select'
+    engine.gen_possible_state = search
+    assert engine.select_opponents() is not None
+
+def test_unkeyed_competitions_do_not_share_dead_ends():
+    teams_data = load_competition(TEAMS_FILE).teams_data
+    engine1 = DrawEngine(Competition(teams_data), trace_level='off')
+    engine2 = DrawEngine(Competition(teams_data, draw_format={'max_per_country': 1}), trace_level='off')
+    assert engine1.state_cache is not engine2.state_cache
+    assert new_engine().state_cache is new_engine().state_cache
+
+@pytest.mark.parametrize('solver', SOLVERS)
+def test_search_depth_does_not_use_the_call_stack(solver):
+    # 200 teams make searches hundreds of assignments deep, run them with little room left on the call stack
+    teams_data = [{'id': team_id, 'name': f'Team {team_id}', 'country': f'C{team_id % 40}', 'pot': team_id // 50 + 1} for team_id in range(200)]
+    engine = DrawEngine(Competition(teams_data), seed=1, solver=solver, trace_level='off')
+    engine.draw_team()
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(inspect.stack()) + 50)
+    try:
+        opponent_ids = engine.select_opponents()
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+    assert -1 not in opponent_ids
+    assert engine.search_stats['max_depth'] > 200
+
+def test_state_cache_does_not_change_the_draw():
+    # dead ends left by other draws on a shared cache only skip searches, the seeded draw stays the same
+    cache = StateCache()
+    for seed in [1, 3]:
+        new_engine(seed=seed, state_cache=cache).run_full_draw()
+    assert len(cache) > 0
+    warm = new_engine(seed=3, state_cache=cache)
+    cold = new_engine(seed=3, state_cache=StateCache())
+    assert warm.run_full_draw() == cold.run_full_draw()
+    assert warm.drawn_team_ids == cold.drawn_team_ids
@@ -0,0 +1,90 @@
+import json
+import shutil
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from sportdrawer import ingest, load_competition
+from sportdrawer.__main__ import main
+
+DATA_DIR = 'data/ucl_2023'
+ETAG = '"teams-2023"'
+
+with open(f'{DATA_DIR}/teams.json', 'r', encoding='utf-8') as f:
+    TEAMS_BODY = f.read().encode('utf-8')
+
+class StubHandler(BaseHTTPRequestHandler):
+    # football-data.org stand-in: the recorded 2023 teams with an ETag, 304 when it matches
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(TEAMS_BODY)))
+        self.end_headers()
+        self.wfile.write(TEAMS_BODY)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_url():
+    StubHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # an ingest-managed season holding only its format.json
+    season_dir = tmp_path / 'data' / 'ucl_2023'
+    season_dir.mkdir(parents=True)
+    shutil.copy(f'{DATA_DIR}/format.json', season_dir)
+    return tmp_path / 'data'
+
+def test_second_fetch_is_not_modified(stub_url, data_dir, tmp_path):
+    pytest.importorskip('requests')
+    kwargs = {'data_dir': str(data_dir), 'cache_dir': str(tmp_path / 'cache'), 'base_url': stub_url}
+    [first] = ingest.ingest([('CL', 2023)], **kwargs)
+    assert (first['fetch'], first['status'], first['team_num']) == ('fetched', 'updated', 32)
+    [second] = ingest.ingest([('CL', 2023)], **kwargs)
+    assert (second['fetch'], second['status']) == ('not_modified', 'unchanged')
+    assert [if_none_match for _, if_none_match in StubHandler.requests] == [None, ETAG]
+    teams_data = load_competition(first['teams_file']).teams_data
+    assert teams_data == load_competition(f'{DATA_DIR}/teams.json').teams_data
+
+def test_offline_reads_the_cache_only(stub_url, data_dir, tmp_path, monkeypatch, capsys):
+    pytest.importorskip('requests')
+    cache_dir = tmp_path / 'cache'
+    ingest.ingest([('CL', 2023)], data_dir=str(data_dir), cache_dir=str(cache_dir), base_url=stub_url)
+    (data_dir / 'ucl_2023' / 'teams.json').unlink()
+    monkeypatch.setattr(sys, 'argv', ['sportdrawer', 'ingest', '--season', '2023', '--data', str(data_dir),
+                                      '--cache', str(cache_dir), '--base-url', stub_url, '--offline'])
+    main()
+    assert 'CL 2023: cached, 32 teams updated' in capsys.readouterr().out
+    assert len(StubHandler.requests) == 1
+    [result] = ingest.ingest([('CL', 2023)], data_dir=str(data_dir), cache_dir=str(tmp_path / 'empty'), base_url=stub_url, offline=True)
+    assert result['status'] == 'failed' and 'not in the cache' in result['error']
+
+def test_unmanaged_teams_file_is_not_overwritten(stub_url, tmp_path):
+    season_dir = tmp_path / 'data' / 'ucl_2024'
+    shutil.copytree('data/ucl_2024', season_dir)
+    content = (season_dir / 'teams.json').read_text(encoding='utf-8')
+    [result] = ingest.ingest([('CL', 2024)], data_dir=str(tmp_path / 'data'), cache_dir=str(tmp_path / 'cache'),
+                             base_url=stub_url, session=object())
+    assert result['status'] == 'failed' and 'not managed by ingest' in result['error']
+    assert (season_dir / 'teams.json').read_text(encoding='utf-8') == content
+    assert StubHandler.requests == []
+
+def test_format_of_ingested_seasons_names_the_source():
+    with open(f'{DATA_DIR}/format.json', 'r', encoding='utf-8') as f:
+        assert json.load(f)['source'] == ingest.INGEST_SOURCE
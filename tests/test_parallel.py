@@ -0,0 +1,66 @@
+import pytest
+from sportdrawer import DrawEngine, Competition, load_competition
+from sportdrawer.cache import StateCache
+from sportdrawer.engine import SearchInterrupted
+from sportdrawer.parallel import ParallelSearch
+from sportdrawer.simulate import draw_seed
+from sportdrawer.validate import draw_violations, selection_at, conformance_test
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+@pytest.fixture(scope='module')
+def parallel():
+    with ParallelSearch(load_competition(TEAMS_FILE), workers=2) as parallel:
+        yield parallel
+
+def test_full_draw_is_valid(parallel):
+    competition = load_competition(TEAMS_FILE)
+    engine = DrawEngine(competition, seed=1, solver='mrv', trace_level='off', state_cache=StateCache(), parallel=parallel)
+    assert draw_violations(competition, engine.run_full_draw()) == []
+
+def test_selection_conforms_to_the_exact_distribution(parallel):
+    # an unkeyed copy of the competition, so the dead ends found here are not shared with other tests
+    competition = load_competition(TEAMS_FILE)
+    engine = selection_at(Competition(competition.teams_data, draw_format=competition.draw_format), 30, seed=5)
+    # the samples are forks of the engine, they all select with its parallel search
+    engine.parallel = parallel
+    result = conformance_test(engine, 300, seed=1)
+    assert result['outcome_num'] > 1
+    assert min([result['p_value']] + [slot['p_value'] for slot in result['slots']]) > 0.001
+
+def test_interrupted_selection_can_be_retried(parallel):
+    # a selection the sequential search takes seconds on, the workers are stopped on timeout and the pool stays usable
+    engine = DrawEngine(load_competition(TEAMS_FILE), seed=draw_seed(0, 38), solver='mrv', trace_level='off', state_cache=StateCache(),
+                        parallel=parallel)
+    engine.draw_team()
+    engine.select_opponents()
+    engine.draw_team()
+    with pytest.raises(SearchInterrupted):
+        engine.select_opponents(timeout=0)
+    assert engine.draw_status == 'waiting_select'
+    opponent_ids = engine.select_opponents(timeout=30)
+    assert -1 not in opponent_ids
+    assert engine.search_stats['speculative_tasks'] > 0
+
+def test_selection_without_choice(parallel):
+    engine = DrawEngine(load_competition(TEAMS_FILE), seed=3, solver='mrv', trace_level='off', state_cache=StateCache(), parallel=parallel)
+    while not engine.no_need_to_select:
+        if engine.draw_status == 'waiting_draw':
+            engine.draw_team()
+        elif engine.draw_status == 'waiting_select':
+            engine.select_opponents()
+        else:
+            engine.draw_next_pot()
+    # the drawn team has all its opponents, the search only checks the state has a completion
+    completion = parallel.search(engine, engine.cur_team, engine.cur_state, engine.drawn_team_ids, engine._slot_ranks())
+    full_state = engine.convert_full_state(completion)
+    assert all(-1 not in row for row in full_state)
+    assert full_state[engine.cur_team['id']] == engine.cur_full_state[engine.cur_team['id']]
+
+def test_other_teams_are_refused(parallel):
+    teams_data = [dict(team, name=f"{team['name']} B") for team in load_competition(TEAMS_FILE).teams_data]
+    with pytest.raises(ValueError):
+        DrawEngine(Competition(teams_data), parallel=parallel)
+    competition = load_competition(TEAMS_FILE)
+    with pytest.raises(ValueError):
+        DrawEngine(Competition(competition.teams_data, draw_format=dict(competition.draw_format, max_per_country=3)), parallel=parallel)
@@ -0,0 +1,40 @@
+import pytest
+from sportdrawer import DrawEngine, Competition, load_competition
+from sportdrawer.engine import SearchInterrupted
+from sportdrawer.worker import ProbabilityWorker
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+def new_engine(seed=0):
+    # a competition of its own, so no cached result is shared between tests
+    teams_data = load_competition(TEAMS_FILE).teams_data
+    return DrawEngine(Competition(teams_data), seed=seed, solver='mrv', trace_level='off')
+
+def test_timeout_interrupts_the_computation():
+    engine = new_engine()
+    engine.draw_team()
+    with pytest.raises(SearchInterrupted):
+        engine.opponent_probabilities(timeout=0)
+    assert engine.draw_status == 'waiting_select'
+
+def test_worker_result_is_cached_on_the_competition():
+    engine = new_engine()
+    while len(engine.drawn_team_ids) < 30:
+        if engine.draw_status == 'waiting_draw':
+            engine.draw_team()
+        elif engine.draw_status == 'waiting_select':
+            engine.select_opponents()
+        elif engine.draw_status == 'waiting_next_pot':
+            engine.draw_next_pot()
+    if engine.draw_status != 'waiting_select':
+        engine.draw_team()
+    worker = ProbabilityWorker(engine).start()
+    assert worker.join() == 'done'
+    probabilities, exact = worker.result
+    row = engine.cur_full_state[engine.cur_team['id']]
+    for opponent_id, slot in zip(row, probabilities):
+        assert sum(slot.values()) == pytest.approx(1.0)
+        if opponent_id != -1:
+            assert slot == {opponent_id: 1.0}
+    assert len(engine.competition.probability_cache) == 1
+    assert engine.opponent_probabilities() == worker.result
@@ -0,0 +1,38 @@
+import pytest
+from sportdrawer import DrawEngine, load_competition
+from sportdrawer.cache import StateCache
+from sportdrawer.engine import SearchInterrupted
+from sportdrawer.profiling import Profiler, load_metrics_log
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+def new_engine(profiler):
+    return DrawEngine(load_competition(TEAMS_FILE), seed=3, solver='mrv', trace_level='off', state_cache=StateCache(),
+                      profiler=profiler)
+
+def test_selections_are_logged(tmp_path):
+    log_file = tmp_path / 'metrics.jsonl'
+    engine = new_engine(Profiler(log_file=str(log_file), cprofile=True))
+    engine.draw_team()
+    engine.select_opponents()
+    engine.draw_team()
+    with pytest.raises(SearchInterrupted):
+        engine.select_opponents(timeout=0)
+    metrics = load_metrics_log(log_file)
+    assert [selection['status'] for selection in metrics] == ['done', 'timeout']
+    assert metrics == list(engine.profiler.metrics)
+    done = metrics[0]
+    assert done['team_id'] == engine.drawn_team_ids[0] and done['drawn'] == 1
+    assert done['nodes'] > 0 and done['max_depth'] > 0 and done['cache_lookups'] > 0
+    assert done['encode_time'] > 0 and done['autofill_time'] > 0
+    assert done['search_time'] + done['encode_time'] + done['decode_time'] + done['autofill_time'] == pytest.approx(done['elapsed'])
+    assert any('gen_possible_state' in row['function'] for row in done['profile'])
+    assert 'gen_possible_state' in engine.profiler.profile_text()
+
+def test_unprofiled_engine_has_the_same_draw():
+    profiled = new_engine(Profiler())
+    profiled.run_full_draw()
+    engine = new_engine(None)
+    engine.run_full_draw()
+    assert profiled.cur_state == engine.cur_state
+    assert profiled.profiler.summary()['selections'] == len(profiled.profiler.metrics) > 0
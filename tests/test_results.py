@@ -0,0 +1,20 @@
+import pytest
+from sportdrawer.results import DrawWriter, iter_draws_file, read_header, value_size
+
+@pytest.mark.parametrize('team_num', [36, 300, 40000])
+def test_round_trip(tmp_path, team_num):
+    path = tmp_path / 'draws.bin'
+    full_state = [[(team_id + match_idx + 1) % team_num if match_idx else -1 for match_idx in range(2)] for team_id in range(team_num)]
+    writer = DrawWriter(path, team_num, 2)
+    writer.write(7, full_state)
+    writer.close()
+    assert list(iter_draws_file(path)) == [(7, full_state)]
+    assert path.stat().st_size == 16 + 4 + team_num * 2 * value_size(team_num)
+
+def test_other_format_is_rejected(tmp_path):
+    path = tmp_path / 'draws.bin'
+    DrawWriter(path, 36, 8).close()
+    with pytest.raises(ValueError):
+        DrawWriter(path, 36, 4)
+    with open(path, 'rb') as f:
+        assert read_header(f) == (36, 8)
@@ -0,0 +1,17 @@
+from sportdrawer.simulate import iter_draws, simulate
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+def test_draws_do_not_depend_on_the_workers():
+    # every worker runs several draws on one state cache, in another order than a single process
+    single = dict(iter_draws(TEAMS_FILE, 6, seed=0, workers=1))
+    assert dict(iter_draws(TEAMS_FILE, 6, seed=0, workers=2, chunk_size=2)) == single
+    assert len(set(single.values())) == 6
+
+def test_simulate_aggregates_every_draw():
+    stats = simulate(TEAMS_FILE, 4, seed=1)
+    assert stats.draw_num == 4
+    # every team meets slot_num opponents in every draw, and meetings are symmetric
+    slot_num = stats.engine.team_index.slot_num
+    assert all(sum(row) == 4 * slot_num for row in stats.pair_counts)
+    assert all(stats.pair_counts[i][j] == stats.pair_counts[j][i] for i in range(len(stats.pair_counts)) for j in range(i))
@@ -0,0 +1,136 @@
+import json
+import sys
+import pytest
+from sportdrawer import DrawEngine, load_competition
+from sportdrawer.cache import StateCache
+from sportdrawer.__main__ import main
+from sportdrawer.snapshot import encode_snapshot, decode_snapshot
+from sportdrawer.worker import SelectionWorker
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+def new_engine(seed=None, state_cache=None):
+    return DrawEngine(load_competition(TEAMS_FILE), seed=seed, solver='mrv', trace_level='off',
+                      state_cache=state_cache if state_cache is not None else StateCache())
+
+def step(engine):
+    if engine.draw_status == 'waiting_draw':
+        engine.draw_team()
+    elif engine.draw_status == 'waiting_select':
+        engine.select_opponents()
+    elif engine.draw_status == 'waiting_next_pot':
+        engine.draw_next_pot()
+    elif engine.draw_status == 'waiting_done':
+        engine.finish_draw()
+
+def run_until(engine, drawn_num, draw_status):
+    while len(engine.drawn_team_ids) < drawn_num or engine.draw_status != draw_status:
+        step(engine)
+
+def restored(snapshot, state_cache=None):
+    engine = new_engine(state_cache=state_cache)
+    engine.restore(decode_snapshot(encode_snapshot(snapshot)))
+    return engine
+
+@pytest.mark.parametrize('drawn_num, draw_status', [(5, 'waiting_select'), (9, 'waiting_next_pot'), (12, 'waiting_draw')])
+def test_restored_draw_continues_exactly(drawn_num, draw_status):
+    engine = new_engine(seed=3)
+    run_until(engine, drawn_num, draw_status)
+    # the copy shares the dead ends the original found, as sessions of the page share the cache of their competition
+    copy = restored(engine.snapshot(), engine.state_cache)
+    for attr in ['draw_round', 'drawn_team_ids', 'cur_state', 'cur_full_state', 'cur_team', 'draw_status',
+                 'newly_sel_team_ids', 'no_need_to_select']:
+        assert getattr(copy, attr) == getattr(engine, attr), attr
+    engine.run_full_draw()
+    copy.run_full_draw()
+    assert copy.drawn_team_ids == engine.drawn_team_ids
+    assert copy.cur_state == engine.cur_state
+
+def test_restore_after_a_cancelled_selection():
+    engine = new_engine(seed=3)
+    run_until(engine, 5, 'waiting_select')
+    snapshot = engine.snapshot()
+    worker = SelectionWorker(engine).start()
+    worker.cancel()
+    worker.join()
+    # the flag of the cancelled search is still set, restoring checks the state with a search of its own
+    engine.cancel()
+    engine.restore(snapshot)
+    assert engine.draw_status == 'waiting_select'
+    assert engine.select_opponents() is not None
+
+def test_selection_without_choice_is_restored():
+    engine = new_engine(seed=3)
+    while not engine.no_need_to_select:
+        step(engine)
+    assert restored(engine.snapshot()).no_need_to_select
+
+def test_transient_statuses_are_settled():
+    engine = new_engine(seed=3)
+    run_until(engine, 4, 'waiting_draw')
+    engine.draw_status = 'selecting'
+    assert engine.snapshot()['status'] == 'waiting_select'
+    engine.draw_status = 'waiting_draw'
+    # caught in draw_team after the team is appended, before its status is set
+    engine.draw_team()
+    engine.draw_status = 'drawing'
+    snapshot = engine.snapshot()
+    assert (snapshot['status'], snapshot['round']) == ('waiting_select', 4)
+    assert restored(snapshot).draw_status == 'waiting_select'
+    # and caught before the team is appended
+    engine.draw_status = 'waiting_draw'
+    engine.drawn_team_ids.pop()
+    engine.draw_status = 'drawing'
+    assert engine.snapshot()['status'] == 'waiting_draw'
+
+def test_snapshot_of_other_teams_is_rejected():
+    engine = new_engine(seed=3)
+    run_until(engine, 3, 'waiting_draw')
+    snapshot = engine.snapshot()
+    with pytest.raises(ValueError):
+        restored(dict(snapshot, teams='0' * 12))
+    with pytest.raises(ValueError):
+        restored(dict(snapshot, drawn=snapshot['drawn'] + [99]))
+
+def test_snapshot_out_of_step_with_its_drawn_teams_is_rejected():
+    engine = new_engine(seed=3)
+    run_until(engine, 3, 'waiting_draw')
+    snapshot = engine.snapshot()
+    with pytest.raises(ValueError):
+        restored(dict(snapshot, round=1000))
+    with pytest.raises(ValueError):
+        restored(dict(snapshot, status='waiting_next_pot'))
+    with pytest.raises(ValueError):
+        restored(dict(new_engine().snapshot(), status='waiting_select'))
+    # a team of pot 2 drawn before pot 1 is complete
+    pot_2_id = next(team['id'] for team in engine.teams_data if team['pot'] == 2)
+    with pytest.raises(ValueError):
+        restored(dict(snapshot, drawn=snapshot['drawn'][:2] + [pot_2_id]))
+
+def test_replay_stops_before_the_selection_of_the_last_team():
+    engine = new_engine(seed=3)
+    engine.run_full_draw()
+    replayed = new_engine()
+    replayed.replay(engine.drawn_team_ids, engine.cur_state, upto=20)
+    assert replayed.drawn_team_ids == engine.drawn_team_ids[:20]
+    assert replayed.cur_team['id'] == engine.drawn_team_ids[19]
+    if replayed.draw_status == 'waiting_select':
+        assert -1 in replayed.cur_full_state[replayed.cur_team['id']]
+    for team_id, row in enumerate(replayed.cur_full_state):
+        assert all(idx in (-1, expected) for idx, expected in zip(row, engine.cur_full_state[team_id]))
+    replayed.replay(engine.drawn_team_ids, engine.cur_state)
+    assert replayed.draw_status == 'waiting_done'
+    assert replayed.cur_state == engine.cur_state
+
+def test_replay_cli(tmp_path, monkeypatch, capsys):
+    engine = new_engine(seed=3)
+    run_until(engine, 10, 'waiting_select')
+    snapshot_file = tmp_path / 'draw.json'
+    snapshot_file.write_text(json.dumps(engine.snapshot()), encoding='utf-8')
+    output = tmp_path / 'finished.json'
+    monkeypatch.setattr(sys, 'argv', ['sportdrawer', 'replay', str(snapshot_file), '--upto', '6', '--finish',
+                                      '--teams', TEAMS_FILE, '--output', str(output)])
+    main()
+    assert '36 of 36 teams drawn, done' in capsys.readouterr().out
+    finished = json.loads(output.read_text(encoding='utf-8'))
+    assert finished['drawn'][:5] == engine.drawn_team_ids[:5]
@@ -0,0 +1,83 @@
+import pytest
+from sportdrawer import DrawEngine, Competition, load_competition
+from sportdrawer.cache import StateCache
+from sportdrawer.validate import draw_violations, validate_draws, opponent_distribution, conformance_test, selection_at, chi2_sf
+
+TEAMS_FILE = 'data/ucl_2024/teams.json'
+
+def full_draw(competition, seed):
+    engine = DrawEngine(competition, seed=seed, solver='mrv', trace_level='off', state_cache=StateCache())
+    return engine.run_full_draw()
+
+def swap_opponents(full_state):
+    # the home and away opponents of team 0 from the last pot swap venues on its side only
+    broken = [row.copy() for row in full_state]
+    broken[0][-2], broken[0][-1] = broken[0][-1], broken[0][-2]
+    return broken
+
+@pytest.mark.parametrize('pot_num, draw_format', [(4, {}), (6, {'matches_per_pot': 1})])
+def test_full_draws_are_valid(pot_num, draw_format):
+    teams_data = [dict(team, pot=team['id'] * pot_num // 36 + 1) for team in load_competition(TEAMS_FILE).teams_data]
+    competition = Competition(teams_data, draw_format=draw_format)
+    for seed in range(3):
+        assert draw_violations(competition, full_draw(competition, seed)) == []
+
+def test_broken_draws_are_reported():
+    competition = load_competition(TEAMS_FILE)
+    full_state = full_draw(competition, 0)
+    rules = {rule for rule, _ in draw_violations(competition, swap_opponents(full_state))}
+    assert 'symmetric' in rules
+    open_state = [row.copy() for row in full_state]
+    open_state[5][3] = -1
+    assert 'filled' in {rule for rule, _ in draw_violations(competition, open_state)}
+    # a team of the own country in place of an opponent of the same pot
+    own_country = [row.copy() for row in full_state]
+    teams_data = competition.teams_data
+    team_id = next(team['id'] for team in teams_data if any(other['country'] == team['country'] and other['pot'] == 1 and other['id'] != team['id'] for other in teams_data))
+    own_country[team_id][0] = next(other['id'] for other in teams_data if other['country'] == teams_data[team_id]['country'] and other['pot'] == 1 and other['id'] != team_id)
+    assert 'own_country' in {rule for rule, _ in draw_violations(competition, own_country)}
+
+def test_vectorized_validation_agrees():
+    np = pytest.importorskip('numpy')
+    competition = load_competition(TEAMS_FILE)
+    full_states = [full_draw(competition, seed) for seed in range(3)]
+    full_states.append(swap_opponents(full_states[0]))
+    full_states.append([row[:2] + row[4:] + row[2:4] for row in full_states[1]])
+    states = np.array(full_states, dtype=np.int16)
+    expected = [not draw_violations(competition, full_state) for full_state in full_states]
+    assert validate_draws(competition, states, chunk_size=2).tolist() == expected == [True, True, True, False, False]
+
+def test_chi2_sf():
+    assert chi2_sf(3.841458820694124, 1) == pytest.approx(0.05)
+    assert chi2_sf(18.307038053275146, 10) == pytest.approx(0.05)
+    assert chi2_sf(124.342, 100) == pytest.approx(0.05, abs=1e-4)
+
+def test_selection_conforms_to_the_exact_distribution():
+    engine = selection_at(load_competition(TEAMS_FILE), 30, seed=5)
+    distribution = opponent_distribution(engine)
+    assert len(distribution) > 5
+    assert sum(distribution.values()) == pytest.approx(1)
+    for solver in ['mrv', 'dfs']:
+        result = conformance_test(engine, 300, seed=1, solver=solver)
+        assert result['df'] > 0
+        assert min([result['p_value']] + [slot['p_value'] for slot in result['slots']]) > 0.001
+
+def test_biased_selection_is_rejected():
+    engine = selection_at(load_competition(TEAMS_FILE), 30, seed=5)
+    # without random ranks, the search always returns the lowest feasible ids
+    forked = engine.fork
+    engine.fork = lambda seed=None, solver=None, **kwargs: _unranked(forked(seed=seed, solver=solver, **kwargs))
+    assert conformance_test(engine, 300, seed=1)['p_value'] < 0.001
+
+def _unranked(engine):
+    team_num, slot_num = len(engine.teams_data), engine.team_index.slot_num
+    engine._slot_ranks = lambda: [list(range(team_num))] * slot_num
+    return engine
+
+def test_country_limit_is_checked_by_both_validators():
+    np = pytest.importorskip('numpy')
+    competition = load_competition(TEAMS_FILE)
+    full_state = full_draw(competition, 0)
+    strict = Competition(competition.teams_data, draw_format={'max_per_country': 1})
+    assert {rule for rule, _ in draw_violations(strict, full_state)} == {'max_per_country'}
+    assert validate_draws(strict, np.array([full_state])).tolist() == [False]